@@ -0,0 +1,164 @@
+"""In-process fake of the Tuya Pulsar message queue for benchmarks.
+
+Serves the consumer websocket of the push client, checks its credentials
+and sends status reports and online events encrypted the way the Tuya Cloud
+does, with AES-GCM or, like for older projects, AES-ECB. Sent messages are
+kept until they are acknowledged, so the time from publishing to the
+acknowledgement can be measured, and are sent again to a consumer that
+reconnects.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+from aiohttp import WSMsgType, web
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Message protocols of status reports and device events
+PROTOCOL_STATUS = 4
+PROTOCOL_EVENT = 20
+
+ENCRYPTIONS = ("aes_gcm", "aes_ecb")
+
+
+class FakePulsarBroker:
+    """A Pulsar websocket endpoint for one access ID."""
+
+    def __init__(self, access_id, access_secret, env="event", encryption="aes_gcm"):
+        """Initialize the broker for the credentials of the integration."""
+        if encryption not in ENCRYPTIONS:
+            raise ValueError(f"Unsupported encryption {encryption}")
+        self.access_id = access_id
+        self.env = env
+        self.encryption = encryption
+        self.calls = Counter()
+        self.ack_latencies = []
+        self._key = access_secret[8:24].encode("utf8")
+        secret_md5 = hashlib.md5(access_secret.encode("utf8")).hexdigest()
+        self._password = hashlib.md5((access_id + secret_md5).encode("utf8")).hexdigest()[8:24]
+        self._sequence = 0
+        self._unacked = {}
+        self._consumers = set()
+        self._connected = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._runner = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the endpoint to configure as push_endpoint."""
+        app = web.Application()
+        app.router.add_get(
+            "/ws/v2/consumer/persistent/{access_id}/out/{env}/{subscription}", self._consume
+        )
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"ws://{host}:{port}/"
+
+    async def stop(self):
+        """Close the consumers and stop serving."""
+        for ws in list(self._consumers):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def wait_connected(self, timeout=10):
+        """Wait until a consumer is subscribed."""
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def wait_acked(self, timeout=30):
+        """Wait until every sent message is acknowledged."""
+        await asyncio.wait_for(self._drained.wait(), timeout)
+
+    async def publish_status(self, device_id, status):
+        """Send a status report of a device, a list of codes and values."""
+        await self._publish(
+            PROTOCOL_STATUS,
+            {"devId": device_id, "dataId": os.urandom(8).hex(), "status": status},
+        )
+
+    async def publish_online(self, device_id, online):
+        """Send an online or offline event of a device."""
+        await self._publish(
+            PROTOCOL_EVENT,
+            {"devId": device_id, "bizCode": "online" if online else "offline", "bizData": {}},
+        )
+
+    async def _publish(self, protocol, data):
+        """Encrypt a message and send it to the consumers."""
+        self._sequence += 1
+        message_id = f"{self._sequence}:0:-1:0"
+        plaintext = json.dumps(data).encode("utf8")
+        if self.encryption == "aes_gcm":
+            nonce = os.urandom(12)
+            encrypted = nonce + AESGCM(self._key).encrypt(nonce, plaintext, None)
+        else:
+            padding = 16 - len(plaintext) % 16
+            encryptor = Cipher(algorithms.AES(self._key), modes.ECB()).encryptor()
+            plaintext += bytes([padding]) * padding
+            encrypted = encryptor.update(plaintext) + encryptor.finalize()
+        payload = {
+            "protocol": protocol,
+            "pv": "2.0",
+            "sign": "",
+            "t": int(time.time() * 1000),
+            "data": base64.b64encode(encrypted).decode("ascii"),
+        }
+        message = {
+            "messageId": message_id,
+            "payload": base64.b64encode(json.dumps(payload).encode("utf8")).decode("ascii"),
+            "properties": {"em": self.encryption},
+            "publishTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        }
+
+        self.calls["published"] += 1
+        self._unacked[message_id] = (time.perf_counter(), message)
+        self._drained.clear()
+        for ws in list(self._consumers):
+            await ws.send_json(message)
+
+    async def _consume(self, request):
+        """Serve one consumer websocket."""
+        if (
+            request.match_info["access_id"] != self.access_id
+            or request.match_info["env"] != self.env
+            or request.headers.get("username") != self.access_id
+            or request.headers.get("password") != self._password
+        ):
+            self.calls["rejected"] += 1
+            raise web.HTTPUnauthorized()
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.calls["connected"] += 1
+        self._consumers.add(ws)
+        self._connected.set()
+        for _sent, message in list(self._unacked.values()):
+            await ws.send_json(message)
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                message_id = json.loads(msg.data).get("messageId")
+                unacked = self._unacked.pop(message_id, None)
+                if unacked is None:
+                    continue
+                self.calls["acked"] += 1
+                self.ack_latencies.append(time.perf_counter() - unacked[0])
+                if not self._unacked:
+                    self._drained.set()
+        finally:
+            self._consumers.discard(ws)
+            if not self._consumers:
+                self._connected.clear()
+        return ws
@@ -0,0 +1,200 @@
+"""In-process fake of the Tuya Cloud OpenAPI for benchmarks.
+
+Serves a synthetic fleet of devices, each reporting the same codes, with
+a configurable response latency and error rate. Requests are not checked
+for valid signatures.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Codes with a predefined sensor type, followed by generic ones
+KNOWN_CODES = [
+    "temp_current",
+    "humidity_value",
+    "cur_power",
+    "cur_voltage",
+    "cur_current",
+    "add_ele",
+    "battery_percentage",
+    "co2_value",
+    "pm25_value",
+]
+
+
+class FakeTuyaCloud:
+    """A fleet of devices times codes behind a local OpenAPI server."""
+
+    def __init__(
+        self,
+        devices,
+        codes,
+        products=1,
+        latency=0.0,
+        error_rate=0.0,
+        change_rate=0.1,
+        seed=0,
+    ):
+        """Initialize the fleet, latency in seconds and rates as fractions."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.change_rate = change_rate
+        self.calls = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._runner = None
+
+        self.codes = (KNOWN_CODES + [f"metric_{i}" for i in range(codes)])[:codes]
+        self.devices = [
+            {
+                "id": f"bench{index:06d}",
+                "name": f"Bench device {index}",
+                "product_id": f"benchproduct{index % max(products, 1)}",
+                "category": "wsdcg",
+                "online": True,
+            }
+            for index in range(devices)
+        ]
+        self.values = {
+            device["id"]: {code: self._random.randint(0, 1000) for code in self.codes}
+            for device in self.devices
+        }
+        self._by_id = {device["id"]: device for device in self.devices}
+
+    def advance(self):
+        """Change a random share of all values and return the changes by device."""
+        changes = {}
+        for device_id, values in self.values.items():
+            for code in values:
+                if self._random.random() < self.change_rate:
+                    values[code] = self._random.randint(0, 1000)
+                    changes.setdefault(device_id, []).append(
+                        {"code": code, "value": values[code]}
+                    )
+        return changes
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the base URL."""
+        app = web.Application()
+        app.router.add_get("/v1.0/token", self._token)
+        app.router.add_get("/v1.0/token/{refresh_token}", self._token)
+        app.router.add_get("/v1.0/devices", self._device_list)
+        app.router.add_get("/v1.0/iot-01/associated-users/devices", self._device_pages)
+        app.router.add_get("/v1.0/iot-03/devices/status", self._batch_status)
+        app.router.add_get("/v1.0/devices/{device_id}", self._device_info)
+        app.router.add_get("/v1.0/devices/{device_id}/status", self._device_status)
+        app.router.add_get("/v1.0/devices/{device_id}/specifications", self._specifications)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _respond(self, name, result):
+        """Count a call, wait for the latency and answer or fail."""
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response(
+                {"success": False, "code": 500, "msg": "fake error", "t": _now()}
+            )
+        return web.json_response({"success": True, "result": result, "t": _now()})
+
+    def _status(self, device_id):
+        """Return the status list of a device."""
+        return [
+            {"code": code, "value": value}
+            for code, value in self.values[device_id].items()
+        ]
+
+    async def _token(self, request):
+        return await self._respond(
+            "token",
+            {
+                "access_token": "bench_access",
+                "refresh_token": "bench_refresh",
+                "expire_time": 7200,
+                "uid": "bench_uid",
+            },
+        )
+
+    async def _device_list(self, request):
+        return await self._respond("device_list", self.devices)
+
+    async def _device_pages(self, request):
+        size = int(request.query.get("size", 100))
+        start = int(request.query.get("last_row_key") or 0)
+        # Entries carry the current status, like the real device list
+        page = [
+            dict(device, status=self._status(device["id"]))
+            for device in self.devices[start:start + size]
+        ]
+        has_more = start + size < len(self.devices)
+        return await self._respond(
+            "device_pages",
+            {
+                "devices": page,
+                "has_more": has_more,
+                "last_row_key": str(start + size) if has_more else "",
+                "total": len(self.devices),
+            },
+        )
+
+    async def _batch_status(self, request):
+        device_ids = request.query.get("device_ids", "").split(",")
+        return await self._respond(
+            "batch_status",
+            [
+                {"id": device_id, "status": self._status(device_id)}
+                for device_id in device_ids
+                if device_id in self.values
+            ],
+        )
+
+    async def _device_info(self, request):
+        device = self._by_id.get(request.match_info["device_id"])
+        if device is None:
+            return await self._respond("device_info", None)
+        return await self._respond("device_info", dict(device, status=self._status(device["id"])))
+
+    async def _device_status(self, request):
+        device_id = request.match_info["device_id"]
+        return await self._respond("device_status", self._status(device_id))
+
+    async def _specifications(self, request):
+        return await self._respond(
+            "specifications",
+            {
+                "category": "wsdcg",
+                "functions": [],
+                "status": [
+                    {
+                        "code": code,
+                        "type": "Integer",
+                        "values": json.dumps(
+                            {"unit": "", "min": 0, "max": 1000, "scale": 0, "step": 1}
+                        ),
+                    }
+                    for code in self.codes
+                ],
+            },
+        )
+
+
+def _now():
+    """Return the current time in milliseconds, as Tuya does."""
+    return int(time.time() * 1000)
@@ -0,0 +1,236 @@
+"""In-process fake of a Tuya device speaking the local protocol 3.3 or 3.4.
+
+Serves one device on a TCP port: it checks the framing, CRC or HMAC of
+every frame it receives, negotiates the protocol 3.4 session key, answers
+status queries and heartbeats and can send status reports on its own.
+Frames that fail a check close the connection, as real devices do.
+"""
+import asyncio
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import struct
+import time
+from collections import Counter
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+PREFIX = 0x000055AA
+SUFFIX = 0x0000AA55
+HEADER = struct.Struct(">4I")
+SUFFIX_BYTES = struct.pack(">I", SUFFIX)
+RETURN_CODE = struct.pack(">I", 0)
+
+# Commands
+SESS_KEY_NEG_START = 3
+SESS_KEY_NEG_RESP = 4
+SESS_KEY_NEG_FINISH = 5
+STATUS = 8
+HEART_BEAT = 9
+DP_QUERY = 10
+DP_QUERY_NEW = 16
+
+
+class FrameError(Exception):
+    """Raised when a received frame fails a check."""
+
+
+def _encrypt(key, data, pad=True):
+    """Encrypt with AES-128-ECB, PKCS#7 padded unless pad is False."""
+    if pad:
+        padding = 16 - len(data) % 16
+        data += bytes([padding]) * padding
+    encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+    return encryptor.update(data) + encryptor.finalize()
+
+
+def _decrypt(key, data):
+    """Decrypt AES-128-ECB and check and strip the PKCS#7 padding."""
+    if not data or len(data) % 16:
+        raise FrameError("Payload is not a whole number of blocks")
+    decryptor = Cipher(algorithms.AES(key), modes.ECB()).decryptor()
+    data = decryptor.update(data) + decryptor.finalize()
+    padding = data[-1]
+    if not 0 < padding <= 16 or data[-padding:] != bytes([padding]) * padding:
+        raise FrameError("Invalid padding, wrong key")
+    return data[:-padding]
+
+
+class _Connection:
+    """State of one client connection."""
+
+    def __init__(self, writer, key):
+        """Initialize the connection with the local key."""
+        self.task = asyncio.current_task()
+        self.writer = writer
+        self.key = key
+        self.seqno = 0
+        self.local_nonce = None
+        self.remote_nonce = None
+        self.negotiated = False
+
+
+class FakeTuyaDevice:
+    """One device behind a local TCP server.
+
+    dps is called for the current data points, a dict of data point IDs
+    to values, whenever the device is queried.
+    """
+
+    def __init__(self, device_id, local_key, dps, version="3.3"):
+        """Initialize the device."""
+        if version not in ("3.3", "3.4"):
+            raise ValueError(f"Unsupported protocol version {version}")
+        self.device_id = device_id
+        self.local_key = local_key
+        self.version = version
+        self.calls = Counter()
+        self.last_error = None
+        self._dps = dps
+        self._key = local_key.encode("latin1")
+        self._check_size = 32 if version == "3.4" else 4
+        self._connections = set()
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the port."""
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Close the connections and stop serving."""
+        connections = list(self._connections)
+        for connection in connections:
+            connection.writer.close()
+        await asyncio.gather(
+            *(connection.task for connection in connections), return_exceptions=True
+        )
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def push_status(self, dps):
+        """Send a status report of some data points to every ready connection."""
+        payload = json.dumps(
+            {"devId": self.device_id, "dps": dps, "t": int(time.time())}
+        ).encode("utf8")
+        header = self.version.encode("ascii") + bytes(12)
+        for connection in list(self._connections):
+            if self.version == "3.4" and not connection.negotiated:
+                continue
+            if self.version == "3.4":
+                # Protocol 3.4 encrypts the version header with the payload
+                data = RETURN_CODE + _encrypt(connection.key, header + payload)
+            else:
+                data = RETURN_CODE + header + _encrypt(connection.key, payload)
+            self._send(connection, STATUS, data)
+            await connection.writer.drain()
+        self.calls["status_reports"] += 1
+
+    async def _serve(self, reader, writer):
+        """Handle the frames of one connection until it closes or fails."""
+        connection = _Connection(writer, self._key)
+        self._connections.add(connection)
+        self.calls["connections"] += 1
+        try:
+            while True:
+                seqno, command, payload = await self._read_frame(reader, connection)
+                self._handle(connection, seqno, command, payload)
+                await writer.drain()
+        except FrameError as e:
+            self.calls["rejected_frames"] += 1
+            self.last_error = str(e)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def _read_frame(self, reader, connection):
+        """Read, check and decrypt one frame."""
+        header = await reader.readexactly(HEADER.size)
+        prefix, seqno, command, length = HEADER.unpack(header)
+        if prefix != PREFIX:
+            raise FrameError("Invalid prefix")
+        if length < self._check_size + 4:
+            raise FrameError("Frame too short")
+
+        body = await reader.readexactly(length)
+        if body[-4:] != SUFFIX_BYTES:
+            raise FrameError("Invalid suffix")
+
+        payload = body[:-(self._check_size + 4)]
+        check = body[-(self._check_size + 4):-4]
+        if self.version == "3.4":
+            expected = hmac.new(connection.key, header + payload, hashlib.sha256).digest()
+        else:
+            expected = struct.pack(">I", binascii.crc32(header + payload) & 0xFFFFFFFF)
+        if not hmac.compare_digest(check, expected):
+            raise FrameError("Invalid HMAC" if self.version == "3.4" else "Invalid CRC")
+
+        return seqno, command, _decrypt(connection.key, payload)
+
+    def _handle(self, connection, seqno, command, payload):
+        """Answer a decrypted command."""
+        self.calls[f"command {command}"] += 1
+
+        if command == SESS_KEY_NEG_START and self.version == "3.4":
+            connection.local_nonce = payload[:16]
+            connection.remote_nonce = os.urandom(16)
+            self._reply(
+                connection,
+                seqno,
+                SESS_KEY_NEG_RESP,
+                connection.remote_nonce
+                + hmac.new(self._key, connection.local_nonce, hashlib.sha256).digest(),
+            )
+            return
+
+        if command == SESS_KEY_NEG_FINISH and self.version == "3.4":
+            if connection.remote_nonce is None:
+                raise FrameError("Session key negotiation not started")
+            expected = hmac.new(self._key, connection.remote_nonce, hashlib.sha256).digest()
+            if not hmac.compare_digest(payload, expected):
+                raise FrameError("Invalid session key negotiation")
+            mixed = bytes(a ^ b for a, b in zip(connection.local_nonce, connection.remote_nonce))
+            connection.key = _encrypt(self._key, mixed, pad=False)
+            connection.negotiated = True
+            self.calls["handshakes"] += 1
+            return
+
+        if self.version == "3.4" and not connection.negotiated:
+            raise FrameError("Command before session key negotiation")
+
+        if command == HEART_BEAT:
+            self._reply(connection, seqno, HEART_BEAT, b"")
+        elif command == (DP_QUERY_NEW if self.version == "3.4" else DP_QUERY):
+            self.calls["queries"] += 1
+            self._reply(
+                connection,
+                seqno,
+                command,
+                json.dumps(
+                    {"devId": self.device_id, "dps": self._dps(), "t": int(time.time())}
+                ).encode("utf8"),
+            )
+        else:
+            raise FrameError(f"Unexpected command {command}")
+
+    def _reply(self, connection, seqno, command, payload):
+        """Encrypt and send the response to a frame."""
+        self._send(connection, command, RETURN_CODE + _encrypt(connection.key, payload), seqno)
+
+    def _send(self, connection, command, data, seqno=None):
+        """Frame and send data, a return code followed by the payload."""
+        if seqno is None:
+            connection.seqno += 1
+            seqno = connection.seqno
+        frame = HEADER.pack(PREFIX, seqno, command, len(data) + self._check_size + 4) + data
+        if self.version == "3.4":
+            frame += hmac.new(connection.key, frame, hashlib.sha256).digest()
+        else:
+            frame += struct.pack(">I", binascii.crc32(frame) & 0xFFFFFFFF)
+        connection.writer.write(frame + SUFFIX_BYTES)
@@ -0,0 +1,322 @@
+"""Benchmark setup and polling of the integration against a fake Tuya cloud.
+
+Usage:
+    python benchmarks/run.py --devices 200 --codes 8 --polls 20 --output results.json
+    python benchmarks/run.py --replay capture.jsonl.gz --replay-speed 0 --polls 20
+    python benchmarks/run.py --devices 200 --push --polls 20
+    python benchmarks/run.py --devices 50 --local-devices 10 --local-version 3.4
+
+Requires Home Assistant to be installed. The integration is loaded from
+this repository's custom_components directory into a throwaway Home
+Assistant instance with a temporary configuration directory.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from homeassistant import bootstrap, config_entries, loader  # noqa: E402
+from homeassistant.const import (  # noqa: E402
+    EVENT_STATE_CHANGED,
+    EVENT_STATE_REPORTED,
+    __version__ as HA_VERSION,
+)
+from homeassistant.components import network  # noqa: E402
+from homeassistant.core import HomeAssistant, callback  # noqa: E402
+from homeassistant.setup import async_setup_component  # noqa: E402
+
+from custom_components.tuya_sensors import DOMAIN  # noqa: E402
+from custom_components.tuya_sensors.capture import open_capture  # noqa: E402
+from custom_components.tuya_sensors.coordinator import TuyaAccountCoordinator  # noqa: E402
+from fake_broker import FakePulsarBroker  # noqa: E402
+from fake_cloud import FakeTuyaCloud  # noqa: E402
+from fake_device import FakeTuyaDevice  # noqa: E402
+
+# Credentials of the benchmark account, the secret is long enough for the
+# message queue key
+API_KEY = "bench_key"
+API_SECRET = "bench_secret_0123456789abcdef"
+
+DEVICE_PATH = re.compile(r"^/v1\.0/devices/([^/]+)$")
+
+
+def percentiles(values):
+    """Return the usual percentiles of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(fraction):
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+    return {
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+    }
+
+
+def capture_device_ids(path):
+    """Return the IDs of the devices whose details were recorded in a capture."""
+    device_ids = []
+    with open_capture(path, "r") as file:
+        for line in file:
+            try:
+                match = DEVICE_PATH.match(json.loads(line)["p"])
+            except (ValueError, KeyError):
+                continue
+            if match and match.group(1) not in device_ids:
+                device_ids.append(match.group(1))
+    return device_ids
+
+
+async def run_benchmark(args):
+    """Set the integration up against the fake cloud or a capture, poll and return the results."""
+    if args.replay:
+        cloud = None
+        device_ids = [] if args.account else capture_device_ids(args.replay)
+        source = {"replay_file": os.path.abspath(args.replay), "replay_speed": args.replay_speed}
+    else:
+        cloud = FakeTuyaCloud(
+            args.devices,
+            args.codes,
+            products=args.products,
+            latency=args.latency / 1000,
+            error_rate=args.error_rate,
+            change_rate=args.change_rate,
+            seed=args.seed,
+        )
+        device_ids = [] if args.account else [device["id"] for device in cloud.devices]
+        source = {"api_endpoint": await cloud.start()}
+
+    broker = None
+    if args.push:
+        broker = FakePulsarBroker(API_KEY, API_SECRET)
+        source.update(push=True, push_endpoint=await broker.start())
+
+    # Serve the first devices of the fleet over the local protocol, with
+    # data point IDs numbered after the codes
+    local_devices = []
+    if args.local_devices:
+        dps = {str(index + 1): code for index, code in enumerate(cloud.codes)}
+        source["local_devices"] = []
+        for index, device in enumerate(cloud.devices[:args.local_devices]):
+            values = cloud.values[device["id"]]
+            local_device = FakeTuyaDevice(
+                device["id"],
+                f"benchkey{index:08d}",
+                lambda values=values: {dp_id: values[code] for dp_id, code in dps.items()},
+                args.local_version,
+            )
+            local_devices.append(local_device)
+            source["local_devices"].append(
+                {
+                    "device_id": device["id"],
+                    "host": "127.0.0.1",
+                    "port": await local_device.start(),
+                    "local_key": local_device.local_key,
+                    "protocol_version": args.local_version,
+                    "dps": dps,
+                }
+            )
+
+    # Catch the account coordinator so polls can be triggered directly
+    coordinators = []
+    original_init = TuyaAccountCoordinator.__init__
+
+    def init(self, *init_args, **init_kwargs):
+        original_init(self, *init_args, **init_kwargs)
+        coordinators.append(self)
+
+    TuyaAccountCoordinator.__init__ = init
+
+    def api_calls():
+        """Return the requests sent so far, by endpoint."""
+        if cloud is not None:
+            return dict(cloud.calls)
+        if not coordinators:
+            return {}
+        metrics = coordinators[-1].tuya_api.scheduler.as_dict()["requests"]["endpoints"]
+        return {endpoint: sum(stats["outcomes"].values()) for endpoint, stats in metrics.items()}
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        # Load config entries, registries and translations like a real start
+        hass = HomeAssistant(config_dir)
+        hass.config.skip_pip = True
+        hass.config_entries = config_entries.ConfigEntries(hass, {})
+        loader.async_setup(hass)
+        await bootstrap.async_load_base_functionality(hass)
+        # The shared client session resolves names through zeroconf, which
+        # needs the network adapters
+        await network.async_get_adapters(hass)
+
+        writes = 0
+
+        @callback
+        def count_write(_event):
+            nonlocal writes
+            writes += 1
+
+        @callback
+        def every_entity(_event_data):
+            # State reports are only delivered to filtered listeners
+            return True
+
+        hass.bus.async_listen(EVENT_STATE_CHANGED, count_write)
+        hass.bus.async_listen(EVENT_STATE_REPORTED, count_write, event_filter=every_entity)
+
+        config = {
+            DOMAIN: {
+                "api_key": API_KEY,
+                "api_secret": API_SECRET,
+                "device_ids": device_ids,
+                **source,
+                "requests_per_second": args.requests_per_second,
+                "max_concurrent_requests": args.max_concurrent_requests,
+                "discovery_concurrency": args.discovery_concurrency,
+            }
+        }
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        assert await async_setup_component(hass, DOMAIN, config)
+        await hass.async_block_till_done()
+        setup = {
+            "wall_time_s": time.perf_counter() - started,
+            "cpu_time_s": time.process_time() - cpu_started,
+            "api_calls": api_calls(),
+            "api_calls_total": sum(api_calls().values()),
+            "entities": len(hass.states.async_entity_ids("sensor")),
+            "state_writes": writes,
+        }
+
+        polls = {"latency_ms": [], "cpu_ms": [], "state_writes": [], "api_calls": []}
+        account = coordinators[-1] if coordinators else None
+        for _ in range(args.polls if account is not None else 0):
+            if cloud is not None:
+                cloud.advance()
+            if account.planner is not None:
+                account.planner.expedite()
+            writes = 0
+            calls = sum(api_calls().values())
+
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            await account.async_refresh()
+            await hass.async_block_till_done()
+
+            polls["latency_ms"].append((time.perf_counter() - started) * 1000)
+            polls["cpu_ms"].append((time.process_time() - cpu_started) * 1000)
+            polls["state_writes"].append(writes)
+            polls["api_calls"].append(sum(api_calls().values()) - calls)
+
+        pushes = {"latency_ms": [], "cpu_ms": [], "state_writes": [], "messages": []}
+        if broker is not None:
+            await broker.wait_connected()
+        for _ in range(args.polls if broker is not None else 0):
+            changes = cloud.advance()
+            writes = 0
+
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            for device_id, status in changes.items():
+                await broker.publish_status(device_id, status)
+            await broker.wait_acked()
+            await hass.async_block_till_done()
+
+            pushes["latency_ms"].append((time.perf_counter() - started) * 1000)
+            pushes["cpu_ms"].append((time.process_time() - cpu_started) * 1000)
+            pushes["state_writes"].append(writes)
+            pushes["messages"].append(len(changes))
+
+        await hass.async_stop(force=True)
+
+    TuyaAccountCoordinator.__init__ = original_init
+    local_calls = sum((local_device.calls for local_device in local_devices), Counter())
+    for local_device in local_devices:
+        await local_device.stop()
+    if broker is not None:
+        await broker.stop()
+    if cloud is not None:
+        await cloud.stop()
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "home_assistant": HA_VERSION,
+        "config": vars(args),
+        "setup": setup,
+        "polls": {
+            "count": len(polls["latency_ms"]),
+            "latency_ms": percentiles(polls["latency_ms"]),
+            "cpu_ms": percentiles(polls["cpu_ms"]),
+            "state_writes": percentiles(polls["state_writes"]),
+            "api_calls": percentiles(polls["api_calls"]),
+        },
+        "push": {
+            "count": len(pushes["latency_ms"]),
+            "latency_ms": percentiles(pushes["latency_ms"]),
+            "cpu_ms": percentiles(pushes["cpu_ms"]),
+            "state_writes": percentiles(pushes["state_writes"]),
+            "messages": percentiles(pushes["messages"]),
+            "ack_latency_ms": percentiles([latency * 1000 for latency in broker.ack_latencies]),
+        } if broker is not None else None,
+        "local": {
+            "devices": len(local_devices),
+            "calls": dict(local_calls),
+            "errors": sorted(
+                {local_device.last_error for local_device in local_devices if local_device.last_error}
+            ),
+        } if local_devices else None,
+        "errors_injected": cloud.errors if cloud is not None else None,
+    }
+
+
+def main():
+    """Parse the arguments, run the benchmark and save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100, help="number of devices")
+    parser.add_argument("--codes", type=int, default=8, help="status codes per device")
+    parser.add_argument("--products", type=int, default=1, help="distinct products in the fleet")
+    parser.add_argument("--polls", type=int, default=10, help="polls to measure after setup")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of failed responses")
+    parser.add_argument("--change-rate", type=float, default=0.1, help="share of values changing per poll")
+    parser.add_argument("--account", action="store_true", help="discover the whole account instead of device IDs")
+    parser.add_argument("--requests-per-second", type=float, default=1000.0)
+    parser.add_argument("--max-concurrent-requests", type=int, default=50)
+    parser.add_argument("--discovery-concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="capture file to replay instead of the fake cloud")
+    parser.add_argument("--replay-speed", type=float, default=0.0, help="replay speed, 0 for no delays")
+    parser.add_argument("--push", action="store_true", help="also measure push updates from a fake message queue")
+    parser.add_argument("--local-devices", type=int, default=0, help="devices served by fake local devices")
+    parser.add_argument("--local-version", choices=("3.3", "3.4"), default="3.3", help="local protocol version")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    args = parser.parse_args()
+    if (args.push or args.local_devices) and args.replay:
+        parser.error("--push and --local-devices need the fake cloud, not --replay")
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run_benchmark(args))
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            file.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
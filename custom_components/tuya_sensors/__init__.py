@@ -1,6 +1,6 @@
 """
 Home Assistant integration for Tuya sensors.
-This integration uses the tuya-connector-python library to poll sensor data.
+This integration polls sensor data from the Tuya Cloud OpenAPI.
 """
 import logging
 from datetime import timedelta
@@ -9,6 +9,9 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
 from homeassistant.const import (
     CONF_API_KEY,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
     CONF_REGION,
     CONF_SCAN_INTERVAL,
     Platform,
@@ -22,12 +25,72 @@ _LOGGER = logging.getLogger(__name__)
 PLATFORMS = [Platform.SENSOR]
 MIN_SCAN_INTERVAL = timedelta(seconds=30)
 DEFAULT_SCAN_INTERVAL = timedelta(minutes=1)
+DEFAULT_DISCOVERY_CONCURRENCY = 10
+DEFAULT_REQUESTS_PER_SECOND = 5
+DEFAULT_REQUESTS_PER_DAY = 0
+DEFAULT_RECONCILE_INTERVAL = timedelta(minutes=30)
+DEFAULT_REQUESTS_PER_MINUTE = 0
+DEFAULT_POLL_JITTER = 0.0
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_REPLAY_SPEED = 1.0
+DEFAULT_ROLLING_WINDOWS = [5, 60]
+ROLLING_STATISTICS = ["mean", "min", "max", "rate", "energy"]
+
+# Key of the sensor managers of config entries in hass.data[DOMAIN]
+MANAGERS = "managers"
+
+# Options applied to a running entry without reloading it
+LIVE_OPTIONS = {
+    "device_ids",
+    "include_sensors",
+    "exclude_sensors",
+    "scan_interval",
+    "min_poll_interval",
+    "max_poll_interval",
+}
 
 # Custom constants
 CONF_API_SECRET = "api_secret"
 CONF_DEVICE_IDS = "device_ids"
 CONF_INCLUDE_SENSORS = "include_sensors"
 CONF_EXCLUDE_SENSORS = "exclude_sensors"
+CONF_DISCOVERY_CONCURRENCY = "discovery_concurrency"
+CONF_REQUESTS_PER_SECOND = "requests_per_second"
+CONF_REQUESTS_PER_DAY = "requests_per_day"
+CONF_PUSH = "push"
+CONF_PUSH_ENDPOINT = "push_endpoint"
+CONF_API_ENDPOINT = "api_endpoint"
+CONF_LOCAL_DEVICES = "local_devices"
+CONF_LOCAL_KEY = "local_key"
+CONF_PROTOCOL_VERSION = "protocol_version"
+CONF_DPS = "dps"
+CONF_CATEGORIES = "categories"
+CONF_BACKFILL = "backfill"
+CONF_DIAGNOSTIC_SENSORS = "diagnostic_sensors"
+CONF_CAPTURE_FILE = "capture_file"
+CONF_REPLAY_FILE = "replay_file"
+CONF_REPLAY_SPEED = "replay_speed"
+CONF_ROLLING_SENSORS = "rolling_sensors"
+CONF_ROLLING_WINDOWS = "rolling_windows"
+CONF_ROLLING_STATISTICS = "rolling_statistics"
+CONF_SENSOR_TYPES_FILE = "sensor_types_file"
+CONF_MIN_POLL_INTERVAL = "min_poll_interval"
+CONF_MAX_POLL_INTERVAL = "max_poll_interval"
+CONF_REQUESTS_PER_MINUTE = "requests_per_minute"
+CONF_POLL_JITTER = "poll_jitter"
+CONF_MAX_CONCURRENT_REQUESTS = "max_concurrent_requests"
+
+# Devices polled over the LAN, with the cloud as fallback
+LOCAL_DEVICE_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_DEVICE_ID): cv.string,
+        vol.Required(CONF_HOST): cv.string,
+        vol.Optional(CONF_LOCAL_KEY): cv.string,
+        vol.Optional(CONF_PROTOCOL_VERSION, default="3.3"): vol.In(["3.3", "3.4"]),
+        vol.Optional(CONF_PORT, default=6668): cv.port,
+        vol.Optional(CONF_DPS): {cv.string: cv.string},
+    }
+)
 
 # Configuration schema
 CONFIG_SCHEMA = vol.Schema(
@@ -39,10 +102,56 @@ CONFIG_SCHEMA = vol.Schema(
                 vol.Required(CONF_DEVICE_IDS): vol.All(cv.ensure_list, [cv.string]),
                 vol.Optional(CONF_INCLUDE_SENSORS, default=[]): vol.All(cv.ensure_list, [cv.string]),
                 vol.Optional(CONF_EXCLUDE_SENSORS, default=[]): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(CONF_CATEGORIES, default=[]): vol.All(cv.ensure_list, [cv.string]),
                 vol.Optional(CONF_REGION, default="us"): cv.string,
                 vol.Optional(
                     CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL
                 ): vol.All(cv.time_period, vol.Clamp(min=MIN_SCAN_INTERVAL)),
+                vol.Optional(CONF_MIN_POLL_INTERVAL): vol.All(
+                    cv.time_period, vol.Clamp(min=MIN_SCAN_INTERVAL)
+                ),
+                vol.Optional(CONF_MAX_POLL_INTERVAL): vol.All(
+                    cv.time_period, vol.Clamp(min=MIN_SCAN_INTERVAL)
+                ),
+                vol.Optional(
+                    CONF_REQUESTS_PER_MINUTE, default=DEFAULT_REQUESTS_PER_MINUTE
+                ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_POLL_JITTER, default=DEFAULT_POLL_JITTER
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=0.5)),
+                vol.Optional(
+                    CONF_DISCOVERY_CONCURRENCY, default=DEFAULT_DISCOVERY_CONCURRENCY
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+                vol.Optional(
+                    CONF_REQUESTS_PER_SECOND, default=DEFAULT_REQUESTS_PER_SECOND
+                ): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+                vol.Optional(
+                    CONF_REQUESTS_PER_DAY, default=DEFAULT_REQUESTS_PER_DAY
+                ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_MAX_CONCURRENT_REQUESTS, default=DEFAULT_MAX_CONCURRENT_REQUESTS
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+                vol.Optional(CONF_PUSH, default=False): cv.boolean,
+                vol.Optional(CONF_PUSH_ENDPOINT): cv.string,
+                vol.Optional(CONF_API_ENDPOINT): cv.url,
+                vol.Optional(CONF_CAPTURE_FILE): cv.string,
+                vol.Optional(CONF_REPLAY_FILE): cv.string,
+                vol.Optional(CONF_REPLAY_SPEED, default=DEFAULT_REPLAY_SPEED): vol.All(
+                    vol.Coerce(float), vol.Range(min=0)
+                ),
+                vol.Optional(CONF_BACKFILL, default=False): cv.boolean,
+                vol.Optional(CONF_DIAGNOSTIC_SENSORS, default=False): cv.boolean,
+                vol.Optional(CONF_SENSOR_TYPES_FILE): cv.string,
+                vol.Optional(CONF_ROLLING_SENSORS, default=[]): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(CONF_ROLLING_WINDOWS, default=DEFAULT_ROLLING_WINDOWS): vol.All(
+                    cv.ensure_list, [vol.All(vol.Coerce(int), vol.Range(min=1, max=60))]
+                ),
+                vol.Optional(CONF_ROLLING_STATISTICS, default=ROLLING_STATISTICS): vol.All(
+                    cv.ensure_list, [vol.In(ROLLING_STATISTICS)]
+                ),
+                vol.Optional(CONF_LOCAL_DEVICES, default=[]): vol.All(
+                    cv.ensure_list, [LOCAL_DEVICE_SCHEMA]
+                ),
             }
         )
     },
@@ -60,8 +169,30 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     device_ids = conf[CONF_DEVICE_IDS]
     include_sensors = conf[CONF_INCLUDE_SENSORS]
     exclude_sensors = conf[CONF_EXCLUDE_SENSORS]
+    categories = conf[CONF_CATEGORIES]
     region = conf[CONF_REGION]
     scan_interval = conf[CONF_SCAN_INTERVAL]
+    min_poll_interval = conf.get(CONF_MIN_POLL_INTERVAL)
+    max_poll_interval = conf.get(CONF_MAX_POLL_INTERVAL)
+    requests_per_minute = conf[CONF_REQUESTS_PER_MINUTE]
+    poll_jitter = conf[CONF_POLL_JITTER]
+    discovery_concurrency = conf[CONF_DISCOVERY_CONCURRENCY]
+    requests_per_second = conf[CONF_REQUESTS_PER_SECOND]
+    requests_per_day = conf[CONF_REQUESTS_PER_DAY]
+    max_concurrent_requests = conf[CONF_MAX_CONCURRENT_REQUESTS]
+    push = conf[CONF_PUSH]
+    push_endpoint = conf.get(CONF_PUSH_ENDPOINT)
+    api_endpoint = conf.get(CONF_API_ENDPOINT)
+    capture_file = conf.get(CONF_CAPTURE_FILE)
+    replay_file = conf.get(CONF_REPLAY_FILE)
+    replay_speed = conf[CONF_REPLAY_SPEED]
+    backfill = conf[CONF_BACKFILL]
+    diagnostic_sensors = conf[CONF_DIAGNOSTIC_SENSORS]
+    rolling_sensors = conf[CONF_ROLLING_SENSORS]
+    rolling_windows = conf[CONF_ROLLING_WINDOWS]
+    rolling_statistics = conf[CONF_ROLLING_STATISTICS]
+    sensor_types_file = conf.get(CONF_SENSOR_TYPES_FILE)
+    local_devices = conf[CONF_LOCAL_DEVICES]
     
     hass.data[DOMAIN] = {
         "api_key": api_key,
@@ -69,8 +200,30 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         "device_ids": device_ids,
         "include_sensors": include_sensors,
         "exclude_sensors": exclude_sensors,
+        "categories": categories,
         "region": region,
         "scan_interval": scan_interval,
+        "min_poll_interval": min_poll_interval,
+        "max_poll_interval": max_poll_interval,
+        "requests_per_minute": requests_per_minute,
+        "poll_jitter": poll_jitter,
+        "discovery_concurrency": discovery_concurrency,
+        "requests_per_second": requests_per_second,
+        "requests_per_day": requests_per_day,
+        "max_concurrent_requests": max_concurrent_requests,
+        "push": push,
+        "push_endpoint": push_endpoint,
+        "api_endpoint": api_endpoint,
+        "capture_file": capture_file,
+        "replay_file": replay_file,
+        "replay_speed": replay_speed,
+        "backfill": backfill,
+        "diagnostic_sensors": diagnostic_sensors,
+        "rolling_sensors": rolling_sensors,
+        "rolling_windows": rolling_windows,
+        "rolling_statistics": rolling_statistics,
+        "sensor_types_file": sensor_types_file,
+        "local_devices": local_devices,
     }
     
     # Setup integration-wide data
@@ -83,7 +236,7 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Tuya from a config entry."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    hass.data[DOMAIN][entry.entry_id] = {**entry.data, **entry.options}
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     entry.async_on_unload(entry.add_update_listener(async_update_options))
@@ -92,7 +245,21 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
 async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Handle options update."""
-    await hass.config_entries.async_reload(entry.entry_id)
+    current = hass.data[DOMAIN][entry.entry_id]
+    updated = {**entry.data, **entry.options}
+    manager = hass.data[DOMAIN].get(MANAGERS, {}).get(entry.entry_id)
+
+    # Anything but the live options needs a fresh session and coordinators
+    changed = {key for key in current.keys() | updated.keys() if current.get(key) != updated.get(key)}
+    if manager is None or not changed <= LIVE_OPTIONS:
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
+
+    hass.data[DOMAIN][entry.entry_id] = updated
+    if changed:
+        entry.async_create_background_task(
+            hass, manager.async_apply_options(updated), "tuya_sensors options"
+        )
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
@@ -0,0 +1,209 @@
+"""Asyncio client for the Tuya Cloud OpenAPI."""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+import aiohttp
+
+from .scheduler import PRIORITY_BACKGROUND
+
+_LOGGER = logging.getLogger(__name__)
+
+TOKEN_PATH = "/v1.0/token"
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+# Refresh the token this many milliseconds before it actually expires
+TOKEN_EXPIRY_MARGIN = 60 * 1000
+
+# Tuya error codes for an expired or invalid access token
+TOKEN_INVALID_CODES = (1010, 1011)
+
+
+class TuyaOpenAPIClient:
+    """Sign and send requests to the Tuya Cloud OpenAPI.
+
+    Responses are returned as the decoded JSON dicts Tuya sends, with the
+    "success", "result", "code" and "msg" keys, so callers can treat them
+    the same way as the responses of tuya_connector.TuyaOpenAPI.
+    """
+
+    def __init__(
+        self, session, access_id, access_secret, endpoint, lang="en", scheduler=None, transport=None
+    ):
+        """Initialize the client on an aiohttp session."""
+        self._session = session
+        self._scheduler = scheduler
+        self._transport = transport
+        self.access_id = access_id
+        self._access_secret = access_secret
+        self.endpoint = endpoint
+        self._lang = lang
+
+        self._access_token = ""
+        self._refresh_token = ""
+        self._expire_time = 0
+        self.uid = None
+        self._token_lock = asyncio.Lock()
+
+    @property
+    def scheduler(self):
+        """Return the scheduler requests go through, or None."""
+        return self._scheduler
+
+    @property
+    def transport(self):
+        """Return the transport recording or replaying requests, or None."""
+        return self._transport
+
+    @property
+    def token_valid(self):
+        """Return True if a token is held that is not about to expire."""
+        return bool(self._access_token) and (
+            self._expire_time - TOKEN_EXPIRY_MARGIN > int(time.time() * 1000)
+        )
+
+    @property
+    def token_expire_time(self):
+        """Return the token expiry as a unix timestamp in milliseconds."""
+        return self._expire_time
+
+    async def connect(self):
+        """Acquire a new access token."""
+        async with self._token_lock:
+            return await self._async_request_token(TOKEN_PATH, {"grant_type": 1})
+
+    async def refresh_token(self):
+        """Refresh the access token, or acquire a new one if that fails."""
+        async with self._token_lock:
+            return await self._async_refresh_token()
+
+    async def get(self, path, params=None, priority=PRIORITY_BACKGROUND):
+        """Send a GET request."""
+        return await self.request("GET", path, params, priority=priority)
+
+    async def request(self, method, path, params=None, body=None, priority=PRIORITY_BACKGROUND):
+        """Send a request, through the scheduler if the client has one."""
+        if self._scheduler is None:
+            return await self._async_request(method, path, params, body)
+
+        return await self._scheduler.async_request(
+            method,
+            path,
+            params,
+            lambda: self._async_request(method, path, params, body),
+            priority,
+        )
+
+    async def _async_request(self, method, path, params, body):
+        """Send a signed request, refreshing the token when needed."""
+        if not self.token_valid:
+            async with self._token_lock:
+                if not self.token_valid:
+                    await self._async_refresh_token()
+
+        access_token = self._access_token
+        response = await self._async_send(method, path, params, body, access_token)
+
+        if response.get("code") in TOKEN_INVALID_CODES:
+            _LOGGER.debug("Access token rejected, refreshing: %s", response)
+            async with self._token_lock:
+                # Concurrent callers rejected with the same token refresh once
+                if self._access_token == access_token:
+                    await self._async_refresh_token()
+            response = await self._async_send(
+                method, path, params, body, self._access_token
+            )
+
+        return response
+
+    async def _async_refresh_token(self):
+        """Refresh the token, falling back to a new one. Caller holds the lock."""
+        if self._refresh_token:
+            response = await self._async_request_token(f"{TOKEN_PATH}/{self._refresh_token}")
+            if response.get("success", False):
+                return response
+            _LOGGER.debug("Token refresh failed, requesting a new token: %s", response)
+
+        return await self._async_request_token(TOKEN_PATH, {"grant_type": 1})
+
+    async def _async_request_token(self, path, params=None):
+        """Request a token and store it on success."""
+        # Token requests are signed without an access token, while requests
+        # already in flight keep using the current one
+        response = await self._async_send("GET", path, params, None, "")
+
+        if response.get("success", False):
+            result = response.get("result", {})
+            self._access_token = result.get("access_token", "")
+            self._refresh_token = result.get("refresh_token", "")
+            self._expire_time = response.get("t", int(time.time() * 1000)) + (
+                result.get("expire_time", 0) * 1000
+            )
+            self.uid = result.get("uid")
+        return response
+
+    def _sign(self, method, path, params, body, access_token, timestamp):
+        """Calculate the HMAC-SHA256 signature of a request."""
+        content = json.dumps(body) if body else ""
+        string_to_sign = "\n".join(
+            (
+                method,
+                hashlib.sha256(content.encode("utf8")).hexdigest().lower(),
+                "",
+                path + _query_string(params),
+            )
+        )
+        message = self.access_id + access_token + str(timestamp) + string_to_sign
+        return hmac.new(
+            self._access_secret.encode("utf8"),
+            msg=message.encode("utf8"),
+            digestmod=hashlib.sha256,
+        ).hexdigest().upper()
+
+    async def _async_send(self, method, path, params, body, access_token):
+        """Send a single request, through the transport if the client has one."""
+        if self._transport is None:
+            return await self._async_http_send(method, path, params, body, access_token)
+
+        return await self._transport.async_send(
+            method,
+            path,
+            params,
+            body,
+            lambda: self._async_http_send(method, path, params, body, access_token),
+        )
+
+    async def _async_http_send(self, method, path, params, body, access_token):
+        """Sign and send a single request and return the decoded response."""
+        timestamp = int(time.time() * 1000)
+        headers = {
+            "client_id": self.access_id,
+            "sign": self._sign(method, path, params, body, access_token, timestamp),
+            "sign_method": "HMAC-SHA256",
+            "access_token": access_token,
+            "t": str(timestamp),
+            "lang": self._lang,
+        }
+
+        async with self._session.request(
+            method,
+            self.endpoint + path,
+            params=params,
+            json=body,
+            headers=headers,
+            timeout=REQUEST_TIMEOUT,
+        ) as resp:
+            response = await resp.json(content_type=None)
+
+        _LOGGER.debug("Response %s %s: %s", method, path, response)
+        return response
+
+
+def _query_string(params):
+    """Build the sorted query string used for signing."""
+    if not params:
+        return ""
+    return "?" + "&".join(f"{key}={params[key]}" for key in sorted(params))
@@ -0,0 +1,236 @@
+"""Backfill of long-term statistics from the Tuya device logs."""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_import_statistics,
+    get_last_statistics,
+)
+from homeassistant.components.sensor import SensorStateClass
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.util import dt as dt_util
+
+from .scheduler import PRIORITY_BULK
+
+_LOGGER = logging.getLogger(__name__)
+
+LOGS_PATH = "/v1.0/devices/{}/logs"
+LOGS_PAGE_SIZE = 100
+
+# Device logs of data point reports
+LOG_TYPE_REPORT = "7"
+
+# Tuya keeps device logs for about a week
+MAX_AGE = timedelta(days=7)
+
+# Window fetched, aggregated and imported at once
+CHUNK = timedelta(days=1)
+
+# Delay after setup before the first backfill, so entities have their IDs
+STARTUP_DELAY = 60
+
+HOUR = timedelta(hours=1)
+
+
+def _hour_start(moment):
+    """Return the start of the hour of a datetime."""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class TuyaStatisticsBackfill:
+    """Fill gaps in the long-term statistics of the sensors of one manager.
+
+    A backfill runs after setup and whenever account polling recovers from
+    a failure. For every sensor with a state class it imports the hours
+    since its last statistics entry, up to the start of the current hour,
+    from the device logs. Logs are streamed page by page and one day at a
+    time, and only hourly aggregates are kept in memory.
+    """
+
+    def __init__(self, hass, tuya_api, manager):
+        """Initialize the backfill."""
+        self.hass = hass
+        self._tuya_api = tuya_api
+        self._manager = manager
+        self._lock = asyncio.Lock()
+        self._last_success = True
+        self._unsub_listener = None
+        self._unsub_timer = None
+
+    @callback
+    def async_start(self):
+        """Schedule the startup backfill and watch for polling recoveries."""
+        self._unsub_listener = self._manager.account_coordinator.async_add_listener(
+            self._handle_account_update
+        )
+        self._unsub_timer = async_call_later(self.hass, STARTUP_DELAY, self._async_scheduled_run)
+
+    @callback
+    def async_stop(self):
+        """Stop watching and cancel a scheduled backfill."""
+        if self._unsub_listener is not None:
+            self._unsub_listener()
+            self._unsub_listener = None
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+
+    @callback
+    def _handle_account_update(self):
+        """Backfill once polling succeeds again after a failure."""
+        success = self._manager.account_coordinator.last_update_success
+        if success and not self._last_success:
+            self.hass.async_create_background_task(self.async_run(), "tuya_sensors backfill")
+        self._last_success = success
+
+    async def _async_scheduled_run(self, _now):
+        """Run the startup backfill."""
+        self._unsub_timer = None
+        await self.async_run()
+
+    async def async_run(self):
+        """Backfill the statistics of all devices, one device at a time."""
+        if self._lock.locked():
+            return
+
+        async with self._lock:
+            for device_id, device in list(self._manager.devices.items()):
+                entities = [
+                    entity for entity in device["entities"].values()
+                    if entity.hass is not None
+                    and entity.state_class is not None
+                    # Values are imported in the unit Tuya reports them in
+                    and entity.unit_of_measurement == entity.native_unit_of_measurement
+                ]
+                if not entities:
+                    continue
+                try:
+                    await self._async_backfill_device(device_id, entities)
+                except Exception as e:
+                    _LOGGER.warning("Error backfilling statistics of device %s: %s", device_id, str(e))
+
+    async def _async_backfill_device(self, device_id, entities):
+        """Import the missing hours of the statistics of a device's sensors."""
+        end = _hour_start(dt_util.utcnow())
+        earliest = _hour_start(end - MAX_AGE)
+
+        # Per entity the first missing hour and the running state and sum
+        progress = {}
+        for entity in entities:
+            last = await self._async_last_statistic(entity.entity_id)
+            if last is None:
+                progress[entity] = {"start": earliest, "state": None, "sum": 0.0}
+                continue
+            start = dt_util.utc_from_timestamp(last["start"]) + HOUR
+            if start < end:
+                progress[entity] = {
+                    "start": max(start, earliest),
+                    "state": last.get("state"),
+                    "sum": last.get("sum") or 0.0,
+                }
+        if not progress:
+            return
+
+        chunk_start = min(item["start"] for item in progress.values())
+        codes = sorted({entity.code for entity in progress})
+        imported = 0
+
+        while chunk_start < end:
+            chunk_end = min(chunk_start + CHUNK, end)
+            buckets = await self._async_aggregate(device_id, codes, chunk_start, chunk_end)
+            for entity, item in progress.items():
+                imported += self._import(entity, item, buckets.get(entity.code, {}))
+            chunk_start = chunk_end
+
+        if imported:
+            _LOGGER.info("Backfilled %d hours of statistics for device %s", imported, device_id)
+
+    async def _async_last_statistic(self, statistic_id):
+        """Return the last statistics row of a sensor, or None."""
+        result = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, statistic_id, False, {"state", "sum"}
+        )
+        rows = result.get(statistic_id)
+        return rows[0] if rows else None
+
+    async def _async_aggregate(self, device_id, codes, start, end):
+        """Stream the logs of a window and return code to hour to aggregate."""
+        buckets = {}
+        params = {
+            "type": LOG_TYPE_REPORT,
+            "codes": ",".join(codes),
+            "start_time": int(start.timestamp() * 1000),
+            "end_time": int(end.timestamp() * 1000) - 1,
+            "size": LOGS_PAGE_SIZE,
+        }
+        coordinator = self._manager.devices[device_id]["coordinator"]
+
+        while True:
+            response = await self._tuya_api.get(
+                LOGS_PATH.format(device_id), params, priority=PRIORITY_BULK
+            )
+            if not response.get("success", False):
+                raise ValueError(f"Failed to get logs: {response}")
+
+            result = response.get("result", {})
+            for log in result.get("logs", []):
+                try:
+                    value = float(coordinator.convert(log["code"], log["value"]))
+                    event_time = int(log["event_time"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+                hour = _hour_start(datetime.fromtimestamp(event_time / 1000, timezone.utc))
+                bucket = buckets.setdefault(log["code"], {}).get(hour)
+                if bucket is None:
+                    buckets[log["code"]][hour] = [value, value, value, 1, value, event_time]
+                    continue
+                bucket[0] = min(bucket[0], value)
+                bucket[1] = max(bucket[1], value)
+                bucket[2] += value
+                bucket[3] += 1
+                if event_time >= bucket[5]:
+                    bucket[4] = value
+                    bucket[5] = event_time
+
+            if not result.get("has_next") or not result.get("next_row_key"):
+                return buckets
+            params["start_row_key"] = result["next_row_key"]
+
+    def _import(self, entity, progress, hours):
+        """Import the hourly aggregates of one sensor and return how many."""
+        has_sum = entity.state_class in (SensorStateClass.TOTAL, SensorStateClass.TOTAL_INCREASING)
+        statistics = []
+        for hour in sorted(hours):
+            if hour < progress["start"]:
+                continue
+            minimum, maximum, total, count, last, _ = hours[hour]
+            if has_sum:
+                previous = progress["state"]
+                if previous is not None:
+                    # A lower value after a meter reset counts from zero
+                    progress["sum"] += last - previous if last >= previous else last
+                progress["state"] = last
+                statistics.append(
+                    StatisticData(start=hour, state=last, sum=progress["sum"])
+                )
+            else:
+                statistics.append(
+                    StatisticData(start=hour, mean=total / count, min=minimum, max=maximum)
+                )
+
+        if statistics:
+            metadata = StatisticMetaData(
+                has_mean=not has_sum,
+                has_sum=has_sum,
+                name=entity.name,
+                source="recorder",
+                statistic_id=entity.entity_id,
+                unit_of_measurement=entity.native_unit_of_measurement,
+            )
+            async_import_statistics(self.hass, metadata, statistics)
+        return len(statistics)
@@ -0,0 +1,128 @@
+"""Persistent cache of Tuya device metadata."""
+import logging
+import time
+from datetime import timedelta
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = "tuya_sensors.device_cache"
+SAVE_DELAY = 10
+
+# Bump when the layout of a cached device changes, older caches are dropped
+CACHE_VERSION = 2
+DEFAULT_CACHE_TTL = timedelta(days=7)
+
+
+class TuyaDeviceCache:
+    """Device info, specifications and status codes keyed by device ID.
+
+    Each cached device is a dict with the keys "info" (name, product_id and
+    category of the device), "specs" (the specification status list),
+    "status" (the status list seen at discovery) and "updated" (unix time
+    the entry was written). Specifications are stored once per product and
+    shared by all devices of that product.
+    """
+
+    def __init__(self, hass, access_id, ttl=DEFAULT_CACHE_TTL):
+        """Initialize the cache of one Tuya account."""
+        self._store = Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}_{access_id}")
+        self._ttl = ttl.total_seconds()
+        self._devices = {}
+        self._products = {}
+
+    async def async_load(self):
+        """Load the cache from disk."""
+        try:
+            data = await self._store.async_load()
+        except Exception as e:
+            _LOGGER.warning("Failed to load Tuya device cache: %s", str(e))
+            data = None
+
+        if not data or data.get("version") != CACHE_VERSION:
+            self._devices = {}
+            self._products = {}
+            return
+
+        self._devices = data.get("devices", {})
+        self._products = data.get("products", {})
+
+    @property
+    def device_ids(self):
+        """Return the IDs of all cached devices that have not expired."""
+        return [device_id for device_id in self._devices if self.get(device_id)]
+
+    def get(self, device_id):
+        """Return the cached device, or None if it is missing or expired."""
+        device = self._devices.get(device_id)
+        if device is None or self._expired(device):
+            return None
+
+        product_id = device["info"].get("product_id")
+        if not product_id:
+            return device
+
+        specs = self.get_product_specs(product_id)
+        if specs is None:
+            return None
+        return {**device, "specs": specs}
+
+    def get_product_specs(self, product_id):
+        """Return the cached specifications of a product, or None."""
+        product = self._products.get(product_id)
+        if product is None or self._expired(product):
+            return None
+        return product["specs"]
+
+    def _expired(self, item):
+        """Return True if a cached item is older than the TTL."""
+        return time.time() - item.get("updated", 0) > self._ttl
+
+    @callback
+    def async_set(self, device_id, info, specs, status):
+        """Store a device and schedule a save."""
+        product_id = info.get("product_id")
+        if product_id:
+            self._products[product_id] = {"specs": specs, "updated": time.time()}
+            specs = None
+
+        self._devices[device_id] = {
+            "info": {
+                "id": device_id,
+                "name": info.get("name"),
+                "product_id": product_id,
+                "category": info.get("category"),
+            },
+            "specs": specs,
+            "status": [
+                {"code": item.get("code"), "value": item.get("value")}
+                for item in status
+                if item.get("code") is not None
+            ],
+            "updated": time.time(),
+        }
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def async_remove(self, device_id):
+        """Drop a device from the cache."""
+        if self._devices.pop(device_id, None) is None:
+            return
+
+        # Forget products no other cached device uses
+        used = {device["info"].get("product_id") for device in self._devices.values()}
+        for product_id in set(self._products) - used:
+            del self._products[product_id]
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self):
+        """Return the data to write to disk."""
+        return {
+            "version": CACHE_VERSION,
+            "devices": self._devices,
+            "products": self._products,
+        }
@@ -0,0 +1,232 @@
+"""Recording and replay of the Tuya Cloud OpenAPI traffic of an account."""
+import asyncio
+import gzip
+import json
+import logging
+import time
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+REDACTED = "**REDACTED**"
+
+# Response keys holding credentials or personal data
+REDACT_KEYS = {"access_token", "refresh_token", "uid", "local_key", "owner_id", "ip", "lat", "lon"}
+
+# Response keys whose values also appear in the paths of later requests
+SECRET_KEYS = ("access_token", "refresh_token", "uid")
+
+# Write buffered requests after this many or after this many seconds
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 10
+
+
+def open_capture(path, mode):
+    """Open a capture file, compressed if its name ends in .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf8")
+    return open(path, mode, encoding="utf8")
+
+
+def _params_key(params):
+    """Return a hashable form of request parameters."""
+    return json.dumps(params or {}, sort_keys=True, separators=(",", ":"))
+
+
+class TuyaCaptureRecorder:
+    """Append every request and response of a client to a capture file.
+
+    Each line of the file is one JSON object with the time since the
+    recording started ("t") and the duration of the request ("d") in
+    seconds, the method, path, parameters and body of the request and the
+    decoded response. Request headers are never written, and credentials
+    and personal data in responses and paths are replaced by a
+    placeholder. Lines are buffered and written from the executor.
+    """
+
+    def __init__(self, hass, path):
+        """Initialize the recorder."""
+        self.hass = hass
+        self._path = path
+        self._started = time.monotonic()
+        self._last_flush = self._started
+        self._buffer = []
+        self._secrets = set()
+        self._write_lock = asyncio.Lock()
+
+    async def async_send(self, method, path, params, body, send):
+        """Send a request with send() and record it."""
+        started = time.monotonic()
+        response = await send()
+        finished = time.monotonic()
+
+        self._learn_secrets(response)
+        self._buffer.append(
+            json.dumps(
+                {
+                    "t": round(started - self._started, 3),
+                    "d": round(finished - started, 3),
+                    "m": method,
+                    "p": self._redact_path(path),
+                    "q": params or {},
+                    "b": body,
+                    "r": _redact(response),
+                },
+                separators=(",", ":"),
+            )
+        )
+
+        if len(self._buffer) >= FLUSH_SIZE or finished - self._last_flush >= FLUSH_INTERVAL:
+            self.hass.async_create_task(self.async_flush())
+        return response
+
+    async def async_flush(self):
+        """Write the buffered requests to the capture file."""
+        self._last_flush = time.monotonic()
+        lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        async with self._write_lock:
+            try:
+                await self.hass.async_add_executor_job(self._write, lines)
+            except Exception as e:
+                _LOGGER.error("Error writing Tuya capture %s: %s", self._path, str(e))
+
+    async def async_close(self):
+        """Write what is still buffered."""
+        await self.async_flush()
+
+    def _write(self, lines):
+        """Append lines to the capture file."""
+        with open_capture(self._path, "a") as file:
+            file.write("\n".join(lines) + "\n")
+
+    def _learn_secrets(self, response):
+        """Remember tokens and the user ID so they can be redacted from paths."""
+        result = response.get("result") if isinstance(response, dict) else None
+        if isinstance(result, dict):
+            for key in SECRET_KEYS:
+                if result.get(key):
+                    self._secrets.add(str(result[key]))
+
+    def _redact_path(self, path):
+        """Replace known secrets in a path."""
+        for secret in self._secrets:
+            path = path.replace(secret, REDACTED)
+        return path
+
+
+def _redact(data):
+    """Return a copy of decoded JSON with sensitive values replaced."""
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if key in REDACT_KEYS and value not in (None, "") else _redact(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [_redact(item) for item in data]
+    return data
+
+
+class TuyaReplayTransport:
+    """Answer requests from a capture file instead of the network.
+
+    A request is answered with the next recorded response to the same
+    method, path and parameters; the last one is repeated once they are
+    used up, so polling can go on indefinitely. Requests whose parameters
+    were never recorded, such as log windows of another time, get the
+    recorded responses of the same path in turn. Responses follow the
+    recorded timeline, with the first request of the replay standing for
+    the first recorded one: each is released at the time it finished in
+    the recording, divided by speed, and no sooner than its recorded
+    duration divided by speed, so idle gaps and bursts keep their shape.
+    A speed of 0 answers right away. Responses carry the current time so
+    tokens stay valid.
+    """
+
+    def __init__(self, hass, path, speed=1.0):
+        """Initialize the transport."""
+        self.hass = hass
+        self._path = path
+        self._speed = speed
+        self._requests = None
+        self._paths = None
+        self._first_time = 0.0
+        self._started = None
+        self._load_lock = asyncio.Lock()
+
+    async def async_send(self, method, path, params, body, send):
+        """Return the recorded response to a request."""
+        if self._requests is None:
+            async with self._load_lock:
+                if self._requests is None:
+                    await self._async_load()
+
+        recorded = self._requests.get((method, path, _params_key(params)))
+        if recorded is not None:
+            entry = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        else:
+            recorded = self._paths.get((method, path))
+            if recorded is None:
+                _LOGGER.debug("No recorded response to %s %s %s", method, path, params)
+                return {
+                    "success": False,
+                    "code": 404,
+                    "msg": "Request not in capture",
+                    "t": int(time.time() * 1000),
+                }
+            entry = recorded[0]
+            recorded.rotate(-1)
+
+        recorded_time, duration, text = entry
+        if self._speed:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            finished = self._started + (recorded_time - self._first_time + duration) / self._speed
+            delay = max(finished - now, duration / self._speed)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        # Decoded per request, like a response from the network
+        response = json.loads(text)
+        if isinstance(response, dict):
+            response["t"] = int(time.time() * 1000)
+        return response
+
+    async def async_close(self):
+        """Nothing to release."""
+
+    async def _async_load(self):
+        """Read the capture file."""
+        try:
+            entries = await self.hass.async_add_executor_job(self._read)
+        except Exception as e:
+            _LOGGER.error("Error reading Tuya capture %s: %s", self._path, str(e))
+            entries = []
+
+        self._requests = {}
+        self._paths = {}
+        self._first_time = min((entry.get("t", 0) for entry in entries), default=0.0)
+        for entry in entries:
+            item = (entry.get("t", 0), entry.get("d", 0), json.dumps(entry.get("r")))
+            self._requests.setdefault(
+                (entry["m"], entry["p"], _params_key(entry.get("q"))), deque()
+            ).append(item)
+            self._paths.setdefault((entry["m"], entry["p"]), deque()).append(item)
+        _LOGGER.info("Replaying %d recorded Tuya requests from %s", len(entries), self._path)
+
+    def _read(self):
+        """Return the entries of the capture file."""
+        entries = []
+        with open_capture(self._path, "r") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # An unfinished last line of an interrupted recording
+                    _LOGGER.debug("Skipping malformed capture line in %s", self._path)
+        return entries
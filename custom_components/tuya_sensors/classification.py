@@ -0,0 +1,334 @@
+"""Classification of Tuya status codes into sensor types."""
+import json
+import logging
+import re
+from types import MappingProxyType
+
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
+from homeassistant.const import (
+    CONCENTRATION_PARTS_PER_BILLION,
+    CONCENTRATION_PARTS_PER_MILLION,
+    LIGHT_LUX,
+    PERCENTAGE,
+    UnitOfElectricCurrent,
+    UnitOfElectricPotential,
+    UnitOfEnergy,
+    UnitOfPower,
+    UnitOfPressure,
+    UnitOfTemperature,
+    UnitOfTime,
+)
+from homeassistant.util.yaml import load_yaml
+
+from .conversion import TUYA_UNITS, spec_values
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def sensor_type(name, device_class=None, unit=None, state_class=None):
+    """Return a read-only sensor type, shared by every code classified as it."""
+    return MappingProxyType(
+        {"name": name, "device_class": device_class, "unit": unit, "state_class": state_class}
+    )
+
+
+TEMPERATURE = sensor_type("Temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, SensorStateClass.MEASUREMENT)
+HUMIDITY = sensor_type("Humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, SensorStateClass.MEASUREMENT)
+POWER = sensor_type("Power", SensorDeviceClass.POWER, UnitOfPower.WATT, SensorStateClass.MEASUREMENT)
+ENERGY = sensor_type("Energy", SensorDeviceClass.ENERGY, UnitOfEnergy.KILO_WATT_HOUR, SensorStateClass.TOTAL_INCREASING)
+VOLTAGE = sensor_type("Voltage", SensorDeviceClass.VOLTAGE, UnitOfElectricPotential.VOLT, SensorStateClass.MEASUREMENT)
+CURRENT = sensor_type("Current", SensorDeviceClass.CURRENT, UnitOfElectricCurrent.AMPERE, SensorStateClass.MEASUREMENT)
+BATTERY = sensor_type("Battery", SensorDeviceClass.BATTERY, PERCENTAGE, SensorStateClass.MEASUREMENT)
+CO2 = sensor_type("CO2", SensorDeviceClass.CO2, CONCENTRATION_PARTS_PER_MILLION, SensorStateClass.MEASUREMENT)
+PM25 = sensor_type("PM2.5", SensorDeviceClass.PM25, "μg/m³", SensorStateClass.MEASUREMENT)
+VOC = sensor_type("VOC", SensorDeviceClass.VOLATILE_ORGANIC_COMPOUNDS, CONCENTRATION_PARTS_PER_BILLION, SensorStateClass.MEASUREMENT)
+ILLUMINANCE = sensor_type("Illuminance", SensorDeviceClass.ILLUMINANCE, LIGHT_LUX, SensorStateClass.MEASUREMENT)
+PRESSURE = sensor_type("Pressure", SensorDeviceClass.PRESSURE, UnitOfPressure.HPA, SensorStateClass.MEASUREMENT)
+COUNTDOWN = sensor_type("Countdown", SensorDeviceClass.DURATION, UnitOfTime.SECONDS, SensorStateClass.MEASUREMENT)
+
+# Mapping of Tuya codes to Home Assistant sensor types
+SENSOR_TYPES = {
+    # Temperature
+    "temp_current": TEMPERATURE,
+    "temperature": TEMPERATURE,
+    "temp_indoor": sensor_type("Indoor Temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, SensorStateClass.MEASUREMENT),
+    "Tin": sensor_type("Indoor Temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, SensorStateClass.MEASUREMENT),
+    "ToutCh1": sensor_type("Outdoor Temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, SensorStateClass.MEASUREMENT),
+    "temp_outdoor": sensor_type("Outdoor Temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, SensorStateClass.MEASUREMENT),
+
+    # Humidity
+    "humidity": HUMIDITY,
+    "humidity_indoor": sensor_type("Indoor Humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, SensorStateClass.MEASUREMENT),
+    "Hin": sensor_type("Indoor Humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, SensorStateClass.MEASUREMENT),
+    "HoutCh1": sensor_type("Outdoor Humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, SensorStateClass.MEASUREMENT),
+    "humidity_outdoor": sensor_type("Outdoor Humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, SensorStateClass.MEASUREMENT),
+
+    # Power
+    "cur_power": sensor_type("Current Power", SensorDeviceClass.POWER, UnitOfPower.WATT, SensorStateClass.MEASUREMENT),
+    "add_ele": sensor_type("Power Consumption", SensorDeviceClass.ENERGY, UnitOfEnergy.KILO_WATT_HOUR, SensorStateClass.TOTAL_INCREASING),
+
+    # Voltage/Current
+    "cur_voltage": VOLTAGE,
+    "cur_current": CURRENT,
+
+    # Battery
+    "battery_percentage": BATTERY,
+    "battery_state": sensor_type("Battery State"),
+
+    # CO2, VOC, PM2.5
+    "co2_value": CO2,
+    "pm25_value": PM25,
+    "voc_value": VOC,
+
+    # Illuminance
+    "bright_value": sensor_type("Brightness", SensorDeviceClass.ILLUMINANCE, LIGHT_LUX, SensorStateClass.MEASUREMENT),
+
+    # Pressure
+    "pressure": PRESSURE,
+
+    # Generic
+    "countdown": COUNTDOWN,
+    "filter_life": sensor_type("Filter Life", None, PERCENTAGE, SensorStateClass.MEASUREMENT),
+}
+
+# Codes whose meaning depends on the product category
+CATEGORY_SENSOR_TYPES = {
+    # Energy meters
+    "zndb": {
+        "forward_energy_total": ENERGY,
+        "reverse_energy_total": sensor_type("Returned Energy", SensorDeviceClass.ENERGY, UnitOfEnergy.KILO_WATT_HOUR, SensorStateClass.TOTAL_INCREASING),
+    },
+    # Circuit breakers
+    "dlq": {
+        "forward_energy_total": ENERGY,
+        "reverse_energy_total": sensor_type("Returned Energy", SensorDeviceClass.ENERGY, UnitOfEnergy.KILO_WATT_HOUR, SensorStateClass.TOTAL_INCREASING),
+    },
+    # Temperature and humidity sensors
+    "wsdcg": {
+        "va_temperature": TEMPERATURE,
+        "va_humidity": HUMIDITY,
+    },
+}
+
+# Prefixes of code tokens and their sensor types, the first matching one wins
+TOKEN_RULES = (
+    ("temp", TEMPERATURE),
+    ("humidity", HUMIDITY),
+    ("energy", ENERGY),
+    ("power", POWER),
+    ("voltage", VOLTAGE),
+    ("current", CURRENT),
+    ("battery", BATTERY),
+    ("co2", CO2),
+    ("pm25", PM25),
+    ("pm2", PM25),
+    ("voc", VOC),
+    ("illuminance", ILLUMINANCE),
+    ("pressure", PRESSURE),
+    ("countdown", COUNTDOWN),
+)
+
+# Tokens too short to be prefixes, matched as whole words after the prefixes
+TOKEN_WORDS = (
+    ("ele", ENERGY),
+)
+
+# Tokens of codes that hold a setting or a limit rather than a measurement
+SETTING_TOKENS = frozenset(
+    (
+        "set", "alarm", "max", "min", "upper", "lower", "limit", "threshold",
+        "calibration", "calib", "sensitivity", "unit", "convert", "mode", "switch",
+    )
+)
+
+# Device class and state class of values reported in a unit
+UNIT_TYPES = {
+    UnitOfPower.WATT: (SensorDeviceClass.POWER, SensorStateClass.MEASUREMENT),
+    UnitOfPower.KILO_WATT: (SensorDeviceClass.POWER, SensorStateClass.MEASUREMENT),
+    UnitOfEnergy.KILO_WATT_HOUR: (SensorDeviceClass.ENERGY, SensorStateClass.TOTAL_INCREASING),
+    UnitOfEnergy.WATT_HOUR: (SensorDeviceClass.ENERGY, SensorStateClass.TOTAL_INCREASING),
+    UnitOfElectricPotential.VOLT: (SensorDeviceClass.VOLTAGE, SensorStateClass.MEASUREMENT),
+    UnitOfElectricPotential.MILLIVOLT: (SensorDeviceClass.VOLTAGE, SensorStateClass.MEASUREMENT),
+    UnitOfElectricCurrent.AMPERE: (SensorDeviceClass.CURRENT, SensorStateClass.MEASUREMENT),
+    UnitOfElectricCurrent.MILLIAMPERE: (SensorDeviceClass.CURRENT, SensorStateClass.MEASUREMENT),
+    UnitOfTemperature.CELSIUS: (SensorDeviceClass.TEMPERATURE, SensorStateClass.MEASUREMENT),
+    UnitOfTemperature.FAHRENHEIT: (SensorDeviceClass.TEMPERATURE, SensorStateClass.MEASUREMENT),
+    UnitOfPressure.HPA: (SensorDeviceClass.PRESSURE, SensorStateClass.MEASUREMENT),
+    UnitOfPressure.PA: (SensorDeviceClass.PRESSURE, SensorStateClass.MEASUREMENT),
+    UnitOfPressure.KPA: (SensorDeviceClass.PRESSURE, SensorStateClass.MEASUREMENT),
+    UnitOfPressure.MBAR: (SensorDeviceClass.PRESSURE, SensorStateClass.MEASUREMENT),
+    LIGHT_LUX: (SensorDeviceClass.ILLUMINANCE, SensorStateClass.MEASUREMENT),
+}
+
+NUMERIC_SPEC_TYPES = ("Integer", "Float")
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+# Token rules indexed by prefix, with their priority
+_PREFIXES = {prefix: (priority, rule) for priority, (prefix, rule) in enumerate(TOKEN_RULES)}
+_PREFIX_LENGTHS = sorted({len(prefix) for prefix in _PREFIXES})
+_WORDS = {
+    word: (priority, rule)
+    for priority, (word, rule) in enumerate(TOKEN_WORDS, len(TOKEN_RULES))
+}
+
+SENSOR_TYPE_SCHEMA = vol.Any(
+    None,
+    vol.Schema(
+        {
+            vol.Optional("name"): cv.string,
+            vol.Optional("device_class"): vol.Any(None, vol.Coerce(SensorDeviceClass)),
+            vol.Optional("unit"): vol.Any(None, cv.string),
+            vol.Optional("state_class"): vol.Any(None, vol.Coerce(SensorStateClass)),
+        }
+    ),
+)
+
+OVERRIDES_SCHEMA = vol.Schema(
+    {
+        vol.Optional("codes", default={}): {cv.string: SENSOR_TYPE_SCHEMA},
+        vol.Optional("categories", default={}): {cv.string: {cv.string: SENSOR_TYPE_SCHEMA}},
+    }
+)
+
+
+def _generic(code, unit=None, state_class=None):
+    """Return a sensor type without device class, named after the code."""
+    return sensor_type(code.replace("_", " ").title(), None, unit, state_class)
+
+
+def _spec_key(spec):
+    """Return a hashable key of the parts of a specification classification uses."""
+    if not spec:
+        return None
+    values = spec.get("values")
+    if not isinstance(values, str):
+        values = json.dumps(values, sort_keys=True, default=str)
+    return (spec.get("type"), values)
+
+
+class TuyaSensorClassifier:
+    """Classify status codes into sensor types using precompiled rule tables.
+
+    A code is looked up, in order, in the overrides for its category and
+    for any category, in the category and code tables, and by the prefixes
+    and words of its tokens; codes that match none are classified by the
+    unit and range of their specification. Results are memoized per
+    category, code and specification, and are read-only mappings shared
+    between devices. Codes classified as None get no sensor.
+    """
+
+    def __init__(self, overrides=None):
+        """Initialize the classifier with validated overrides."""
+        overrides = overrides or {}
+        self._codes = {
+            code: self._compile(code, override)
+            for code, override in overrides.get("codes", {}).items()
+        }
+        self._categories = {
+            category: {code: self._compile(code, override) for code, override in codes.items()}
+            for category, codes in overrides.get("categories", {}).items()
+        }
+        self._memo = {}
+
+    @staticmethod
+    def _compile(code, override):
+        """Return the sensor type of an override entry, or None to skip the code."""
+        if override is None:
+            return None
+        return sensor_type(
+            override.get("name") or code.replace("_", " ").title(),
+            override.get("device_class"),
+            override.get("unit"),
+            override.get("state_class"),
+        )
+
+    def classify(self, code, spec=None, category=None):
+        """Return the sensor type of a code, or None if it should not be a sensor."""
+        key = (category, code, _spec_key(spec))
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        result = self._memo[key] = self._classify(code, spec, category)
+        return result
+
+    def _classify(self, code, spec, category):
+        """Classify a code without memoization."""
+        category_overrides = self._categories.get(category)
+        if category_overrides is not None and code in category_overrides:
+            return category_overrides[code]
+        if code in self._codes:
+            return self._codes[code]
+
+        category_types = CATEGORY_SENSOR_TYPES.get(category)
+        if category_types is not None and code in category_types:
+            return category_types[code]
+        if code in SENSOR_TYPES:
+            return SENSOR_TYPES[code]
+
+        spec_type = spec.get("type") if spec else None
+        values = spec_values(spec) if spec else {}
+        unit = TUYA_UNITS.get(values.get("unit"))
+
+        tokens = [token for token in _TOKEN_SPLIT.split(code.lower()) if token]
+        if SETTING_TOKENS.intersection(tokens):
+            return _generic(code)
+
+        rule = _match_tokens(tokens)
+        if rule is not None:
+            # Sensor types with a device class need numbers
+            if spec_type is not None and spec_type not in NUMERIC_SPEC_TYPES:
+                return _generic(code)
+            # A unit from the specification beats the name, e.g. "power_total" in kWh
+            unit_type = UNIT_TYPES.get(unit)
+            if unit_type is not None and unit_type[0] != rule["device_class"]:
+                return sensor_type(code.replace("_", " ").title(), unit_type[0], unit, unit_type[1])
+            return rule
+
+        if spec_type in NUMERIC_SPEC_TYPES:
+            unit_type = UNIT_TYPES.get(unit)
+            if unit_type is not None:
+                return sensor_type(code.replace("_", " ").title(), unit_type[0], unit, unit_type[1])
+
+            # Generic percentage sensor if range is 0-100
+            if values.get("min") == 0 and values.get("max") == 100:
+                return _generic(code, PERCENTAGE, SensorStateClass.MEASUREMENT)
+
+        # Default: create a generic sensor with the code as name
+        return _generic(code)
+
+
+def _match_tokens(tokens):
+    """Return the sensor type of the highest priority token rule matching, or None."""
+    best = None
+    for token in tokens:
+        match = _WORDS.get(token)
+        if match is not None and (best is None or match[0] < best[0]):
+            best = match
+        for length in _PREFIX_LENGTHS:
+            if length > len(token):
+                break
+            match = _PREFIXES.get(token[:length])
+            if match is not None and (best is None or match[0] < best[0]):
+                best = match
+    return best[1] if best is not None else None
+
+
+DEFAULT_CLASSIFIER = TuyaSensorClassifier()
+
+
+async def async_load_classifier(hass, path):
+    """Return a classifier with the overrides of a file, or the default one."""
+    if not path:
+        return DEFAULT_CLASSIFIER
+
+    try:
+        overrides = await hass.async_add_executor_job(load_yaml, hass.config.path(path))
+        return TuyaSensorClassifier(OVERRIDES_SCHEMA(overrides or {}))
+    except Exception as e:
+        _LOGGER.error("Error loading sensor types from %s: %s", path, str(e))
+        return DEFAULT_CLASSIFIER
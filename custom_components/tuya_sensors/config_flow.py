@@ -103,7 +103,10 @@ class TuyaOptionsFlowHandler(config_entries.OptionsFlow):
                     CONF_SCAN_INTERVAL,
                     default=options.get(CONF_SCAN_INTERVAL, data.get(CONF_SCAN_INTERVAL, 60))
                 ): vol.All(vol.Coerce(int), vol.Range(min=30, max=300)),
-                vol.Required(CONF_DEVICE_IDS, default=", ".join(data.get(CONF_DEVICE_IDS, ""))): str,
+                vol.Required(
+                    CONF_DEVICE_IDS,
+                    default=", ".join(options.get(CONF_DEVICE_IDS, data.get(CONF_DEVICE_IDS, [])))
+                ): str,
                 vol.Optional(
                     CONF_INCLUDE_SENSORS,
                     default=options.get(CONF_INCLUDE_SENSORS, data.get(CONF_INCLUDE_SENSORS, []))
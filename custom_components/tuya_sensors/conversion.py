@@ -0,0 +1,167 @@
+"""Spec-driven conversion of raw Tuya status values."""
+from dataclasses import dataclass
+import json
+import logging
+
+from homeassistant.components.sensor import DEVICE_CLASS_UNITS, SensorDeviceClass
+from homeassistant.const import (
+    CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    CONCENTRATION_MILLIGRAMS_PER_CUBIC_METER,
+    CONCENTRATION_PARTS_PER_BILLION,
+    CONCENTRATION_PARTS_PER_MILLION,
+    LIGHT_LUX,
+    PERCENTAGE,
+    UnitOfElectricCurrent,
+    UnitOfElectricPotential,
+    UnitOfEnergy,
+    UnitOfPower,
+    UnitOfPressure,
+    UnitOfTemperature,
+    UnitOfTime,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Units used in Tuya specifications and their Home Assistant counterparts
+TUYA_UNITS = {
+    "℃": UnitOfTemperature.CELSIUS,
+    "°C": UnitOfTemperature.CELSIUS,
+    "C": UnitOfTemperature.CELSIUS,
+    "℉": UnitOfTemperature.FAHRENHEIT,
+    "°F": UnitOfTemperature.FAHRENHEIT,
+    "F": UnitOfTemperature.FAHRENHEIT,
+    "%": PERCENTAGE,
+    "%RH": PERCENTAGE,
+    "W": UnitOfPower.WATT,
+    "kW": UnitOfPower.KILO_WATT,
+    "kWh": UnitOfEnergy.KILO_WATT_HOUR,
+    "kw·h": UnitOfEnergy.KILO_WATT_HOUR,
+    "度": UnitOfEnergy.KILO_WATT_HOUR,
+    "Wh": UnitOfEnergy.WATT_HOUR,
+    "V": UnitOfElectricPotential.VOLT,
+    "mV": UnitOfElectricPotential.MILLIVOLT,
+    "A": UnitOfElectricCurrent.AMPERE,
+    "mA": UnitOfElectricCurrent.MILLIAMPERE,
+    "hPa": UnitOfPressure.HPA,
+    "Pa": UnitOfPressure.PA,
+    "kPa": UnitOfPressure.KPA,
+    "mbar": UnitOfPressure.MBAR,
+    "s": UnitOfTime.SECONDS,
+    "sec": UnitOfTime.SECONDS,
+    "min": UnitOfTime.MINUTES,
+    "h": UnitOfTime.HOURS,
+    "lux": LIGHT_LUX,
+    "lx": LIGHT_LUX,
+    "ppm": CONCENTRATION_PARTS_PER_MILLION,
+    "ppb": CONCENTRATION_PARTS_PER_BILLION,
+    "ug/m3": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    "μg/m³": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    "mg/m3": CONCENTRATION_MILLIGRAMS_PER_CUBIC_METER,
+}
+
+KIND_RAW = "raw"
+KIND_NUMBER = "number"
+KIND_ENUM = "enum"
+KIND_BOOL = "bool"
+
+
+@dataclass(frozen=True)
+class ConversionPlan:
+    """How to turn the raw values of one code into sensor values.
+
+    Plans are built once per product and code, and called on every value
+    when a coordinator snapshot is built.
+    """
+
+    kind: str = KIND_RAW
+    scale: int = 0
+    unit: str | None = None
+    options: tuple | None = None
+
+    def __call__(self, value):
+        """Convert a raw value."""
+        if value is None:
+            return None
+
+        if self.kind == KIND_NUMBER:
+            if isinstance(value, str):
+                value = float(value)
+            if not self.scale:
+                return value
+            return round(value / 10 ** self.scale, self.scale)
+
+        if self.kind == KIND_BOOL:
+            if isinstance(value, str):
+                return value.lower() in ("true", "1", "on")
+            return bool(value)
+
+        if self.kind == KIND_ENUM:
+            value = str(value)
+            if self.options and value not in self.options:
+                return None
+            return value
+
+        return value
+
+    def resolve_unit(self, device_class, default_unit):
+        """Return the unit to use, preferring the one from the specification.
+
+        The specification unit is only used when it is valid for the device
+        class, otherwise the default unit of the sensor type is kept.
+        """
+        if self.unit is None:
+            return default_unit
+        if device_class in DEVICE_CLASS_UNITS and self.unit not in DEVICE_CLASS_UNITS[device_class]:
+            return default_unit
+        return self.unit
+
+
+RAW_PLAN = ConversionPlan()
+
+# Without specifications, temperatures are assumed to be reported in tenths
+LEGACY_TEMPERATURE_PLAN = ConversionPlan(kind=KIND_NUMBER, scale=1)
+
+
+def spec_values(spec):
+    """Return the decoded "values" of a specification, or an empty dict."""
+    values = spec.get("values") or {}
+    if isinstance(values, str):
+        try:
+            values = json.loads(values)
+        except ValueError:
+            _LOGGER.debug("Invalid specification values for %s: %s", spec.get("code"), values)
+            values = {}
+    if not isinstance(values, dict):
+        values = {}
+    return values
+
+
+def build_conversion_plan(spec, device_class):
+    """Compile the conversion plan of a code from its specification."""
+    if not spec:
+        if device_class == SensorDeviceClass.TEMPERATURE:
+            return LEGACY_TEMPERATURE_PLAN
+        return RAW_PLAN
+
+    values = spec_values(spec)
+    spec_type = spec.get("type")
+    if spec_type in ("Integer", "Float"):
+        try:
+            scale = int(values.get("scale", 0))
+        except (TypeError, ValueError):
+            scale = 0
+        return ConversionPlan(
+            kind=KIND_NUMBER,
+            scale=max(scale, 0),
+            unit=TUYA_UNITS.get(values.get("unit")),
+        )
+    if spec_type == "Enum":
+        options = values.get("range")
+        return ConversionPlan(
+            kind=KIND_ENUM,
+            options=tuple(str(option) for option in options) if options else None,
+        )
+    if spec_type == "Boolean":
+        return ConversionPlan(kind=KIND_BOOL)
+
+    return RAW_PLAN
@@ -0,0 +1,531 @@
+"""Data update coordinators for the Tuya sensors integration."""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from types import MappingProxyType
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .local import TuyaLocalError
+from .metrics import LatencyHistogram
+from .push import SIGNAL_DEVICE_ONLINE, SIGNAL_DEVICE_STATUS
+from .rolling import RollingBuffer
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to collect registering devices without data into one first refresh
+FIRST_REFRESH_DELAY = 1
+
+# Batch status endpoint and the maximum number of device IDs it accepts per call
+BATCH_STATUS_PATH = "/v1.0/iot-03/devices/status"
+BATCH_STATUS_LIMIT = 20
+
+# Listener context of the listeners of the rolling aggregates of a code
+ROLLING_CONTEXT = "rolling"
+
+
+def _chunks(items, size):
+    """Split a list into consecutive chunks of at most size items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TuyaAccountCoordinator(DataUpdateCoordinator):
+    """Poll the status of all devices of one account using batched requests.
+
+    The result is a dict of device ID to status list, which is fanned out to
+    the per-device TuyaDataCoordinator instances registered with it. While
+    status reports are pushed from the message queue, polling slows down to
+    a reconciliation interval. Devices in the local pool are queried over
+    the LAN first and only fall back to the cloud when that fails.
+
+    With a poll planner, each poll only covers the devices that are due and
+    the next poll is scheduled for when the next device becomes due. The
+    result then only holds the devices in polled. Devices the planner
+    considers offline are probed one by one through their device info,
+    which tells whether Tuya sees them online again.
+    """
+
+    def __init__(
+        self,
+        hass,
+        logger,
+        tuya_api,
+        scan_interval,
+        reconcile_interval=None,
+        local_pool=None,
+        planner=None
+    ):
+        """Initialize."""
+
+        if isinstance(scan_interval, int):
+            scan_interval = timedelta(seconds=scan_interval)
+
+        super().__init__(
+            hass,
+            logger,
+            name="tuya_account",
+            update_interval=scan_interval,
+        )
+        self.tuya_api = tuya_api
+        self.local_pool = local_pool
+        self.planner = planner
+        self.polled = set()
+        self.push_connected = False
+        self._devices = {}
+        self._scan_interval = scan_interval
+        self._reconcile_interval = reconcile_interval or scan_interval
+        self._unsub_first_refresh = None
+        self.poll_latency = LatencyHistogram()
+        self.last_poll_duration = None
+
+    @callback
+    def async_set_push_connected(self, connected):
+        """Switch between regular polling and reconciliation polling."""
+        self.push_connected = connected
+        if connected:
+            self.update_interval = self._reconcile_interval
+            return
+
+        # Without push, catch up right away and poll at the regular rate again
+        if self.update_interval != self._scan_interval:
+            self.update_interval = self._scan_interval
+            if self.planner is not None:
+                self.planner.expedite()
+            self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def async_set_poll_interval(self, scan_interval, min_interval=None, max_interval=None):
+        """Change the poll intervals without restarting the coordinator."""
+        if isinstance(scan_interval, int):
+            scan_interval = timedelta(seconds=scan_interval)
+
+        if scan_interval != self._scan_interval:
+            if self.update_interval == self._scan_interval:
+                self.update_interval = scan_interval
+            if self._reconcile_interval == self._scan_interval:
+                self._reconcile_interval = scan_interval
+            self._scan_interval = scan_interval
+
+        if self.planner is not None and min_interval is not None:
+            if self.planner.set_bounds(min_interval, max_interval) and not self.push_connected:
+                # Reschedule for devices whose next poll moved closer
+                self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def async_set_device_online(self, device_id, online):
+        """Open or close the circuit breaker of a device, return True if it changed."""
+        if self.planner is None:
+            return False
+
+        if online:
+            changed = self.planner.mark_online(device_id)
+            if changed:
+                _LOGGER.info("Tuya device %s is back online", device_id)
+        else:
+            changed = self.planner.mark_offline(device_id)
+            if changed:
+                _LOGGER.info("Tuya device %s is offline, probing it at a reduced rate", device_id)
+        return changed
+
+    @callback
+    def async_register_device(self, device_coordinator):
+        """Register a device coordinator and return a callback to remove it."""
+        device_id = device_coordinator.device_id
+        self._devices[device_id] = device_coordinator
+        remove_listener = self.async_add_listener(device_coordinator.async_handle_account_update)
+
+        # Devices restored without data are fetched together in a single poll
+        if device_coordinator.data is None and self._unsub_first_refresh is None:
+            self._unsub_first_refresh = async_call_later(
+                self.hass, FIRST_REFRESH_DELAY, self._async_first_refresh
+            )
+
+        @callback
+        def remove_device():
+            remove_listener()
+            if self._devices.get(device_id) is device_coordinator:
+                del self._devices[device_id]
+                if self.planner is not None:
+                    self.planner.forget(device_id)
+
+        return remove_device
+
+    async def _async_first_refresh(self, _now):
+        """Poll the devices that registered without data."""
+        self._unsub_first_refresh = None
+        await self.async_refresh()
+
+    async def async_shutdown(self):
+        """Cancel a pending first refresh and stop polling."""
+        if self._unsub_first_refresh is not None:
+            self._unsub_first_refresh()
+            self._unsub_first_refresh = None
+        await super().async_shutdown()
+
+    async def _async_update_data(self):
+        """Fetch the status of all registered devices that are due from Tuya API."""
+        started = time.monotonic()
+        planner = self.planner
+        device_ids = list(self._devices)
+        probes = set()
+        if planner is not None:
+            device_ids = planner.due(device_ids, reconcile=self.push_connected)
+            probes = {device_id for device_id in device_ids if planner.is_offline(device_id)}
+        self.polled = set(device_ids)
+        results = {}
+        failed = []
+
+        if self.local_pool is not None:
+            local_ids = [device_id for device_id in device_ids if device_id in self.local_pool]
+            statuses = await asyncio.gather(
+                *(self.local_pool.async_status(device_id) for device_id in local_ids),
+                return_exceptions=True,
+            )
+            for device_id, status in zip(local_ids, statuses):
+                if isinstance(status, Exception):
+                    _LOGGER.debug("Local status request failed for %s: %s", device_id, str(status))
+                else:
+                    results[device_id] = status
+
+        cloud_ids = [
+            device_id for device_id in device_ids
+            if device_id not in results and device_id not in probes
+        ]
+        for chunk in _chunks(cloud_ids, BATCH_STATUS_LIMIT):
+            try:
+                response = await self.tuya_api.get(
+                    BATCH_STATUS_PATH, {"device_ids": ",".join(chunk)}
+                )
+            except Exception as e:
+                _LOGGER.debug("Batch status request failed for %s: %s", chunk, str(e))
+                failed.extend(chunk)
+                continue
+
+            if not response.get("success", False):
+                _LOGGER.debug("Batch status request failed for %s: %s", chunk, response)
+                failed.extend(chunk)
+                continue
+
+            for item in response.get("result", []):
+                if item.get("id") in self._devices:
+                    results[item["id"]] = item.get("status", [])
+
+            # Devices missing from a successful batch are retried individually
+            failed.extend(device_id for device_id in chunk if device_id not in results)
+
+        # Fall back to per-device calls for devices that failed in a batch
+        for device_id in failed:
+            try:
+                results[device_id] = await fetch_device_status(self.tuya_api, device_id)
+            except UpdateFailed as e:
+                _LOGGER.debug("Fallback status request failed for %s: %s", device_id, str(e))
+
+        # Offline devices only count as back once Tuya reports them online
+        for device_id in probes - set(results):
+            try:
+                info = await fetch_device_info(self.tuya_api, device_id)
+            except UpdateFailed as e:
+                _LOGGER.debug("Probe of offline device %s failed: %s", device_id, str(e))
+                continue
+            if info.get("online", True):
+                results[device_id] = info.get("status", [])
+
+        duration = time.monotonic() - started
+        self.last_poll_duration = duration
+        if device_ids:
+            self.poll_latency.add(duration * 1000)
+
+        if planner is not None:
+            for device_id in device_ids:
+                if device_id in results:
+                    if device_id in probes:
+                        _LOGGER.info("Tuya device %s is back online", device_id)
+                    planner.record(device_id, results[device_id], duration=duration)
+                elif planner.record_failure(device_id, duration=duration):
+                    _LOGGER.info("Tuya device %s is offline, probing it at a reduced rate", device_id)
+            if not self.push_connected:
+                self.update_interval = timedelta(seconds=planner.next_delay())
+
+        # Failed probes are expected and do not fail the whole poll
+        online_ids = [device_id for device_id in device_ids if device_id not in probes]
+        if online_ids and not any(device_id in results for device_id in online_ids):
+            raise UpdateFailed("Failed to get status for any Tuya device")
+
+        return results
+
+
+async def fetch_device_status(tuya_api, device_id, priority=PRIORITY_BACKGROUND):
+    """Fetch the status list of a single device."""
+    try:
+        response = await tuya_api.get(f"/v1.0/devices/{device_id}/status", priority=priority)
+    except Exception as e:
+        raise UpdateFailed(f"Error communicating with Tuya API: {e}")
+
+    if not response.get("success", False):
+        raise UpdateFailed(f"Failed to get status for device {device_id}")
+
+    return response.get("result", [])
+
+
+async def fetch_device_info(tuya_api, device_id, priority=PRIORITY_BACKGROUND):
+    """Fetch the info of a single device, including its online state and status."""
+    try:
+        response = await tuya_api.get(f"/v1.0/devices/{device_id}", priority=priority)
+    except Exception as e:
+        raise UpdateFailed(f"Error communicating with Tuya API: {e}")
+
+    if not response.get("success", False):
+        raise UpdateFailed(f"Failed to get info for device {device_id}")
+
+    return response.get("result", {})
+
+
+class TuyaDataCoordinator(DataUpdateCoordinator):
+    """Class to manage the data of a single Tuya device.
+
+    Regular polling is done by the TuyaAccountCoordinator, which this
+    coordinator is registered with as long as it has listeners. It only
+    fetches on its own when a refresh is explicitly requested.
+
+    The data is a read-only snapshot mapping each status code to its value,
+    converted once per update with the converter registered for the code.
+    Listeners registered for a code are only called when that code's value
+    or the availability of the device changed. Pushed status reports are
+    merged into the current snapshot as they arrive.
+
+    Codes with rolling listeners get every numeric value of every snapshot
+    added to a RollingBuffer, and those listeners are called per snapshot
+    whether the value changed or not, as the windows move on regardless.
+    """
+
+    def __init__(self, hass, logger, account_coordinator, device_id):
+        """Initialize."""
+        super().__init__(
+            hass,
+            logger,
+            name=f"tuya_{device_id}",
+        )
+        self._account = account_coordinator
+        self._tuya_api = account_coordinator.tuya_api
+        self._device_id = device_id
+        self._unsub_sources = None
+        self._converters = {}
+        self._notified_data = None
+        self._notified_success = None
+        self._rolling = {}
+        self._sampled_data = None
+
+    @property
+    def device_id(self):
+        """Return the Tuya device ID."""
+        return self._device_id
+
+    @callback
+    def async_handle_account_update(self):
+        """Take over this device's status from the latest account poll."""
+        if self._device_id not in self._account.polled:
+            return
+
+        if not self._account.last_update_success:
+            self.async_set_update_error(self._account.last_exception)
+            return
+
+        status = (self._account.data or {}).get(self._device_id)
+        if status is None:
+            self.async_set_update_error(self._status_error())
+            return
+
+        self.async_set_status(status)
+
+    def _status_error(self):
+        """Return the error to report when no status could be fetched."""
+        planner = self._account.planner
+        if planner is not None and planner.is_offline(self._device_id):
+            return UpdateFailed(f"Tuya device {self._device_id} is offline")
+        return UpdateFailed(f"Failed to get status for device {self._device_id}")
+
+    @callback
+    def async_set_online(self, online):
+        """Handle the device going offline or coming back.
+
+        Offline devices become unavailable right away, devices coming back
+        are polled with the next account poll.
+        """
+        if not self._account.async_set_device_online(self._device_id, online):
+            return
+
+        if online:
+            self.hass.async_create_task(self._account.async_request_refresh())
+        else:
+            self.async_set_update_error(self._status_error())
+
+    @callback
+    def async_add_code_listener(self, code, update_callback):
+        """Listen for changes of a single code and return a callback to stop."""
+        return self.async_add_listener(update_callback, context=code)
+
+    @callback
+    def async_add_rolling_listener(self, code, windows, update_callback):
+        """Keep rolling aggregates of a code, listen for new samples and return a callback to stop."""
+        if code not in self._rolling:
+            self._rolling[code] = RollingBuffer(windows)
+        remove_listener = self.async_add_listener(update_callback, (ROLLING_CONTEXT, code))
+
+        @callback
+        def remove():
+            remove_listener()
+            if not any(context == (ROLLING_CONTEXT, code) for _, context in self._listeners.values()):
+                self._rolling.pop(code, None)
+
+        return remove
+
+    def rolling_buffer(self, code):
+        """Return the rolling aggregates of a code, or None."""
+        return self._rolling.get(code)
+
+    @callback
+    def _sample(self):
+        """Add the numeric values of a new snapshot to the rolling buffers."""
+        data = self.data
+        if not self._rolling or data is None or data is self._sampled_data:
+            return False
+        self._sampled_data = data
+        now = time.monotonic()
+        for code, buffer in self._rolling.items():
+            value = data.get(code)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                buffer.add(now, float(value))
+        return True
+
+    @callback
+    def async_update_listeners(self):
+        """Notify general listeners, the listeners of changed codes and rolling listeners."""
+        sampled = self.last_update_success and self._sample()
+        previous = self._notified_data
+        data = self.data
+        changed = None
+
+        # Availability changes and the first snapshot concern every listener
+        if (
+            self.last_update_success == self._notified_success
+            and previous is not None
+            and data is not None
+        ):
+            changed = {
+                code for code, value in data.items()
+                if code not in previous or previous[code] != value
+            }
+            changed.update(code for code in previous if code not in data)
+            if not changed and not sampled:
+                return
+
+        self._notified_data = data
+        self._notified_success = self.last_update_success
+
+        for update_callback, context in list(self._listeners.values()):
+            if isinstance(context, tuple):
+                notify = sampled or changed is None
+            else:
+                notify = changed is None or (context is None and bool(changed)) or context in changed
+            if notify:
+                update_callback()
+
+    @callback
+    def async_set_converter(self, code, converter):
+        """Set the function that converts the raw value of a code, or remove it."""
+        if converter is None:
+            self._converters.pop(code, None)
+        else:
+            self._converters[code] = converter
+
+    @callback
+    def async_set_status(self, status):
+        """Publish a new snapshot built from a raw status list."""
+        self.async_set_updated_data(self._build_snapshot(status))
+
+    @callback
+    def async_apply_status(self, status):
+        """Merge a partial status list, such as a pushed report, into the snapshot."""
+        # A device that reports is online, whatever the breaker assumed
+        planner = self._account.planner
+        if planner is not None and planner.is_offline(self._device_id):
+            self.async_set_online(True)
+        self.async_set_updated_data(self._build_snapshot(status, self.data))
+
+    def convert(self, code, value):
+        """Convert a raw value of a code, raising TypeError or ValueError if invalid."""
+        converter = self._converters.get(code)
+        return value if converter is None else converter(value)
+
+    def _build_snapshot(self, status, base=None):
+        """Convert a raw status list into a snapshot indexed by code."""
+        converters = self._converters
+        values = dict(base) if base else {}
+        for item in status:
+            code = item.get("code")
+            if code is None:
+                continue
+            value = item.get("value")
+            converter = converters.get(code)
+            if converter is not None:
+                try:
+                    value = converter(value)
+                except (TypeError, ValueError):
+                    _LOGGER.debug("Cannot convert %s value %s of device %s", code, value, self._device_id)
+                    value = None
+            values[code] = value
+        return MappingProxyType(values)
+
+    @callback
+    def async_add_listener(self, update_callback, context=None):
+        """Listen for data updates and join the account polling."""
+        remove_listener = super().async_add_listener(update_callback, context)
+        if self._unsub_sources is None:
+            unsub_account = self._account.async_register_device(self)
+            unsub_push = async_dispatcher_connect(
+                self.hass,
+                SIGNAL_DEVICE_STATUS.format(self._device_id),
+                self.async_apply_status,
+            )
+            unsub_online = async_dispatcher_connect(
+                self.hass,
+                SIGNAL_DEVICE_ONLINE.format(self._device_id),
+                self.async_set_online,
+            )
+            self._unsub_sources = (unsub_account, unsub_push, unsub_online)
+
+        @callback
+        def remove():
+            remove_listener()
+            if not self._listeners and self._unsub_sources is not None:
+                for unsub in self._unsub_sources:
+                    unsub()
+                self._unsub_sources = None
+
+        return remove
+
+    async def _async_update_data(self):
+        """Fetch data from the device, or from Tuya API."""
+        # Offline devices are left to the probes of the account coordinator
+        planner = self._account.planner
+        if planner is not None and planner.is_offline(self._device_id):
+            raise self._status_error()
+
+        local_pool = self._account.local_pool
+        if local_pool is not None and self._device_id in local_pool:
+            try:
+                return self._build_snapshot(await local_pool.async_status(self._device_id))
+            except TuyaLocalError as e:
+                _LOGGER.debug("Local status request failed for %s: %s", self._device_id, str(e))
+
+        # Explicitly requested refreshes go ahead of background polling
+        status = await fetch_device_status(
+            self._tuya_api, self._device_id, PRIORITY_INTERACTIVE
+        )
+        return self._build_snapshot(status)
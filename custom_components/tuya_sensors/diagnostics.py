@@ -0,0 +1,36 @@
+"""Diagnostics support for the Tuya sensors integration."""
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.const import CONF_API_KEY
+
+from . import DOMAIN, MANAGERS, CONF_API_SECRET, CONF_LOCAL_DEVICES
+
+TO_REDACT = {CONF_API_KEY, CONF_API_SECRET, CONF_LOCAL_DEVICES}
+
+
+async def async_get_config_entry_diagnostics(hass, entry):
+    """Return diagnostics for a config entry."""
+    diagnostics = {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": async_redact_data(dict(entry.options), TO_REDACT),
+    }
+
+    manager = hass.data.get(DOMAIN, {}).get(MANAGERS, {}).get(entry.entry_id)
+    if manager is None:
+        return diagnostics
+
+    account_coordinator = manager.account_coordinator
+    diagnostics["polling"] = {
+        "update_interval": account_coordinator.update_interval.total_seconds(),
+        "last_update_success": account_coordinator.last_update_success,
+        "push_connected": account_coordinator.push_connected,
+        "last_poll_duration": account_coordinator.last_poll_duration,
+        "poll_latency_ms": account_coordinator.poll_latency.as_dict(),
+    }
+    if account_coordinator.planner is not None:
+        diagnostics["polling"]["planner"] = account_coordinator.planner.as_dict()
+
+    scheduler = account_coordinator.tuya_api.scheduler
+    if scheduler is not None:
+        diagnostics["api"] = scheduler.as_dict()
+
+    return diagnostics
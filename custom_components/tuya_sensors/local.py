@@ -0,0 +1,353 @@
+"""Local LAN access to Tuya devices speaking protocol 3.3 or 3.4."""
+import asyncio
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import struct
+import time
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from .push import SIGNAL_DEVICE_STATUS
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PORT = 6668
+CONNECT_TIMEOUT = 5
+RESPONSE_TIMEOUT = 5
+HEARTBEAT_INTERVAL = 10
+
+PREFIX = 0x000055AA
+SUFFIX = 0x0000AA55
+HEADER = struct.Struct(">4I")
+SUFFIX_BYTES = struct.pack(">I", SUFFIX)
+
+# Commands
+SESS_KEY_NEG_START = 3
+SESS_KEY_NEG_RESP = 4
+SESS_KEY_NEG_FINISH = 5
+STATUS = 8
+HEART_BEAT = 9
+DP_QUERY = 10
+DP_QUERY_NEW = 16
+
+SUPPORTED_VERSIONS = ("3.3", "3.4")
+
+
+class TuyaLocalError(Exception):
+    """Raised when a device cannot be reached or answers garbage."""
+
+
+def _aes_encrypt(key, data, pad=True):
+    """Encrypt with AES-128-ECB, PKCS#7 padded unless pad is False."""
+    if pad:
+        padding = 16 - len(data) % 16
+        data += bytes([padding]) * padding
+    encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+    return encryptor.update(data) + encryptor.finalize()
+
+
+def _aes_decrypt(key, data):
+    """Decrypt AES-128-ECB and strip the PKCS#7 padding."""
+    if not data:
+        return b""
+    decryptor = Cipher(algorithms.AES(key), modes.ECB()).decryptor()
+    data = decryptor.update(data) + decryptor.finalize()
+    padding = data[-1]
+    if 0 < padding <= 16:
+        data = data[:-padding]
+    return data
+
+
+class TuyaLocalDevice:
+    """Persistent TCP connection to one device.
+
+    The connection is opened on first use, kept alive with heartbeats and
+    reopened after errors. Status reports the device sends on its own are
+    dispatched like pushed cloud reports. dps maps data point IDs to the
+    status codes the cloud uses for them.
+    """
+
+    def __init__(self, hass, device_id, host, local_key, version="3.3", port=DEFAULT_PORT, dps=None):
+        """Initialize the device."""
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported Tuya protocol version {version}")
+
+        self.hass = hass
+        self.device_id = device_id
+        self.host = host
+        self.port = port
+        self.version = version
+        self.dps = dps or {}
+        self._local_key = local_key.encode("latin1")
+        self._key = self._local_key
+
+        self._reader = None
+        self._writer = None
+        self._seqno = 0
+        self._tasks = []
+        self._waiters = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        """Return True if the connection is open."""
+        return self._writer is not None
+
+    def matches(self, host, local_key, version, port):
+        """Return True if the device is reached with these settings."""
+        return (self.host, self.port, self.version, self._local_key) == (
+            host, port, version, local_key.encode("latin1")
+        )
+
+    async def async_status(self):
+        """Query the device and return its status as a cloud-style status list."""
+        async with self._lock:
+            if not self.connected:
+                await self._async_connect()
+
+            command = DP_QUERY_NEW if self.version == "3.4" else DP_QUERY
+            try:
+                data = await self._async_request(command, self._query_payload(), command)
+            except TuyaLocalError:
+                await self.async_close()
+                raise
+
+        return self._to_status(data.get("dps", {}))
+
+    async def async_close(self):
+        """Close the connection."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.set_exception(TuyaLocalError("Connection closed"))
+        self._waiters = {}
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._reader = None
+        self._key = self._local_key
+
+    async def _async_connect(self):
+        """Open the connection and negotiate a session key when required."""
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise TuyaLocalError(f"Cannot connect to {self.host}: {e}") from e
+
+        self._tasks = [
+            self.hass.async_create_background_task(
+                self._async_read_loop(), f"tuya_sensors local {self.device_id}"
+            ),
+        ]
+
+        try:
+            if self.version == "3.4":
+                await self._async_negotiate_session_key()
+        except TuyaLocalError:
+            await self.async_close()
+            raise
+
+        self._tasks.append(
+            self.hass.async_create_background_task(
+                self._async_heartbeat_loop(), f"tuya_sensors heartbeat {self.device_id}"
+            )
+        )
+
+    async def _async_negotiate_session_key(self):
+        """Derive the protocol 3.4 session key from two nonces."""
+        local_nonce = os.urandom(16)
+        response = await self._async_request(
+            SESS_KEY_NEG_START, local_nonce, SESS_KEY_NEG_RESP, decode_json=False
+        )
+        remote_nonce, remote_hmac = response[:16], response[16:48]
+
+        expected = hmac.new(self._local_key, local_nonce, hashlib.sha256).digest()
+        if not hmac.compare_digest(remote_hmac, expected):
+            raise TuyaLocalError("Session key negotiation failed, check the local key")
+
+        self._write(
+            SESS_KEY_NEG_FINISH,
+            hmac.new(self._local_key, remote_nonce, hashlib.sha256).digest(),
+        )
+        mixed = bytes(a ^ b for a, b in zip(local_nonce, remote_nonce))
+        self._key = _aes_encrypt(self._local_key, mixed, pad=False)
+
+    def _query_payload(self):
+        """Return the JSON payload of a status query."""
+        return json.dumps(
+            {
+                "gwId": self.device_id,
+                "devId": self.device_id,
+                "uid": self.device_id,
+                "t": str(int(time.time())),
+            },
+            separators=(",", ":"),
+        ).encode("utf8")
+
+    async def _async_request(self, command, payload, response_command, decode_json=True):
+        """Send a command and wait for the response to it."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[response_command] = waiter
+        try:
+            self._write(command, payload)
+            response = await asyncio.wait_for(waiter, RESPONSE_TIMEOUT)
+        except asyncio.TimeoutError as e:
+            raise TuyaLocalError(f"No response from {self.host}") from e
+        except OSError as e:
+            raise TuyaLocalError(f"Error talking to {self.host}: {e}") from e
+        finally:
+            if self._waiters.get(response_command) is waiter:
+                del self._waiters[response_command]
+
+        if not decode_json:
+            return response
+        try:
+            return json.loads(response.decode("utf8")) if response else {}
+        except ValueError as e:
+            raise TuyaLocalError(f"Invalid response from {self.host}") from e
+
+    def _write(self, command, payload):
+        """Encrypt, frame and send a command."""
+        if self._writer is None:
+            raise TuyaLocalError("Not connected")
+
+        self._seqno += 1
+        payload = _aes_encrypt(self._key, payload)
+        check_size = 32 if self.version == "3.4" else 4
+        frame = HEADER.pack(PREFIX, self._seqno, command, len(payload) + check_size + 4) + payload
+
+        if self.version == "3.4":
+            frame += hmac.new(self._key, frame, hashlib.sha256).digest()
+        else:
+            frame += struct.pack(">I", binascii.crc32(frame) & 0xFFFFFFFF)
+        self._writer.write(frame + SUFFIX_BYTES)
+
+    async def _async_read_loop(self):
+        """Read frames, resolve waiting requests and dispatch status reports."""
+        try:
+            while True:
+                header = await self._reader.readexactly(HEADER.size)
+                prefix, _seqno, command, length = HEADER.unpack(header)
+                if prefix != PREFIX:
+                    raise TuyaLocalError("Invalid frame prefix")
+
+                body = await self._reader.readexactly(length)
+                if body[-4:] != SUFFIX_BYTES:
+                    raise TuyaLocalError("Invalid frame suffix")
+
+                check_size = 32 if self.version == "3.4" else 4
+                payload = self._decode_payload(body[:-(check_size + 4)])
+                self._handle_frame(command, payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _LOGGER.debug("Local connection to %s lost: %s", self.device_id, str(e))
+            self.hass.async_create_task(self.async_close())
+
+    def _decode_payload(self, payload):
+        """Strip the return code and version header and decrypt a payload."""
+        version = self.version.encode("ascii")
+
+        # Devices put a 4 byte return code in front of encrypted payloads
+        if payload[:3] != version and len(payload) % 16 in (4, 3):
+            payload = payload[4:]
+        if payload[:3] == version:
+            payload = payload[15:]
+
+        payload = _aes_decrypt(self._key, payload)
+        if payload[:3] == version:
+            payload = payload[15:]
+        return payload
+
+    @callback
+    def _handle_frame(self, command, payload):
+        """Route a received frame."""
+        waiter = self._waiters.get(command)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(payload)
+            return
+
+        if command in (STATUS, DP_QUERY, DP_QUERY_NEW) and payload:
+            try:
+                data = json.loads(payload.decode("utf8"))
+            except ValueError:
+                return
+            dps = data.get("dps") or data.get("data", {}).get("dps") or {}
+            status = self._to_status(dps)
+            if status:
+                async_dispatcher_send(
+                    self.hass, SIGNAL_DEVICE_STATUS.format(self.device_id), status
+                )
+
+    async def _async_heartbeat_loop(self):
+        """Keep the connection open."""
+        payload = json.dumps({"gwId": self.device_id, "devId": self.device_id}).encode("utf8")
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self._async_request(HEART_BEAT, payload, HEART_BEAT, decode_json=False)
+            except TuyaLocalError as e:
+                _LOGGER.debug("Heartbeat to %s failed: %s", self.device_id, str(e))
+                self.hass.async_create_task(self.async_close())
+                return
+
+    def _to_status(self, dps):
+        """Translate data points into a status list using the codes known for them."""
+        return [
+            {"code": self.dps[dp_id], "value": value}
+            for dp_id, value in dps.items()
+            if dp_id in self.dps
+        ]
+
+
+class TuyaLocalPool:
+    """Local connections of all devices of one account coordinator."""
+
+    def __init__(self, hass):
+        """Initialize the pool."""
+        self.hass = hass
+        self._devices = {}
+
+    def __contains__(self, device_id):
+        """Return True if the device is reachable locally."""
+        return device_id in self._devices
+
+    @callback
+    def async_add_device(self, device_id, host, local_key, version, dps, port=DEFAULT_PORT):
+        """Add or update the local connection of a device."""
+        device = self._devices.get(device_id)
+        if device is not None:
+            if device.matches(host, local_key, version, port):
+                device.dps = dps
+                return
+            # A new key, address or protocol version needs a new connection
+            self.hass.async_create_task(device.async_close())
+
+        self._devices[device_id] = TuyaLocalDevice(
+            self.hass, device_id, host, local_key, version, port, dps
+        )
+
+    async def async_status(self, device_id):
+        """Return the status list of a device, raising TuyaLocalError on failure."""
+        status = await self._devices[device_id].async_status()
+        if not status:
+            raise TuyaLocalError(f"No known data points reported by {device_id}")
+        return status
+
+    async def async_close(self):
+        """Close all connections."""
+        await asyncio.gather(*(device.async_close() for device in self._devices.values()))
+        self._devices = {}
@@ -0,0 +1,106 @@
+"""Lightweight instrumentation of Tuya requests and polls."""
+import bisect
+import re
+
+# Upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Path segments that identify a device, product or cursor
+_ID_SEGMENT = re.compile(r"/(devices|thing|token)/(?!status$)[^/]+")
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_ERROR = "error"
+OUTCOME_THROTTLED = "throttled"
+OUTCOME_EXCEPTION = "exception"
+
+
+def endpoint_of(path):
+    """Return the path with IDs replaced by placeholders."""
+    return _ID_SEGMENT.sub(lambda match: f"/{match.group(1)}/{{id}}", path)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in milliseconds."""
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        """Initialize an empty histogram."""
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, duration):
+        """Record a duration in milliseconds."""
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding a percentile, or None."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.maximum
+
+    def as_dict(self):
+        """Return the histogram for diagnostics."""
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 1) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": round(self.maximum, 1),
+            "buckets": dict(
+                zip([*map(str, LATENCY_BUCKETS), "inf"], self.counts)
+            ),
+        }
+
+
+class TuyaRequestMetrics:
+    """Latency and outcome counters of the requests sent per endpoint."""
+
+    def __init__(self):
+        """Initialize empty metrics."""
+        self.latency = LatencyHistogram()
+        self.outcomes = dict.fromkeys(
+            (OUTCOME_SUCCESS, OUTCOME_ERROR, OUTCOME_THROTTLED, OUTCOME_EXCEPTION), 0
+        )
+        self._endpoints = {}
+
+    def record(self, path, duration, outcome):
+        """Record a request that took duration milliseconds."""
+        endpoint = endpoint_of(path)
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = {
+                "latency": LatencyHistogram(),
+                "outcomes": dict.fromkeys(self.outcomes, 0),
+            }
+        stats["latency"].add(duration)
+        stats["outcomes"][outcome] += 1
+        self.latency.add(duration)
+        self.outcomes[outcome] += 1
+
+    def as_dict(self):
+        """Return the metrics for diagnostics."""
+        return {
+            "latency_ms": self.latency.as_dict(),
+            "outcomes": dict(self.outcomes),
+            "endpoints": {
+                endpoint: {
+                    "latency_ms": stats["latency"].as_dict(),
+                    "outcomes": dict(stats["outcomes"]),
+                }
+                for endpoint, stats in sorted(self._endpoints.items())
+            },
+        }
@@ -0,0 +1,344 @@
+"""Adaptive per-device poll intervals."""
+import math
+import random
+import time
+import zlib
+from collections import deque
+
+# Interval factors after a poll with and without a change
+SPEED_UP = 0.5
+SLOW_DOWN = 1.5
+
+# Weight of the latest poll in the observed change rate
+CHANGE_RATE_WEIGHT = 0.2
+
+# Shortest delay between two polls of the account coordinator
+MIN_TICK = 5.0
+
+# Fraction of its interval a due device may wait for its batch to fill up
+BATCH_HOLD = 0.25
+
+# Seconds of issued requests the budget is checked against
+RATE_WINDOW = 60.0
+
+# Consecutive failed polls after which a device is considered offline
+FAILURE_THRESHOLD = 3
+
+# Bounds of the exponential probe delay of offline devices
+PROBE_MIN_DELAY = 300.0
+PROBE_MAX_DELAY = 3600.0
+
+
+class TuyaPollPlanner:
+    """Decide which devices are due for a poll.
+
+    Each device has its own interval between min_interval and max_interval.
+    It is halved when a poll finds the status changed and grows by half
+    when it did not, so volatile devices are polled often and static ones
+    rarely. With a budget of requests per minute, all intervals are
+    stretched by the same factor until the requests fit, estimated from
+    the intervals and corrected by the requests actually issued in the
+    last minute. Intervals are in seconds.
+
+    Polls are placed on a grid of the device's interval, shifted by a phase
+    derived from the device ID, so devices spread evenly over the interval
+    instead of polling in lockstep. jitter adds a random delay of up to
+    that fraction of the interval on top. A partial batch of due devices
+    is held back when enough devices become due to fill it before any of
+    them is late by BATCH_HOLD of its interval, so large fleets send full
+    batches. Devices are never polled ahead of their own grid point to fill
+    a batch, and a batch that cannot fill in time, as in fleets smaller
+    than batch_size, goes out right away.
+
+    A device that fails FAILURE_THRESHOLD polls in a row or is reported
+    offline is taken out of regular polling and only probed with an
+    exponentially growing delay until it answers again.
+    """
+
+    def __init__(
+        self,
+        min_interval,
+        max_interval,
+        requests_per_minute=0,
+        batch_size=1,
+        jitter=0.0,
+    ):
+        """Initialize the planner, a budget of 0 means unlimited."""
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.requests_per_minute = requests_per_minute
+        self._batch_size = batch_size
+        self._jitter = jitter
+        self._devices = {}
+        self._stretch = 1.0
+        self._issued = deque()
+        self._issued_total = 0
+        self._issued_since = None
+
+    def _state(self, device_id):
+        """Return the state of a device, adding it as due right away."""
+        state = self._devices.get(device_id)
+        if state is None:
+            state = self._devices[device_id] = {
+                "interval": self.min_interval,
+                "next_poll": 0.0,
+                "last_poll": None,
+                "last_change": None,
+                "change_rate": 1.0,
+                "status": None,
+                "phase": zlib.crc32(device_id.encode("utf8")) / 2 ** 32,
+                "failures": 0,
+                "probe_delay": None,
+                "lag": 0.0,
+                "duration": None,
+            }
+        return state
+
+    def set_bounds(self, min_interval, max_interval):
+        """Change the interval bounds and return True if they changed.
+
+        Intervals are clamped to the new bounds and polls scheduled beyond
+        the new interval of their device are moved closer.
+        """
+        min_interval = float(min_interval)
+        max_interval = max(float(max_interval), min_interval)
+        if (min_interval, max_interval) == (self.min_interval, self.max_interval):
+            return False
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        now = time.monotonic()
+        for device_id, state in self._devices.items():
+            state["interval"] = min(max(state["interval"], min_interval), max_interval)
+            if state["probe_delay"] is None:
+                state["next_poll"] = min(state["next_poll"], now + self.effective_interval(device_id))
+        return True
+
+    def expedite(self):
+        """Make all online devices due right away."""
+        for state in self._devices.values():
+            if state["probe_delay"] is None:
+                state["next_poll"] = 0.0
+
+    def forget(self, device_id):
+        """Drop the state of a device."""
+        self._devices.pop(device_id, None)
+
+    @property
+    def stretch(self):
+        """Return the factor the budget stretches all intervals by."""
+        return self._stretch
+
+    def _update_stretch(self, now):
+        """Recompute the stretch factor from the intervals and the issued requests."""
+        if not self.requests_per_minute or not self._devices:
+            self._stretch = 1.0
+            return
+
+        polls_per_minute = sum(
+            60 / state["interval"]
+            for state in self._devices.values()
+            if state["probe_delay"] is None
+        )
+        requests = polls_per_minute / self._batch_size
+
+        # Requests issued at the current stretch, scaled back to no stretch
+        measured = self.requests_issued(now)
+        if measured is not None:
+            requests = max(requests, measured * self._stretch)
+        self._stretch = max(requests / self.requests_per_minute, 1.0)
+
+    def _count_requests(self, count, now):
+        """Remember the requests issued for one poll."""
+        if self._issued_since is None:
+            self._issued_since = now
+        if count:
+            self._issued.append((now, count))
+            self._issued_total += count
+
+    def requests_issued(self, now=None):
+        """Return the requests issued per minute, or None before a full window."""
+        now = time.monotonic() if now is None else now
+        while self._issued and self._issued[0][0] <= now - RATE_WINDOW:
+            self._issued_total -= self._issued.popleft()[1]
+        if self._issued_since is None or now - self._issued_since < RATE_WINDOW:
+            return None
+        return self._issued_total * 60 / RATE_WINDOW
+
+    def _deadline(self, device_id, state):
+        """Return when a due device stops waiting for its batch to fill up."""
+        return state["next_poll"] + BATCH_HOLD * self.effective_interval(device_id)
+
+    def effective_interval(self, device_id):
+        """Return the interval a device is currently polled at."""
+        interval = self._state(device_id)["interval"] * self._stretch
+        return min(interval, self.max_interval)
+
+    @property
+    def offline_count(self):
+        """Return the number of devices that are only being probed."""
+        return sum(state["probe_delay"] is not None for state in self._devices.values())
+
+    def is_offline(self, device_id):
+        """Return True if the device is only being probed."""
+        state = self._devices.get(device_id)
+        return state is not None and state["probe_delay"] is not None
+
+    def due(self, device_ids, now=None, reconcile=False):
+        """Return the devices that should be polled now.
+
+        When reconciling, all online devices are due regardless of their
+        schedule, offline devices still wait for their next probe.
+        """
+        now = time.monotonic() if now is None else now
+        for device_id in device_ids:
+            self._state(device_id)
+        self._update_stretch(now)
+
+        ready = []
+        probes = []
+        upcoming = []
+        for device_id in device_ids:
+            state = self._devices[device_id]
+            if state["probe_delay"] is not None:
+                if state["next_poll"] <= now:
+                    probes.append(device_id)
+            elif reconcile or state["next_poll"] <= now:
+                ready.append(device_id)
+            else:
+                upcoming.append(device_id)
+
+        batch_size = self._batch_size
+        partial = len(ready) % batch_size
+        if partial and not reconcile:
+            devices = self._devices
+            # The most overdue devices go first, the newest ones may wait
+            ready.sort(key=lambda device_id: devices[device_id]["next_poll"])
+            held = ready[len(ready) - partial:]
+            deadline = min(self._deadline(device_id, devices[device_id]) for device_id in held)
+            filling = sum(devices[device_id]["next_poll"] <= deadline for device_id in upcoming)
+            if now < deadline and filling >= batch_size - partial:
+                del ready[len(ready) - partial:]
+
+        due = ready + probes
+        for device_id in due:
+            state = self._devices[device_id]
+            # How late the poll starts compared to its schedule
+            state["lag"] = max(now - state["next_poll"], 0.0) if state["next_poll"] else 0.0
+        self._count_requests(math.ceil(len(ready) / batch_size) + len(probes), now)
+        return due
+
+    def record(self, device_id, status, now=None, duration=None):
+        """Adapt the interval of a device to the result of a poll."""
+        now = time.monotonic() if now is None else now
+        state = self._state(device_id)
+        state["duration"] = duration
+        previous = state["status"]
+        changed = previous is not None and previous != status
+
+        if previous is not None:
+            state["change_rate"] += CHANGE_RATE_WEIGHT * (changed - state["change_rate"])
+            factor = SPEED_UP if changed else SLOW_DOWN
+            state["interval"] = min(
+                max(state["interval"] * factor, self.min_interval), self.max_interval
+            )
+        if changed:
+            state["last_change"] = now
+
+        state["failures"] = 0
+        state["probe_delay"] = None
+        state["status"] = status
+        state["last_poll"] = now
+        self._schedule(device_id, state, now)
+
+    def record_failure(self, device_id, now=None, duration=None):
+        """Retry a failed device later and return True if it just went offline."""
+        now = time.monotonic() if now is None else now
+        state = self._state(device_id)
+        state["duration"] = duration
+        state["failures"] += 1
+        if state["probe_delay"] is not None or state["failures"] >= FAILURE_THRESHOLD:
+            return self.mark_offline(device_id, now)
+
+        self._schedule(device_id, state, now)
+        return False
+
+    def mark_offline(self, device_id, now=None):
+        """Switch a device to probing and return True if it was online."""
+        now = time.monotonic() if now is None else now
+        state = self._state(device_id)
+        went_offline = state["probe_delay"] is None
+        if went_offline:
+            state["probe_delay"] = PROBE_MIN_DELAY
+        else:
+            state["probe_delay"] = min(state["probe_delay"] * 2, PROBE_MAX_DELAY)
+        state["next_poll"] = now + state["probe_delay"]
+        return went_offline
+
+    def mark_online(self, device_id):
+        """Return a device to regular polling and return True if it was offline."""
+        state = self._state(device_id)
+        if state["probe_delay"] is None:
+            return False
+
+        state["failures"] = 0
+        state["probe_delay"] = None
+        state["next_poll"] = 0.0
+        return True
+
+    def _schedule(self, device_id, state, now):
+        """Set the next poll to the device's next grid point within one interval."""
+        interval = self.effective_interval(device_id)
+        offset = state["phase"] * interval
+        next_poll = math.floor((now + interval - offset) / interval) * interval + offset
+        # Devices polled ahead of schedule skip the grid point they were due at
+        if next_poll <= max(now, state["next_poll"]):
+            next_poll += interval
+        if self._jitter:
+            next_poll += random.uniform(0, self._jitter * interval)
+        state["next_poll"] = next_poll
+
+    def next_delay(self, now=None):
+        """Return the seconds until a device is due or a held device is late."""
+        now = time.monotonic() if now is None else now
+        if not self._devices:
+            return self.min_interval
+
+        wake = [
+            self._deadline(device_id, state)
+            if state["probe_delay"] is None and state["next_poll"] <= now
+            else state["next_poll"]
+            for device_id, state in self._devices.items()
+        ]
+        return min(max(min(wake) - now, MIN_TICK), self.min_interval)
+
+    def as_dict(self, now=None):
+        """Return the per-device intervals for diagnostics."""
+        now = time.monotonic() if now is None else now
+        return {
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "requests_per_minute": self.requests_per_minute,
+            "stretch": round(self.stretch, 3),
+            "requests_per_minute_issued": self.requests_issued(now),
+            "jitter": self._jitter,
+            "devices": {
+                device_id: {
+                    "interval": round(self.effective_interval(device_id), 1),
+                    "change_rate": round(state["change_rate"], 3),
+                    "phase": round(state["phase"], 3),
+                    "probe_delay": state["probe_delay"],
+                    "failures": state["failures"],
+                    "lag": round(state["lag"], 1),
+                    "poll_duration": (
+                        None if state["duration"] is None else round(state["duration"], 3)
+                    ),
+                    "next_poll_in": round(max(state["next_poll"] - now, 0.0), 1),
+                    "last_change_ago": (
+                        None if state["last_change"] is None
+                        else round(now - state["last_change"], 1)
+                    ),
+                }
+                for device_id, state in self._devices.items()
+            },
+        }
@@ -0,0 +1,226 @@
+"""Push updates from the Tuya Cloud message queue."""
+from abc import ABC, abstractmethod
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+
+import aiohttp
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+_LOGGER = logging.getLogger(__name__)
+
+# Dispatcher signals, formatted with the device ID and the access ID
+SIGNAL_DEVICE_STATUS = "tuya_sensors_status_{}"
+SIGNAL_DEVICE_ONLINE = "tuya_sensors_online_{}"
+SIGNAL_PUSH_STATE = "tuya_sensors_push_{}"
+
+PUSH_ENDPOINTS = {
+    "us": "wss://mqe.tuyaus.com:8285/",
+    "eu": "wss://mqe.tuyaeu.com:8285/",
+    "cn": "wss://mqe.tuyacn.com:8285/",
+    "in": "wss://mqe.tuyain.com:8285/",
+}
+
+# Message protocols carrying device status reports and device events
+PROTOCOL_STATUS = 4
+PROTOCOL_EVENT = 20
+
+# Device events telling that a device went online or offline
+ONLINE_EVENTS = {"online": True, "offline": False}
+
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+
+class TuyaMessageTransport(ABC):
+    """Connection to a message broker that yields raw Tuya messages.
+
+    A message is a dict with at least "messageId" and "payload". Subclass
+    this to run the push client against something other than the Tuya
+    Pulsar websocket.
+    """
+
+    @abstractmethod
+    async def async_connect(self):
+        """Open the connection."""
+
+    @abstractmethod
+    async def async_receive(self):
+        """Return the next message, or None when the connection closed."""
+
+    @abstractmethod
+    async def async_ack(self, message_id):
+        """Acknowledge a message."""
+
+    @abstractmethod
+    async def async_close(self):
+        """Close the connection."""
+
+
+class PulsarWebsocketTransport(TuyaMessageTransport):
+    """Tuya's Pulsar message queue over a websocket."""
+
+    def __init__(self, session, endpoint, access_id, access_secret, env="event"):
+        """Initialize the transport."""
+        self._session = session
+        self._url = (
+            f"{endpoint}ws/v2/consumer/persistent/{access_id}/out/{env}/"
+            f"{access_id}-sub?ackTimeoutMillis=3000&subscriptionType=Failover"
+        )
+        secret_md5 = hashlib.md5(access_secret.encode("utf8")).hexdigest()
+        self._headers = {
+            "username": access_id,
+            "password": hashlib.md5((access_id + secret_md5).encode("utf8")).hexdigest()[8:24],
+        }
+        self._ws = None
+
+    async def async_connect(self):
+        """Open the websocket."""
+        self._ws = await self._session.ws_connect(
+            self._url, headers=self._headers, heartbeat=30
+        )
+
+    async def async_receive(self):
+        """Return the next message, or None when the websocket closed."""
+        while True:
+            msg = await self._ws.receive()
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                return json.loads(msg.data)
+            if msg.type in (
+                aiohttp.WSMsgType.CLOSE,
+                aiohttp.WSMsgType.CLOSED,
+                aiohttp.WSMsgType.CLOSING,
+                aiohttp.WSMsgType.ERROR,
+            ):
+                return None
+
+    async def async_ack(self, message_id):
+        """Acknowledge a message."""
+        await self._ws.send_json({"messageId": message_id})
+
+    async def async_close(self):
+        """Close the websocket."""
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+
+
+def decrypt_message(message, access_secret):
+    """Decode and decrypt the payload of a raw message."""
+    payload = json.loads(base64.b64decode(message["payload"]).decode("utf8"))
+    data = base64.b64decode(payload["data"])
+    key = access_secret[8:24].encode("utf8")
+
+    if message.get("properties", {}).get("em") == "aes_gcm":
+        decrypted = AESGCM(key).decrypt(data[:12], data[12:], None)
+    else:
+        decryptor = Cipher(algorithms.AES(key), modes.ECB()).decryptor()
+        decrypted = decryptor.update(data) + decryptor.finalize()
+        decrypted = decrypted[:-decrypted[-1]]
+
+    return payload.get("protocol"), json.loads(decrypted.decode("utf8"))
+
+
+class TuyaPushClient:
+    """Consume the message queue and dispatch device status reports.
+
+    Status reports are sent as SIGNAL_DEVICE_STATUS with the device's status
+    list, online and offline events as SIGNAL_DEVICE_ONLINE with a bool, and
+    connection changes as SIGNAL_PUSH_STATE with a bool.
+    """
+
+    def __init__(self, hass, access_id, access_secret, transport):
+        """Initialize the push client."""
+        self.hass = hass
+        self._access_id = access_id
+        self._access_secret = access_secret
+        self._transport = transport
+        self._task = None
+        self.connected = False
+
+    @callback
+    def async_start(self):
+        """Start consuming in the background."""
+        if self._task is None:
+            self._task = self.hass.async_create_background_task(
+                self._async_run(), "tuya_sensors push"
+            )
+
+    async def async_stop(self):
+        """Stop consuming and close the connection."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._transport.async_close()
+        self._set_connected(False)
+
+    @callback
+    def _set_connected(self, connected):
+        """Update and announce the connection state."""
+        if connected != self.connected:
+            self.connected = connected
+            async_dispatcher_send(self.hass, SIGNAL_PUSH_STATE.format(self._access_id), connected)
+
+    async def _async_run(self):
+        """Keep a connection open, reconnecting with backoff."""
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            try:
+                await self._transport.async_connect()
+                _LOGGER.debug("Connected to the Tuya message queue")
+                self._set_connected(True)
+                delay = RECONNECT_MIN_DELAY
+                await self._async_consume()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _LOGGER.warning("Tuya message queue connection failed: %s", str(e))
+
+            self._set_connected(False)
+            try:
+                await self._transport.async_close()
+            except Exception:
+                pass
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _async_consume(self):
+        """Handle messages until the connection closes."""
+        while (message := await self._transport.async_receive()) is not None:
+            message_id = message.get("messageId")
+            try:
+                protocol, data = decrypt_message(message, self._access_secret)
+            except Exception as e:
+                _LOGGER.debug("Cannot decode Tuya message %s: %s", message_id, str(e))
+            else:
+                self._handle_data(protocol, data)
+
+            if message_id is not None:
+                await self._transport.async_ack(message_id)
+
+    @callback
+    def _handle_data(self, protocol, data):
+        """Dispatch a decrypted message."""
+        device_id = data.get("devId")
+        if not device_id:
+            return
+
+        if protocol == PROTOCOL_EVENT and data.get("bizCode") in ONLINE_EVENTS:
+            online = ONLINE_EVENTS[data["bizCode"]]
+            _LOGGER.debug("Device %s went %s", device_id, data["bizCode"])
+            async_dispatcher_send(self.hass, SIGNAL_DEVICE_ONLINE.format(device_id), online)
+            return
+
+        if protocol != PROTOCOL_STATUS:
+            return
+
+        status = data.get("status") or []
+        _LOGGER.debug("Pushed status for device %s: %s", device_id, status)
+        async_dispatcher_send(self.hass, SIGNAL_DEVICE_STATUS.format(device_id), status)
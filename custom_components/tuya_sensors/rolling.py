@@ -0,0 +1,140 @@
+"""Rolling aggregates of the recent values of a status code."""
+from array import array
+from collections import deque
+
+# Samples kept per code, enough for an hour of polls every 5 seconds
+ROLLING_CAPACITY = 720
+
+# Longer gaps between samples, like an outage, are not integrated
+MAX_INTEGRATION_GAP = 3600
+
+
+class _Window:
+    """Aggregates of the samples of a ring buffer within a time window.
+
+    The window holds the samples from sequence number start to the newest
+    one. Its time-weighted total and the monotonic queues of the minimum
+    and maximum are updated as samples enter and leave, so every sample
+    costs amortized O(1).
+    """
+
+    __slots__ = ("duration", "start", "area", "minimums", "maximums")
+
+    def __init__(self, duration):
+        """Initialize an empty window of duration seconds."""
+        self.duration = duration
+        self.start = 0
+        self.area = 0.0
+        self.minimums = deque()
+        self.maximums = deque()
+
+
+class RollingBuffer:
+    """Fixed-size ring buffer of the timestamped samples of one code.
+
+    Samples live in two preallocated arrays, so memory is bounded by the
+    capacity whatever the poll rate. Each window keeps incremental
+    aggregates over the same buffer, and the integral of all samples over
+    time is kept in value hours, for energy from power.
+    """
+
+    def __init__(self, windows, capacity=ROLLING_CAPACITY):
+        """Initialize the buffer for windows given in seconds."""
+        self._capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._count = 0
+        self._windows = {duration: _Window(duration) for duration in windows}
+        self.integral = 0.0
+
+    def __len__(self):
+        """Return the number of samples held."""
+        return min(self._count, self._capacity)
+
+    def add(self, timestamp, value):
+        """Add a sample taken at a monotonic timestamp in seconds."""
+        times = self._times
+        values = self._values
+        capacity = self._capacity
+        seq = self._count
+
+        if seq:
+            previous = (seq - 1) % capacity
+            gap = timestamp - times[previous]
+            if 0 < gap <= MAX_INTEGRATION_GAP:
+                self.integral += (values[previous] + value) / 2 * gap / 3600
+
+            for window in self._windows.values():
+                # The sample about to be overwritten leaves every window
+                while window.start <= seq - capacity:
+                    self._evict(window)
+                # The previous sample's segment now has an end
+                window.area += values[previous] * gap
+
+        index = seq % capacity
+        times[index] = timestamp
+        values[index] = value
+        self._count = seq + 1
+
+        for window in self._windows.values():
+            while window.minimums and values[window.minimums[-1] % capacity] >= value:
+                window.minimums.pop()
+            window.minimums.append(seq)
+            while window.maximums and values[window.maximums[-1] % capacity] <= value:
+                window.maximums.pop()
+            window.maximums.append(seq)
+
+            # Samples leave once the next one is older than the window
+            cutoff = timestamp - window.duration
+            while window.start < seq and times[(window.start + 1) % capacity] <= cutoff:
+                self._evict(window)
+
+            # Counter float drift whenever the window is down to one sample
+            if window.start == seq:
+                window.area = 0.0
+
+    def _evict(self, window):
+        """Remove the oldest sample, which has a successor, from a window."""
+        capacity = self._capacity
+        start = window.start % capacity
+        window.area -= self._values[start] * (
+            self._times[(window.start + 1) % capacity] - self._times[start]
+        )
+        window.start += 1
+        if window.minimums[0] < window.start:
+            window.minimums.popleft()
+        if window.maximums[0] < window.start:
+            window.maximums.popleft()
+
+    def mean(self, duration):
+        """Return the time-weighted mean of a window, or None."""
+        window = self._windows[duration]
+        if not self._count:
+            return None
+        newest = (self._count - 1) % self._capacity
+        span = self._times[newest] - self._times[window.start % self._capacity]
+        if span <= 0:
+            return self._values[newest]
+        return window.area / span
+
+    def minimum(self, duration):
+        """Return the minimum of a window, or None."""
+        window = self._windows[duration]
+        return self._values[window.minimums[0] % self._capacity] if self._count else None
+
+    def maximum(self, duration):
+        """Return the maximum of a window, or None."""
+        window = self._windows[duration]
+        return self._values[window.maximums[0] % self._capacity] if self._count else None
+
+    def rate(self, duration):
+        """Return the change per hour over a window, or None."""
+        window = self._windows[duration]
+        if not self._count:
+            return None
+        newest = (self._count - 1) % self._capacity
+        start = window.start % self._capacity
+        span = self._times[newest] - self._times[start]
+        if span <= 0:
+            return None
+        return (self._values[newest] - self._values[start]) / span * 3600
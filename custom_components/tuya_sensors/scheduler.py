@@ -0,0 +1,245 @@
+"""Quota-aware scheduling of Tuya Cloud requests."""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from .metrics import (
+    OUTCOME_ERROR,
+    OUTCOME_EXCEPTION,
+    OUTCOME_SUCCESS,
+    OUTCOME_THROTTLED,
+    TuyaRequestMetrics,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Priority lanes, lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DISCOVERY = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_BULK = 3
+
+# Tuya error codes returned when requests are throttled or the quota is used up
+RATE_LIMIT_CODES = (1110, 28841004)
+
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+MAX_RETRIES = 3
+
+
+class TuyaQuotaExceededError(Exception):
+    """Raised when the daily request budget is used up."""
+
+
+class _Request:
+    """Lane of a request and its place in the queue while it waits."""
+
+    __slots__ = ("priority", "waiter")
+
+    def __init__(self, priority):
+        """Initialize the request in a lane."""
+        self.priority = priority
+        self.waiter = None
+
+
+class TuyaRequestScheduler:
+    """Shared gate for all requests made with one API key in one region.
+
+    Requests wait for a token from a token bucket refilled at a fixed rate
+    per second and for a free slot among max_in_flight concurrent requests,
+    are served in priority order, count against an optional daily budget,
+    and are held back with exponential backoff and jitter while Tuya is
+    throttling. Identical GET requests that are in flight at the same time
+    are sent only once, in the lane of the most urgent caller.
+    """
+
+    def __init__(
+        self,
+        hass,
+        requests_per_second,
+        requests_per_day=0,
+        max_in_flight=0,
+    ):
+        """Initialize the scheduler, a daily budget or in-flight cap of 0 means unlimited."""
+        self.hass = hass
+        self._rate = float(requests_per_second)
+        self._capacity = max(float(requests_per_second), 1.0)
+        self._tokens = self._capacity
+        self._refilled = time.monotonic()
+        self._daily_limit = requests_per_day
+
+        self.requests_today = 0
+        self._day = time.strftime("%Y-%m-%d", time.gmtime())
+        self.metrics = TuyaRequestMetrics()
+
+        self._backoff = 0.0
+        self._blocked_until = 0.0
+
+        self._max_in_flight = max_in_flight
+        self.active = 0
+        self._slot_freed = asyncio.Event()
+
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._dispatcher = None
+        self._in_flight = {}
+
+    async def async_request(self, method, path, params, send, priority=PRIORITY_BACKGROUND):
+        """Send a request through the scheduler.
+
+        send is a coroutine function that performs the actual request and
+        returns the decoded response.
+        """
+        if method != "GET":
+            return await self._async_send(path, send, _Request(priority))
+
+        key = (path, tuple(sorted((params or {}).items())))
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            request = _Request(priority)
+            future = asyncio.ensure_future(self._async_send(path, send, request))
+            self._in_flight[key] = (future, request)
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            future, request = in_flight
+            if priority < request.priority:
+                self._raise_priority(request, priority)
+
+        return await asyncio.shield(future)
+
+    def _raise_priority(self, request, priority):
+        """Move a shared request to a more urgent lane."""
+        request.priority = priority
+        waiter = request.waiter
+        if waiter is not None and not waiter.done():
+            # The entry in the old lane is skipped once the waiter is done
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+
+    async def _async_send(self, path, send, request):
+        """Send a request, retrying with backoff while throttled."""
+        for attempt in range(MAX_RETRIES + 1):
+            await self._async_acquire(request)
+            started = time.monotonic()
+            try:
+                response = await send()
+            except Exception:
+                self.metrics.record(path, (time.monotonic() - started) * 1000, OUTCOME_EXCEPTION)
+                raise
+            finally:
+                self._release()
+
+            duration = (time.monotonic() - started) * 1000
+            if response.get("code") not in RATE_LIMIT_CODES:
+                self.metrics.record(
+                    path,
+                    duration,
+                    OUTCOME_SUCCESS if response.get("success", False) else OUTCOME_ERROR,
+                )
+                self._backoff = 0.0
+                return response
+
+            self.metrics.record(path, duration, OUTCOME_THROTTLED)
+
+            self._throttled()
+            _LOGGER.debug(
+                "Tuya throttled a request (attempt %d), backing off %.1fs: %s",
+                attempt + 1,
+                self._backoff,
+                response,
+            )
+
+        return response
+
+    def _throttled(self):
+        """Extend the backoff after a throttled response."""
+        self._backoff = min(max(self._backoff * 2, BACKOFF_BASE), BACKOFF_MAX)
+        delay = self._backoff * random.uniform(0.5, 1.0)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    async def _async_acquire(self, request):
+        """Wait until the request may be sent."""
+        self._count_request()
+
+        waiter = request.waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (request.priority, next(self._sequence), waiter))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = self.hass.async_create_background_task(
+                self._async_dispatch(), "tuya_sensors request scheduler"
+            )
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The slot was taken just before the request was cancelled
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        """Free the slot of a finished request."""
+        self.active -= 1
+        self._slot_freed.set()
+
+    def _count_request(self):
+        """Count a request against the daily budget."""
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        if today != self._day:
+            self._day = today
+            self.requests_today = 0
+
+        if self._daily_limit and self.requests_today >= self._daily_limit:
+            raise TuyaQuotaExceededError(
+                f"Daily budget of {self._daily_limit} Tuya requests is used up"
+            )
+        self.requests_today += 1
+
+    async def _async_dispatch(self):
+        """Release waiting requests in priority order as tokens become available."""
+        while self._waiters:
+            # Skip requests that were cancelled while waiting
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+
+            if self._max_in_flight and self.active >= self._max_in_flight:
+                self._slot_freed.clear()
+                await self._slot_freed.wait()
+                continue
+
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self._rate)
+            self._refilled = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                continue
+
+            self._tokens -= 1
+            self.active += 1
+            heapq.heappop(self._waiters)[2].set_result(None)
+
+    def as_dict(self):
+        """Return the quota usage and request metrics for diagnostics."""
+        return {
+            "requests_today": self.requests_today,
+            "requests_per_day": self._daily_limit,
+            "requests_per_second": self._rate,
+            "active": self.active,
+            "max_in_flight": self._max_in_flight,
+            "queued": len(self._waiters),
+            "backoff": self._backoff,
+            "requests": self.metrics.as_dict(),
+        }
+
+    def async_shutdown(self):
+        """Stop dispatching and fail all waiting requests."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        while self._waiters:
+            heapq.heappop(self._waiters)[2].cancel()
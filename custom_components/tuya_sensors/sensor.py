@@ -1,77 +1,103 @@
 """Sensor platform for Tuya sensors integration."""
-import logging
 from datetime import timedelta
 import re
 import asyncio
+import json
 
 from homeassistant.components.sensor import (
-    SensorDeviceClass,
+    RestoreSensor,
     SensorEntity,
+    SensorDeviceClass,
     SensorStateClass,
 )
 from homeassistant.const import (
-    UnitOfTemperature,
-    UnitOfElectricPotential,
-    UnitOfElectricCurrent,
+    CONF_DEVICE_ID,
+    CONF_HOST,
+    CONF_PORT,
+    EVENT_HOMEASSISTANT_STOP,
     UnitOfPower,
     UnitOfEnergy,
-    PERCENTAGE,
-    UnitOfPressure,
     UnitOfTime,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
-
-from . import DOMAIN, _LOGGER, CONF_INCLUDE_SENSORS, CONF_EXCLUDE_SENSORS
-
-# Mapping of Tuya codes to Home Assistant sensor types
-# This is a starting point and can be expanded
-SENSOR_TYPES = {
-    # Temperature
-    "temp_current": {"name": "Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT},
-    "temperature": {"name": "Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT},
-    "temp_indoor": {"name": "Indoor Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT},
-    "Tin": {"name": "Indoor Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT},
-    "ToutCh1": {"name": "Outdoor Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT},
-    "temp_outdoor": {"name": "Outdoor Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT},
-    
-    # Humidity
-    "humidity": {"name": "Humidity", "device_class": SensorDeviceClass.HUMIDITY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
-    "humidity_indoor": {"name": "Indoor Humidity", "device_class": SensorDeviceClass.HUMIDITY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
-    "Hin": {"name": "Indoor Humidity", "device_class": SensorDeviceClass.HUMIDITY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
-    "HoutCh1": {"name": "Outdoor Humidity", "device_class": SensorDeviceClass.HUMIDITY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
-    "humidity_outdoor": {"name": "Outdoor Humidity", "device_class": SensorDeviceClass.HUMIDITY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
-    
-    # Power
-    "cur_power": {"name": "Current Power", "device_class": SensorDeviceClass.POWER, "unit": UnitOfPower.WATT, "state_class": SensorStateClass.MEASUREMENT},
-    "add_ele": {"name": "Power Consumption", "device_class": SensorDeviceClass.ENERGY, "unit": UnitOfEnergy.KILO_WATT_HOUR, "state_class": SensorStateClass.TOTAL_INCREASING},
-    
-    # Voltage/Current
-    "cur_voltage": {"name": "Voltage", "device_class": SensorDeviceClass.VOLTAGE, "unit": UnitOfElectricPotential.VOLT, "state_class": SensorStateClass.MEASUREMENT},
-    "cur_current": {"name": "Current", "device_class": SensorDeviceClass.CURRENT, "unit": UnitOfElectricCurrent.AMPERE, "state_class": SensorStateClass.MEASUREMENT},
-    
-    # Battery
-    "battery_percentage": {"name": "Battery", "device_class": SensorDeviceClass.BATTERY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
-    "battery_state": {"name": "Battery State", "device_class": None, "unit": None, "state_class": None},
-    
-    # CO2, VOC, PM2.5
-    "co2_value": {"name": "CO2", "device_class": SensorDeviceClass.CO2, "unit": "ppm", "state_class": SensorStateClass.MEASUREMENT},
-    "pm25_value": {"name": "PM2.5", "device_class": SensorDeviceClass.PM25, "unit": "μg/m³", "state_class": SensorStateClass.MEASUREMENT},
-    "voc_value": {"name": "VOC", "device_class": SensorDeviceClass.VOLATILE_ORGANIC_COMPOUNDS, "unit": "ppb", "state_class": SensorStateClass.MEASUREMENT},
-    
-    # Illuminance
-    "bright_value": {"name": "Brightness", "device_class": SensorDeviceClass.ILLUMINANCE, "unit": "lx", "state_class": SensorStateClass.MEASUREMENT},
-    
-    # Pressure
-    "pressure": {"name": "Pressure", "device_class": SensorDeviceClass.PRESSURE, "unit": UnitOfPressure.HPA, "state_class": SensorStateClass.MEASUREMENT},
-    
-    # Generic
-    "countdown": {"name": "Countdown", "device_class": SensorDeviceClass.DURATION, "unit": UnitOfTime.SECONDS, "state_class": SensorStateClass.MEASUREMENT},
-    "filter_life": {"name": "Filter Life", "device_class": None, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT},
+
+from . import (
+    DOMAIN,
+    _LOGGER,
+    CONF_BACKFILL,
+    CONF_CATEGORIES,
+    CONF_DIAGNOSTIC_SENSORS,
+    CONF_ROLLING_SENSORS,
+    CONF_ROLLING_STATISTICS,
+    CONF_ROLLING_WINDOWS,
+    CONF_SENSOR_TYPES_FILE,
+    DEFAULT_ROLLING_WINDOWS,
+    ROLLING_STATISTICS,
+    CONF_INCLUDE_SENSORS,
+    CONF_EXCLUDE_SENSORS,
+    CONF_DISCOVERY_CONCURRENCY,
+    CONF_DPS,
+    CONF_LOCAL_DEVICES,
+    CONF_LOCAL_KEY,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_MIN_POLL_INTERVAL,
+    CONF_POLL_JITTER,
+    CONF_PROTOCOL_VERSION,
+    CONF_PUSH,
+    CONF_PUSH_ENDPOINT,
+    CONF_REQUESTS_PER_MINUTE,
+    MANAGERS,
+    CONF_DEVICE_IDS,
+    DEFAULT_DISCOVERY_CONCURRENCY,
+    DEFAULT_POLL_JITTER,
+    DEFAULT_RECONCILE_INTERVAL,
+    DEFAULT_REQUESTS_PER_MINUTE,
+)
+from .backfill import TuyaStatisticsBackfill
+from .cache import TuyaDeviceCache
+from .classification import async_load_classifier
+from .conversion import RAW_PLAN, build_conversion_plan
+from .coordinator import BATCH_STATUS_LIMIT, TuyaAccountCoordinator, TuyaDataCoordinator
+from .local import DEFAULT_PORT as DEFAULT_LOCAL_PORT, TuyaLocalPool
+from .metrics import OUTCOME_ERROR, OUTCOME_EXCEPTION, OUTCOME_THROTTLED
+from .polling import TuyaPollPlanner
+from .push import SIGNAL_PUSH_STATE
+from .scheduler import PRIORITY_DISCOVERY
+from .session import async_acquire_session, async_release_session
+
+# Number of discovered entities collected before they are added to Home Assistant
+ENTITY_BATCH_SIZE = 25
+
+# Optional diagnostic sensors of the account, computed from the account coordinator
+DIAGNOSTIC_SENSOR_TYPES = {
+    "requests_today": {"name": "API Requests Today", "device_class": None, "unit": None, "state_class": SensorStateClass.TOTAL_INCREASING, "value": lambda account: account.tuya_api.scheduler.requests_today},
+    "api_latency_p90": {"name": "API Latency p90", "device_class": SensorDeviceClass.DURATION, "unit": UnitOfTime.MILLISECONDS, "state_class": SensorStateClass.MEASUREMENT, "value": lambda account: account.tuya_api.scheduler.metrics.latency.percentile(0.9)},
+    "api_errors": {"name": "API Errors", "device_class": None, "unit": None, "state_class": SensorStateClass.TOTAL_INCREASING, "value": lambda account: account.tuya_api.scheduler.metrics.outcomes[OUTCOME_ERROR] + account.tuya_api.scheduler.metrics.outcomes[OUTCOME_EXCEPTION]},
+    "api_throttled": {"name": "API Throttled Requests", "device_class": None, "unit": None, "state_class": SensorStateClass.TOTAL_INCREASING, "value": lambda account: account.tuya_api.scheduler.metrics.outcomes[OUTCOME_THROTTLED]},
+    "poll_duration": {"name": "Poll Duration", "device_class": SensorDeviceClass.DURATION, "unit": UnitOfTime.MILLISECONDS, "state_class": SensorStateClass.MEASUREMENT, "value": lambda account: None if account.last_poll_duration is None else round(account.last_poll_duration * 1000)},
+    "offline_devices": {"name": "Offline Devices", "device_class": None, "unit": None, "state_class": SensorStateClass.MEASUREMENT, "value": lambda account: account.planner.offline_count if account.planner is not None else None},
+}
+
+# Statistics derived from the rolling aggregates of a code
+ROLLING_SENSOR_TYPES = {
+    "mean": {"name": "Mean", "value": lambda buffer, window: buffer.mean(window)},
+    "min": {"name": "Min", "value": lambda buffer, window: buffer.minimum(window)},
+    "max": {"name": "Max", "value": lambda buffer, window: buffer.maximum(window)},
+    "rate": {"name": "Change Rate", "value": lambda buffer, window: buffer.rate(window)},
 }
 
+# Energy integrated from power, in kWh per value hour of the power unit
+ENERGY_FACTORS = {UnitOfPower.WATT: 0.001, UnitOfPower.KILO_WATT: 1}
+
+# Paged device list of the account and the largest page it returns
+DEVICE_LIST_PATH = "/v1.0/iot-01/associated-users/devices"
+DEVICE_PAGE_SIZE = 100
+
 async def async_setup_platform(
     hass,
     config,
@@ -89,245 +115,718 @@ async def async_setup_entry(
 ) -> None:
     # Get config from hass.data
     domain_config = hass.data[DOMAIN].get(entry.entry_id)
-    await _async_setup(hass, domain_config, async_add_entities)
+    await _async_setup(hass, domain_config, async_add_entities, entry)
+
+def _seconds(interval):
+    """Return an interval given as timedelta or seconds in seconds."""
+    if isinstance(interval, timedelta):
+        return interval.total_seconds()
+    return float(interval)
+
+def _poll_bounds(domain_config):
+    """Return the shortest and longest per-device poll interval in seconds."""
+    scan_interval = _seconds(domain_config["scan_interval"])
+    min_interval = domain_config.get(CONF_MIN_POLL_INTERVAL)
+    max_interval = domain_config.get(CONF_MAX_POLL_INTERVAL)
+    return (
+        _seconds(min_interval) if min_interval else scan_interval,
+        # Intervals only grow past scan_interval when a maximum is set
+        _seconds(max_interval) if max_interval else scan_interval,
+    )
 
 async def _async_setup(
     hass,
     domain_config,
-    async_add_entities
+    async_add_entities,
+    entry=None
 ) -> None:
     """Set up the Tuya sensor."""
-    try:
-        from tuya_connector import TuyaOpenAPI, TUYA_LOGGER
-    except ImportError:
-        _LOGGER.error("Failed to import tuya_connector. Make sure it's installed.")
-        return
-
-    # Set up logging for tuya_connector
-    TUYA_LOGGER.setLevel(logging.INFO)
-    
+    async_on_unload = entry.async_on_unload if entry is not None else None
     api_key = domain_config["api_key"]
-    api_secret = domain_config["api_secret"]
     device_ids = domain_config["device_ids"]
     include_sensors = domain_config.get("include_sensors", [])
     exclude_sensors = domain_config.get("exclude_sensors", [])
-    region = domain_config["region"]
     scan_interval = domain_config["scan_interval"]
+    concurrency = domain_config.get(CONF_DISCOVERY_CONCURRENCY, DEFAULT_DISCOVERY_CONCURRENCY)
+    push = domain_config.get(CONF_PUSH, False)
+    local_devices = {
+        local_device[CONF_DEVICE_ID]: local_device
+        for local_device in domain_config.get(CONF_LOCAL_DEVICES, [])
+    }
 
-    # Set appropriate endpoint based on region
-    endpoint = f"https://openapi.tuya{region}.com"
-
-    # Initialize API connection
-    tuya_api = TuyaOpenAPI(
-        access_id=api_key,
-        access_secret=api_secret,
-        endpoint=endpoint
-    )
+    # Config entries using the same API key and region share one session
+    session = async_acquire_session(hass, domain_config)
+    if async_on_unload is not None:
+        async_on_unload(lambda: async_release_session(hass, session))
+    tuya_api = session.client
     
     try:
-        # Get access token
-        response = await hass.async_add_executor_job(tuya_api.connect)
+        # Get access token, unless the session already holds one
+        response = await session.async_connect()
         
         if not response.get("success", False):
             _LOGGER.error("Failed to get access token: %s", response)
             return
 
+        # One coordinator polls the status of all devices in batches
+        account_coordinator = TuyaAccountCoordinator(
+            hass,
+            _LOGGER,
+            tuya_api,
+            scan_interval,
+            DEFAULT_RECONCILE_INTERVAL if push else None,
+            TuyaLocalPool(hass) if local_devices else None,
+            TuyaPollPlanner(
+                *_poll_bounds(domain_config),
+                domain_config.get(CONF_REQUESTS_PER_MINUTE, DEFAULT_REQUESTS_PER_MINUTE),
+                BATCH_STATUS_LIMIT,
+                domain_config.get(CONF_POLL_JITTER, DEFAULT_POLL_JITTER),
+            )
+        )
+        if async_on_unload is not None:
+            async_on_unload(
+                lambda: hass.async_create_task(account_coordinator.async_shutdown())
+            )
+        if local_devices and async_on_unload is not None:
+            async_on_unload(
+                lambda: hass.async_create_task(account_coordinator.local_pool.async_close())
+            )
+
+        # In push mode status reports arrive from the message queue and
+        # polling only reconciles while the queue is connected
+        if push:
+            session.async_enable_push(domain_config.get(CONF_PUSH_ENDPOINT))
+            unsub_push_state = async_dispatcher_connect(
+                hass,
+                SIGNAL_PUSH_STATE.format(api_key),
+                account_coordinator.async_set_push_connected,
+            )
+            if async_on_unload is not None:
+                async_on_unload(unsub_push_state)
+            account_coordinator.async_set_push_connected(session.push.connected)
+
+        cache = TuyaDeviceCache(hass, api_key)
+        await cache.async_load()
+
+        classifier = await async_load_classifier(hass, domain_config.get(CONF_SENSOR_TYPES_FILE))
+
+        manager = TuyaSensorManager(
+            hass,
+            tuya_api,
+            account_coordinator,
+            cache,
+            classifier,
+            async_add_entities,
+            include_sensors,
+            exclude_sensors,
+            concurrency,
+            local_devices,
+            domain_config.get(CONF_CATEGORIES, []),
+            domain_config.get(CONF_ROLLING_SENSORS, []),
+            domain_config.get(CONF_ROLLING_WINDOWS, DEFAULT_ROLLING_WINDOWS),
+            domain_config.get(CONF_ROLLING_STATISTICS, ROLLING_STATISTICS),
+        )
+
+        if domain_config.get(CONF_DIAGNOSTIC_SENSORS, False):
+            async_add_entities(
+                [
+                    TuyaDiagnosticSensor(account_coordinator, api_key, key)
+                    for key in DIAGNOSTIC_SENSOR_TYPES
+                ]
+            )
+
+        # Statistics missed while Home Assistant or Tuya was unreachable
+        if domain_config.get(CONF_BACKFILL, False):
+            backfill = TuyaStatisticsBackfill(hass, tuya_api, manager)
+            backfill.async_start()
+            if async_on_unload is not None:
+                async_on_unload(backfill.async_stop)
+
+        # Options changes are applied to the running manager of the entry
+        if entry is not None:
+            managers = hass.data[DOMAIN].setdefault(MANAGERS, {})
+            managers[entry.entry_id] = manager
+            async_on_unload(lambda: managers.pop(entry.entry_id, None))
+
+        # Build entities from cached metadata right away and revalidate them
+        # against the cloud in the background
+        if manager.async_add_cached_devices(device_ids or cache.device_ids):
+            if entry is not None:
+                # Cancelled when the entry unloads, before its session is released
+                entry.async_create_background_task(
+                    hass, manager.async_discover_all(device_ids), "tuya_sensors revalidation"
+                )
+            else:
+                # YAML setups are never unloaded, so stop revalidating on shutdown
+                revalidation = hass.async_create_background_task(
+                    manager.async_discover_all(device_ids), "tuya_sensors revalidation"
+                )
+
+                @callback
+                def cancel_revalidation(_event):
+                    revalidation.cancel()
+
+                hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, cancel_revalidation)
+        else:
+            await manager.async_discover_all(device_ids)
+            
+    except Exception as e:
+        _LOGGER.error("Error setting up Tuya sensors integration: %s", str(e))
+
+
+class TuyaSensorManager:
+    """Discover Tuya devices and keep their sensor entities in sync."""
+
+    def __init__(
+        self,
+        hass,
+        tuya_api,
+        account_coordinator,
+        cache,
+        classifier,
+        async_add_entities,
+        include_sensors,
+        exclude_sensors,
+        concurrency,
+        local_devices,
+        categories,
+        rolling_sensors=(),
+        rolling_windows=(),
+        rolling_statistics=()
+    ):
+        """Initialize the manager."""
+        self.hass = hass
+        self._tuya_api = tuya_api
+        self._account_coordinator = account_coordinator
+        self._cache = cache
+        self._classifier = classifier
+        self._async_add_entities = async_add_entities
+        self._include_sensors = include_sensors
+        self._exclude_sensors = exclude_sensors
+        self._discovery_semaphore = asyncio.Semaphore(concurrency)
+        self._local_devices = local_devices
+        self._categories = categories
+        self._rolling_sensors = rolling_sensors
+        self._rolling_windows = rolling_windows
+        self._rolling_statistics = rolling_statistics
+
+        self._device_ids = None
+
+        # Device ID to {"coordinator", "name", "descriptors", "entities", "derived", "source"}
+        self.devices = {}
+
+        # Product ID to {"spec_map", "descriptors"} shared by its devices
+        self._products = {}
+        self._spec_requests = {}
+        self._dp_maps = {}
+
+    @callback
+    def async_add_cached_devices(self, device_ids):
+        """Create entities from the cache and return how many were added."""
         sensor_entities = []
-        all_devices = []
-        
+        for device_id in device_ids:
+            cached = self._cache.get(device_id)
+            if cached is None:
+                continue
+            sensor_entities.extend(
+                self._async_update_device(
+                    device_id, cached["info"], cached["specs"], cached["status"]
+                )
+            )
+
+        if sensor_entities:
+            _LOGGER.info("Restored %d Tuya sensors from cache", len(sensor_entities))
+            self._async_add_entities(sensor_entities)
+        return len(sensor_entities)
+
+    @property
+    def account_coordinator(self):
+        """Return the coordinator polling the devices of the account."""
+        return self._account_coordinator
+
+    async def async_apply_options(self, domain_config):
+        """Apply changed options to the running devices and entities.
+
+        Only the entities affected by filter changes are added or removed,
+        only added or removed devices are discovered or torn down, and the
+        poll intervals are retuned in place.
+        """
+        include_sensors = domain_config.get(CONF_INCLUDE_SENSORS, [])
+        exclude_sensors = domain_config.get(CONF_EXCLUDE_SENSORS, [])
+        if (include_sensors, exclude_sensors) != (self._include_sensors, self._exclude_sensors):
+            self._include_sensors = include_sensors
+            self._exclude_sensors = exclude_sensors
+            sensor_entities = []
+            for device_id, device in list(self.devices.items()):
+                sensor_entities.extend(self._async_update_device(device_id, *device["source"]))
+            if sensor_entities:
+                self._async_add_entities(sensor_entities)
+
+        self._account_coordinator.async_set_poll_interval(
+            domain_config["scan_interval"], *_poll_bounds(domain_config)
+        )
+
+        device_ids = domain_config.get(CONF_DEVICE_IDS, [])
+        if device_ids == self._device_ids:
+            return
+
+        if not device_ids:
+            await self.async_discover_all(device_ids)
+            return
+
+        self._device_ids = device_ids
+        for device_id in set(self.devices) - set(device_ids):
+            self.async_remove_device(device_id)
+        sensor_count = await self.async_discover(
+            [(device_id, None) for device_id in device_ids if device_id not in self.devices]
+        )
+        if sensor_count:
+            _LOGGER.info("Found %d new Tuya sensors", sensor_count)
+
+    async def async_discover_all(self, device_ids):
+        """Discover the given devices, or all devices of the account."""
+        self._device_ids = device_ids
+
         # If specific device IDs are provided, use them
         if device_ids:
-            for device_id in device_ids:
-                try:
-                    # Get device info
-                    response = await hass.async_add_executor_job(
-                        tuya_api.get, f"/v1.0/devices/{device_id}"
-                    )
-                    
-                    if not response.get("success", False):
-                        _LOGGER.error("Failed to get device info for %s: %s", device_id, response)
-                        continue
-                    
-                    device_info = response.get("result", {})
-                    all_devices.append(device_info)
-                except Exception as e:
-                    _LOGGER.error("Error processing device %s: %s", device_id, str(e))
+            devices = [(device_id, None) for device_id in device_ids]
+            sensor_count = await self.async_discover(devices)
         else:
             # If no specific devices are provided, discover all devices
-            response = await hass.async_add_executor_job(tuya_api.get, "/v1.0/devices")
-            
-            if not response.get("success", False):
-                _LOGGER.error("Failed to get devices: %s", response)
-                return
-                
-            all_devices = response.get("result", [])
-            
-        # Process each device to discover sensors
-        for device in all_devices:
-            device_id = device.get("id")
-            device_name = device.get("name", f"Device {device_id}")
+            sensor_count = await self._async_discover_account()
 
-            # Create a coordinator for this device
-            coordinator = TuyaDataCoordinator(
-                hass,
-                _LOGGER,
-                tuya_api,
-                device_id,
-                scan_interval
-            )
-            
-            try:
-                # Get device status to see what sensors are available
-                status_response = await hass.async_add_executor_job(
-                    tuya_api.get, f"/v1.0/devices/{device_id}/status"
+        if sensor_count:
+            _LOGGER.info("Found %d new Tuya sensors", sensor_count)
+        elif not self.devices:
+            _LOGGER.warning("No compatible sensors found in your Tuya account")
+
+    async def _async_discover_account(self):
+        """Page through the devices of the account and return the number of new sensors.
+
+        Each page is discovered while the next one is fetched, so entities
+        are added as pages arrive.
+        """
+        listed = set()
+        tasks = []
+        params = {"size": DEVICE_PAGE_SIZE}
+        if self._categories:
+            params["category"] = ",".join(self._categories)
+
+        try:
+            while True:
+                response = await self._tuya_api.get(
+                    DEVICE_LIST_PATH, params, priority=PRIORITY_DISCOVERY
+                )
+                if not response.get("success", False):
+                    _LOGGER.error("Failed to get devices: %s", response)
+                    break
+
+                result = response.get("result", {})
+                devices = [
+                    (device.get("id"), device)
+                    for device in result.get("devices", [])
+                    if not self._categories or device.get("category") in self._categories
+                ]
+                listed.update(device_id for device_id, _ in devices)
+                if devices:
+                    tasks.append(asyncio.ensure_future(self.async_discover(devices)))
+
+                if not result.get("has_more") or not result.get("last_row_key"):
+                    # Drop devices that are no longer part of the account
+                    for device_id in set(self.devices) - listed:
+                        self.async_remove_device(device_id)
+                    break
+                params["last_row_key"] = result["last_row_key"]
+
+            return sum(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def async_discover(self, devices):
+        """Discover devices concurrently and return the number of new sensors."""
+        # Limit the number of devices being discovered at the same time
+        semaphore = self._discovery_semaphore
+
+        async def discover(device_id, device_info):
+            async with semaphore:
+                return await self._async_discover_device(device_id, device_info)
+
+        tasks = [
+            asyncio.ensure_future(discover(device_id, device_info))
+            for device_id, device_info in devices
+        ]
+        sensor_count = 0
+        pending_entities = []
+
+        try:
+            # Add entities in batches as devices finish discovery
+            for next_done in asyncio.as_completed(tasks):
+                pending_entities.extend(await next_done)
+                if len(pending_entities) >= ENTITY_BATCH_SIZE:
+                    sensor_count += len(pending_entities)
+                    self._async_add_entities(pending_entities)
+                    pending_entities = []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if pending_entities:
+            sensor_count += len(pending_entities)
+            self._async_add_entities(pending_entities)
+
+        return sensor_count
+
+    async def _async_discover_device(self, device_id, device_info):
+        """Fetch the metadata of a device and return its new entities."""
+        tuya_api = self._tuya_api
+
+        try:
+            # Get device info unless it came with the device list
+            if device_info is None:
+                response = await tuya_api.get(
+                    f"/v1.0/devices/{device_id}", priority=PRIORITY_DISCOVERY
                 )
                 
+                if not response.get("success", False):
+                    _LOGGER.error("Failed to get device info for %s: %s", device_id, response)
+                    return []
+                
+                device_info = response.get("result", {})
+
+            device_id = device_info.get("id", device_id)
+
+            # Device details already carry the status that shows what sensors
+            # are available, so it is only fetched for devices listed without
+            status_data = device_info.get("status")
+            if status_data is None:
+                status_response = await tuya_api.get(
+                    f"/v1.0/devices/{device_id}/status", priority=PRIORITY_DISCOVERY
+                )
+
                 if not status_response.get("success", False):
                     _LOGGER.warning("Failed to get status for device %s: %s", device_id, status_response)
-                    continue
-                
+                    return []
+
                 status_data = status_response.get("result", [])
-                
-                # Get device specification for additional sensor metadata
-                specs_response = await hass.async_add_executor_job(
-                    tuya_api.get, f"/v1.0/devices/{device_id}/specifications"
-                )
-                
-                spec_data = {}
-                if specs_response.get("success", False):
-                    specs = specs_response.get("result", {})
-                    spec_data = specs.get("status", [])
-                
-                # Create a map of code to spec for easier lookup
-                spec_map = {item.get("code"): item for item in spec_data if "code" in item}
-                
-                # Process each sensor data point
-                for sensor_data in status_data:
-                    code = sensor_data.get("code")
-                    value = sensor_data.get("value")
-                    
-                    # Skip if code is None
-                    if code is None:
-                        continue
-                    
-                    # Check if this sensor should be included/excluded
-                    if include_sensors and code not in include_sensors:
-                        continue
-                    if code in exclude_sensors:
-                        continue
-                    
-                    # Get sensor type definition from our mapping
-                    sensor_type = SENSOR_TYPES.get(code)
-                    
-                    # If we don't have a predefined type, try to auto-detect
-                    if not sensor_type:
-                        sensor_type = auto_detect_sensor_type(code, value, spec_map.get(code, {}))
-                    
-                    # Skip if we still can't determine the sensor type
-                    if not sensor_type:
-                        _LOGGER.debug("Skipping unknown sensor type: %s with value %s", code, value)
-                        continue
-                    
-                    # Create sensor entity
-                    sensor_entity = TuyaSensor(
-                        coordinator=coordinator,
-                        device_name=device_name,
-                        code=code,
-                        name=sensor_type["name"],
-                        device_class=sensor_type["device_class"],
-                        unit=sensor_type["unit"],
-                        state_class=sensor_type["state_class"]
-                    )
-                    
-                    sensor_entities.append(sensor_entity)        
             
-            except Exception as e:
-                _LOGGER.error("Error discovering sensors for device %s: %s", device_id, str(e))
-        
-        # Add all discovered sensor entities
-        if sensor_entities:
-            _LOGGER.info("Found %d Tuya sensors", len(sensor_entities))
-            async_add_entities(sensor_entities, update_before_add=True)
+            # Get device specification for additional sensor metadata
+            spec_data = await self._async_get_specs(device_id, device_info.get("product_id"))
 
-        else:
-            _LOGGER.warning("No compatible sensors found in your Tuya account")
-            
-    except Exception as e:
-        _LOGGER.error("Error setting up Tuya sensors integration: %s", str(e))
+            if spec_data is None:
+                spec_data = []
+            else:
+                self._cache.async_set(device_id, device_info, spec_data, status_data)
 
+            if device_id in self._local_devices:
+                await self._async_setup_local(device_id, device_info)
 
-def auto_detect_sensor_type(code, value, spec_data):
-    """Try to auto-detect sensor type based on code, value and specifications."""
-    # Try to detect by code name patterns
-    if "temp" in code:
-        return {"name": "Temperature", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": SensorStateClass.MEASUREMENT}
-    elif "humidity" in code:
-        return {"name": "Humidity", "device_class": SensorDeviceClass.HUMIDITY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT}
-    elif "power" in code or "energy" in code or "electricity" in code:
-        if isinstance(value, (int, float)) and value > 1000:  # Likely energy counter
-            return {"name": "Energy", "device_class": SensorDeviceClass.ENERGY, "unit": UnitOfEnergy.KILO_WATT_HOUR, "state_class": SensorStateClass.TOTAL_INCREASING}
-        else:
-            return {"name": "Power", "device_class": SensorDeviceClass.POWER, "unit": UnitOfPower.WATT, "state_class": SensorStateClass.MEASUREMENT}
-    elif "voltage" in code:
-        return {"name": "Voltage", "device_class": SensorDeviceClass.VOLTAGE, "unit": UnitOfElectricPotential.VOLT, "state_class": SensorStateClass.MEASUREMENT}
-    elif "current" in code and not "power" in code:
-        return {"name": "Current", "device_class": SensorDeviceClass.CURRENT, "unit": UnitOfElectricCurrent.AMPERE, "state_class": SensorStateClass.MEASUREMENT}
-    elif "battery" in code:
-        return {"name": "Battery", "device_class": SensorDeviceClass.BATTERY, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT}
-    elif "co2" in code:
-        return {"name": "CO2", "device_class": SensorDeviceClass.CO2, "unit": "ppm", "state_class": SensorStateClass.MEASUREMENT}
-    elif "pm25" in code or "pm2_5" in code:
-        return {"name": "PM2.5", "device_class": SensorDeviceClass.PM25, "unit": "μg/m³", "state_class": SensorStateClass.MEASUREMENT}
-    
-    # Try to detect based on specification data
-    if spec_data:
-        if spec_data.get("type") == "Integer" or spec_data.get("type") == "Float":
-            # Try to determine unit and type from value range and step
-            value_min = spec_data.get("min", -1)
-            value_max = spec_data.get("max", -1)
-            
-            # Generic percentage sensor if range is 0-100
-            if value_min == 0 and value_max == 100:
-                return {"name": code.replace("_", " ").title(), "device_class": None, "unit": PERCENTAGE, "state_class": SensorStateClass.MEASUREMENT}
-    
-    # Default: create a generic sensor with the code as name
-    return {"name": code.replace("_", " ").title(), "device_class": None, "unit": None, "state_class": None}
+            sensor_entities = self._async_update_device(
+                device_id, device_info, spec_data, status_data
+            )
+            coordinator = self.devices[device_id]["coordinator"]
+            coordinator.async_set_status(status_data)
 
-class TuyaDataCoordinator(DataUpdateCoordinator):
-    """Class to manage fetching Tuya data."""
+            # Offline devices go unavailable and are only probed until they return
+            if "online" in device_info:
+                coordinator.async_set_online(bool(device_info["online"]))
+            return sensor_entities
 
-    def __init__(self, hass, logger, tuya_api, device_id, scan_interval):
-        """Initialize."""
+        except Exception as e:
+            _LOGGER.error("Error discovering sensors for device %s: %s", device_id, str(e))
+            return []
 
-        if isinstance(scan_interval, int):
-            scan_interval = timedelta(seconds=scan_interval)
+    async def _async_setup_local(self, device_id, device_info):
+        """Add a device to the local pool of the account coordinator."""
+        local_device = self._local_devices[device_id]
+        local_key = local_device.get(CONF_LOCAL_KEY) or device_info.get("local_key")
+        if not local_key:
+            _LOGGER.warning("No local key known for device %s, using the cloud", device_id)
+            return
 
-        super().__init__(
-            hass,
-            logger,
-            name=f"tuya_{device_id}",
-            update_interval=scan_interval,
+        dps = local_device.get(CONF_DPS)
+        if not dps:
+            dps = await self._async_get_dp_map(device_id, device_info.get("product_id"))
+        if not dps:
+            _LOGGER.warning("No data points known for device %s, using the cloud", device_id)
+            return
+
+        self._account_coordinator.local_pool.async_add_device(
+            device_id,
+            local_device[CONF_HOST],
+            local_key,
+            local_device.get(CONF_PROTOCOL_VERSION, "3.3"),
+            dps,
+            local_device.get(CONF_PORT, DEFAULT_LOCAL_PORT)
         )
-        self._tuya_api = tuya_api
-        self._device_id = device_id
 
-    async def _async_update_data(self):
-        """Fetch data from Tuya API."""
+    async def _async_get_dp_map(self, device_id, product_id):
+        """Return the data point ID to code map of a device, once per product."""
+        if product_id and product_id in self._dp_maps:
+            return self._dp_maps[product_id]
+
         try:
-            # Get device state from Tuya API
-            response = await self.hass.async_add_executor_job(
-                self._tuya_api.get, f"/v1.0/devices/{self._device_id}/status"
+            response = await self._tuya_api.get(
+                f"/v2.0/cloud/thing/{device_id}/model", priority=PRIORITY_DISCOVERY
             )
-            
             if not response.get("success", False):
-                raise UpdateFailed(f"Failed to get status for device {self._device_id}")
-                
-            return response.get("result", [])
+                _LOGGER.warning("Failed to get model of device %s: %s", device_id, response)
+                return None
+            model = json.loads(response.get("result", {}).get("model", "{}"))
+        except Exception as e:
+            _LOGGER.warning("Error getting model of device %s: %s", device_id, str(e))
+            return None
+
+        dps = {
+            str(prop["abilityId"]): prop["code"]
+            for service in model.get("services", [])
+            for prop in service.get("properties", [])
+            if "abilityId" in prop and "code" in prop
+        }
+        if product_id:
+            self._dp_maps[product_id] = dps
+        return dps
+
+    async def _async_get_specs(self, device_id, product_id):
+        """Return the specification status list, fetched once per product.
+
+        Returns None if the specifications could not be fetched.
+        """
+        if not product_id:
+            return await self._async_fetch_specs(device_id)
+
+        # Devices of the same product share one request, even while in flight
+        fetch = self._spec_requests.get(product_id)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._async_fetch_specs(device_id))
+            self._spec_requests[product_id] = fetch
+            # Fresh specifications replace what was resolved from the cache
+            self._products.pop(product_id, None)
+
+        spec_data = await asyncio.shield(fetch)
+        if spec_data is None:
+            # Let the next device of this product try again
+            if self._spec_requests.get(product_id) is fetch:
+                del self._spec_requests[product_id]
+        return spec_data
+
+    async def _async_fetch_specs(self, device_id):
+        """Fetch the specification status list of a device, or None on failure."""
+        try:
+            response = await self._tuya_api.get(
+                f"/v1.0/devices/{device_id}/specifications", priority=PRIORITY_DISCOVERY
+            )
         except Exception as e:
-            raise UpdateFailed(f"Error communicating with Tuya API: {e}")
+            _LOGGER.warning("Error getting specifications for device %s: %s", device_id, str(e))
+            return None
+
+        if not response.get("success", False):
+            _LOGGER.warning("Failed to get specifications for device %s: %s", device_id, response)
+            return None
+        return response.get("result", {}).get("status", [])
+
+    @callback
+    def _async_update_device(self, device_id, device_info, spec_data, status_data):
+        """Sync the entities of a device with its metadata.
+
+        Entities whose sensor type or conversion plan changed are replaced,
+        entities for codes that are gone are removed, and the new entities
+        are returned so the caller can add them.
+        """
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = {
+                "coordinator": TuyaDataCoordinator(
+                    self.hass,
+                    _LOGGER,
+                    self._account_coordinator,
+                    device_id
+                ),
+                "name": None,
+                "descriptors": {},
+                "entities": {},
+                "derived": {},
+            }
+
+        device_name = device_info.get("name") or f"Device {device_id}"
+        descriptors = self._resolve_descriptors(
+            status_data, spec_data, device_info.get("product_id"), device_info.get("category")
+        )
+
+        # A new device name changes the name of every entity
+        if device_name != device["name"]:
+            device["descriptors"] = {}
+            device["name"] = device_name
+
+        coordinator = device["coordinator"]
+        for code in list(device["entities"]):
+            if descriptors.get(code) != device["descriptors"].get(code):
+                entity = device["entities"].pop(code)
+                coordinator.async_set_converter(code, None)
+                for derived in [entity, *device["derived"].pop(code, [])]:
+                    self.hass.async_create_task(
+                        _async_remove_entity(derived, forget=code not in descriptors)
+                    )
+
+        sensor_entities = []
+        for code, (sensor_type, plan) in descriptors.items():
+            if code in device["entities"]:
+                continue
+
+            # Values are converted in bulk when the coordinator builds a snapshot
+            coordinator.async_set_converter(code, None if plan is RAW_PLAN else plan)
+
+            # Create sensor entity
+            sensor_entity = TuyaSensor(
+                coordinator=coordinator,
+                device_name=device_name,
+                code=code,
+                name=sensor_type["name"],
+                device_class=sensor_type["device_class"],
+                unit=plan.resolve_unit(sensor_type["device_class"], sensor_type["unit"]),
+                state_class=sensor_type["state_class"]
+            )
+            device["entities"][code] = sensor_entity
+            sensor_entities.append(sensor_entity)
+
+            if code in self._rolling_sensors:
+                derived = self._rolling_entities(
+                    coordinator, device_name, code, sensor_type, sensor_entity.native_unit_of_measurement
+                )
+                device["derived"][code] = derived
+                sensor_entities.extend(derived)
+
+        device["descriptors"] = descriptors
+        device["source"] = (device_info, spec_data, status_data)
+        return sensor_entities
+
+    @callback
+    def async_remove_device(self, device_id):
+        """Remove all entities of a device and forget it."""
+        device = self.devices.pop(device_id, None)
+        if device is None:
+            return
+
+        for entity in device["entities"].values():
+            self.hass.async_create_task(_async_remove_entity(entity, forget=True))
+        for derived in device["derived"].values():
+            for entity in derived:
+                self.hass.async_create_task(_async_remove_entity(entity, forget=True))
+        self._cache.async_remove(device_id)
+
+    def _rolling_entities(self, coordinator, device_name, code, sensor_type, unit):
+        """Return the entities derived from the rolling aggregates of a numeric sensor."""
+        if sensor_type["state_class"] != SensorStateClass.MEASUREMENT:
+            return []
+
+        name = sensor_type["name"]
+        device_class = sensor_type["device_class"]
+        windows = [minutes * 60 for minutes in self._rolling_windows]
+        derived = []
+        for statistic in self._rolling_statistics:
+            if statistic == "energy":
+                if device_class == SensorDeviceClass.POWER and unit in ENERGY_FACTORS:
+                    derived.append(
+                        TuyaRollingSensor(
+                            coordinator, device_name, code, f"{name} Energy", windows,
+                            statistic, None, SensorDeviceClass.ENERGY,
+                            UnitOfEnergy.KILO_WATT_HOUR, SensorStateClass.TOTAL_INCREASING,
+                            ENERGY_FACTORS[unit],
+                        )
+                    )
+                continue
+
+            rate = statistic == "rate"
+            for minutes in self._rolling_windows:
+                derived.append(
+                    TuyaRollingSensor(
+                        coordinator, device_name, code,
+                        f"{name} {minutes} min {ROLLING_SENSOR_TYPES[statistic]['name']}", windows,
+                        statistic, minutes * 60,
+                        None if rate else device_class,
+                        f"{unit}/h" if rate and unit else unit,
+                        SensorStateClass.MEASUREMENT,
+                    )
+                )
+        return derived
+
+    def _resolve_descriptors(self, status_data, spec_data, product_id, category=None):
+        """Return the sensor type and conversion plan of every included code.
 
-class TuyaSensor(SensorEntity):
-    """Representation of a Tuya Sensor."""
+        Both are resolved once per product and code, and shared by all
+        devices of the same product.
+        """
+        product = self._products.get(product_id) if product_id else None
+        if product is None:
+            product = {
+                # Create a map of code to spec for easier lookup
+                "spec_map": {item.get("code"): item for item in spec_data if "code" in item},
+                "descriptors": {},
+            }
+            if product_id:
+                self._products[product_id] = product
+
+        spec_map = product["spec_map"]
+        product_descriptors = product["descriptors"]
+        descriptors = {}
+        
+        # Process each sensor data point
+        for sensor_data in status_data:
+            code = sensor_data.get("code")
+            value = sensor_data.get("value")
+            
+            # Skip if code is None
+            if code is None:
+                continue
+            
+            # Check if this sensor should be included/excluded
+            if self._include_sensors and code not in self._include_sensors:
+                continue
+            if code in self._exclude_sensors:
+                continue
+            
+            if code in product_descriptors:
+                descriptor = product_descriptors[code]
+            else:
+                sensor_type = self._classifier.classify(code, spec_map.get(code), category)
+
+                descriptor = None
+                if sensor_type:
+                    plan = build_conversion_plan(spec_map.get(code), sensor_type["device_class"])
+                    descriptor = (sensor_type, plan)
+                product_descriptors[code] = descriptor
+            
+            # Skip if we still can't determine the sensor type
+            if not descriptor:
+                _LOGGER.debug("Skipping unknown sensor type: %s with value %s", code, value)
+                continue
+
+            descriptors[code] = descriptor
+
+        return descriptors
+
+
+async def _async_remove_entity(entity, forget):
+    """Remove an entity, and its registry entry as well if forget is set."""
+    if entity.hass is None:
+        return
+
+    if forget and entity.registry_entry is not None:
+        # Removing the registry entry also removes the entity
+        er.async_get(entity.hass).async_remove(entity.entity_id)
+    else:
+        await entity.async_remove(force_remove=True)
+
+
+class TuyaSensor(RestoreSensor):
+    """Representation of a Tuya Sensor.
+
+    Until its coordinator has data, the sensor shows the value it had
+    before Home Assistant restarted.
+    """
+
+    # State is pushed by the coordinators, entities never poll on their own
+    _attr_should_poll = False
     
     def __init__(self, coordinator, device_name, code, name, device_class, unit, state_class):
         """Initialize the sensor."""
@@ -341,26 +840,26 @@ class TuyaSensor(SensorEntity):
         self._attr_state_class = state_class
         self._attr_native_unit_of_measurement = unit
         self._attr_unique_id = f"tuya_{self._device_id}_{code}"
+        self._restored_value = None
         
     @property
     def name(self):
         """Return the name of the sensor."""
         return self._name
+
+    @property
+    def code(self):
+        """Return the Tuya status code of the sensor."""
+        return self._code
         
     @property
     def native_value(self):
         """Return the state of the sensor."""
         if not self.coordinator.data:
-            return None
+            return self._restored_value
             
-        # Extract value for this specific sensor
-        for state in self.coordinator.data:
-            if state.get("code") == self._code:
-                if self._attr_device_class == SensorDeviceClass.TEMPERATURE:
-                    return int(state.get("value")) / 10
-                else:
-                    return state.get("value")
-        return None
+        # Values are converted by the coordinator when the snapshot is built
+        return self.coordinator.data.get(self._code)
         
     @property
     def available(self):
@@ -377,11 +876,129 @@ class TuyaSensor(SensorEntity):
         }
         
     async def async_added_to_hass(self):
-        """Connect to dispatcher listening for entity data notifications."""
+        """Restore the last known value and listen for changes of the code."""
+        await super().async_added_to_hass()
+        if self.coordinator.data is None:
+            last_sensor_data = await self.async_get_last_sensor_data()
+            if last_sensor_data is not None:
+                self._restored_value = last_sensor_data.native_value
+
         self.async_on_remove(
-            self.coordinator.async_add_listener(self.async_write_ha_state)
+            self.coordinator.async_add_code_listener(self._code, self.async_write_ha_state)
         )
         
     async def async_update(self):
-        """Update entity."""
-        await self.coordinator.async_request_refresh()
\ No newline at end of file
+        """Update entity when an update is requested explicitly."""
+        await self.coordinator.async_request_refresh()
+
+
+class TuyaDiagnosticSensor(SensorEntity):
+    """Instrumentation of the polling of one account as a diagnostic sensor."""
+
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, account_coordinator, api_key, key):
+        """Initialize the sensor."""
+        self.coordinator = account_coordinator
+        sensor_type = DIAGNOSTIC_SENSOR_TYPES[key]
+        self._value = sensor_type["value"]
+        self._attr_name = f"Tuya Cloud {sensor_type['name']}"
+        self._attr_device_class = sensor_type["device_class"]
+        self._attr_state_class = sensor_type["state_class"]
+        self._attr_native_unit_of_measurement = sensor_type["unit"]
+        self._attr_unique_id = f"tuya_{api_key}_{key}"
+
+    @property
+    def native_value(self):
+        """Return the current value."""
+        return self._value(self.coordinator)
+
+    async def async_added_to_hass(self):
+        """Update after every account poll."""
+        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
+
+
+class TuyaRollingSensor(RestoreSensor):
+    """A statistic of the recent values of a Tuya sensor.
+
+    Rolling statistics are computed from the aggregates the coordinator
+    keeps as snapshots arrive. Energy is integrated from power since the
+    sensor was added, on top of its value before Home Assistant restarted.
+    """
+
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        coordinator,
+        device_name,
+        code,
+        name,
+        windows,
+        statistic,
+        window,
+        device_class,
+        unit,
+        state_class,
+        factor=1,
+    ):
+        """Initialize the sensor."""
+        self.coordinator = coordinator
+        self._device_id = coordinator.device_id
+        self._code = code
+        self._windows = windows
+        self._statistic = statistic
+        self._window = window
+        self._factor = factor
+        self._offset = 0.0
+        self._written = None
+
+        self._attr_name = f"{device_name} {name}"
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+        self._attr_native_unit_of_measurement = unit
+        suffix = statistic if window is None else f"{statistic}_{window // 60}m"
+        self._attr_unique_id = f"tuya_{self._device_id}_{code}_{suffix}"
+
+    @property
+    def native_value(self):
+        """Return the statistic over the window."""
+        buffer = self.coordinator.rolling_buffer(self._code)
+        if self._statistic == "energy":
+            integral = buffer.integral if buffer is not None else 0.0
+            return round(self._offset + integral * self._factor, 3)
+        if buffer is None or not len(buffer):
+            return None
+        value = ROLLING_SENSOR_TYPES[self._statistic]["value"](buffer, self._window)
+        return None if value is None else round(value, 3)
+
+    @property
+    def available(self):
+        """Return True if entity is available."""
+        return self.coordinator.last_update_success
+
+    async def async_added_to_hass(self):
+        """Restore integrated energy and listen for new samples."""
+        await super().async_added_to_hass()
+        if self._statistic == "energy":
+            last_sensor_data = await self.async_get_last_sensor_data()
+            if last_sensor_data is not None and last_sensor_data.native_value is not None:
+                try:
+                    self._offset = float(last_sensor_data.native_value)
+                except (TypeError, ValueError):
+                    pass
+
+        self.async_on_remove(
+            self.coordinator.async_add_rolling_listener(
+                self._code, self._windows, self._handle_sample
+            )
+        )
+
+    @callback
+    def _handle_sample(self):
+        """Write the state when the statistic or the availability changed."""
+        written = (self.native_value, self.available)
+        if written != self._written:
+            self._written = written
+            self.async_write_ha_state()
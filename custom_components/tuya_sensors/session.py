@@ -0,0 +1,200 @@
+"""Authenticated Tuya sessions shared between config entries."""
+import asyncio
+import logging
+import time
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_call_later
+
+from . import (
+    DOMAIN,
+    CONF_API_ENDPOINT,
+    CONF_CAPTURE_FILE,
+    CONF_MAX_CONCURRENT_REQUESTS,
+    CONF_REQUESTS_PER_DAY,
+    CONF_REQUESTS_PER_SECOND,
+    CONF_REPLAY_FILE,
+    CONF_REPLAY_SPEED,
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_REQUESTS_PER_DAY,
+    DEFAULT_REQUESTS_PER_SECOND,
+    DEFAULT_REPLAY_SPEED,
+)
+from .api import TuyaOpenAPIClient
+from .capture import TuyaCaptureRecorder, TuyaReplayTransport
+from .push import PUSH_ENDPOINTS, PulsarWebsocketTransport, TuyaPushClient
+from .scheduler import TuyaRequestScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+SESSIONS = "sessions"
+
+# Refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_RETRY_DELAY = 60
+
+
+class TuyaSession:
+    """Client and request scheduler for one API key in one region.
+
+    The session keeps its access token fresh in the background so that
+    polls never have to wait for a re-authentication. It also owns the
+    message queue subscription of the account when push mode is used.
+    """
+
+    def __init__(self, hass, client, scheduler, region, access_secret):
+        """Initialize the session."""
+        self.hass = hass
+        self.client = client
+        self.scheduler = scheduler
+        self.push = None
+        self.users = 0
+        self._region = region
+        self._access_secret = access_secret
+        self._connect_lock = asyncio.Lock()
+        self._unsub_refresh = None
+        self._unsub_stop = None
+        if client.transport is not None:
+            # YAML setups never release their session, so write what a
+            # capture still buffers when Home Assistant stops
+            self._unsub_stop = hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STOP, self._async_stop
+            )
+
+    async def async_connect(self):
+        """Get an access token unless the session already holds a valid one."""
+        async with self._connect_lock:
+            if self.client.token_valid:
+                return {"success": True}
+
+            response = await self.client.connect()
+            if response.get("success", False):
+                self._schedule_refresh()
+            return response
+
+    @callback
+    def async_enable_push(self, endpoint=None):
+        """Start consuming the message queue of the account, once."""
+        if self.push is not None:
+            return
+
+        transport = PulsarWebsocketTransport(
+            async_get_clientsession(self.hass),
+            endpoint or PUSH_ENDPOINTS.get(self._region, PUSH_ENDPOINTS["us"]),
+            self.client.access_id,
+            self._access_secret,
+        )
+        self.push = TuyaPushClient(
+            self.hass, self.client.access_id, self._access_secret, transport
+        )
+        self.push.async_start()
+
+    @callback
+    def _schedule_refresh(self, delay=None):
+        """Schedule the next background token refresh."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+
+        if delay is None:
+            expires_in = self.client.token_expire_time / 1000 - time.time()
+            delay = max(expires_in - TOKEN_REFRESH_MARGIN, TOKEN_RETRY_DELAY)
+        self._unsub_refresh = async_call_later(self.hass, delay, self._async_refresh)
+
+    async def _async_refresh(self, _now):
+        """Refresh the access token ahead of its expiry."""
+        self._unsub_refresh = None
+        try:
+            response = await self.client.refresh_token()
+        except Exception as e:
+            response = {"success": False, "msg": str(e)}
+
+        if response.get("success", False):
+            _LOGGER.debug("Refreshed Tuya access token")
+            self._schedule_refresh()
+        else:
+            _LOGGER.warning("Failed to refresh Tuya access token: %s", response)
+            self._schedule_refresh(TOKEN_RETRY_DELAY)
+
+    async def _async_stop(self, _event):
+        """Close the transport when Home Assistant stops."""
+        self._unsub_stop = None
+        await self.client.transport.async_close()
+
+    @callback
+    def async_close(self):
+        """Stop refreshing the token and shut the scheduler down."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+            self._unsub_refresh = None
+        if self._unsub_stop is not None:
+            self._unsub_stop()
+            self._unsub_stop = None
+        self.scheduler.async_shutdown()
+        if self.client.transport is not None:
+            self.hass.async_create_task(self.client.transport.async_close())
+        if self.push is not None:
+            self.hass.async_create_task(self.push.async_stop())
+            self.push = None
+
+
+@callback
+def async_acquire_session(hass, domain_config):
+    """Return the shared session for the configured credentials and register a user.
+
+    The request limits of the first user of a session apply to all of them.
+    """
+    api_key = domain_config["api_key"]
+    region = domain_config["region"]
+    sessions = hass.data.setdefault(DOMAIN, {}).setdefault(SESSIONS, {})
+
+    session = sessions.get((api_key, region))
+    if session is None:
+        scheduler = TuyaRequestScheduler(
+            hass,
+            domain_config.get(CONF_REQUESTS_PER_SECOND, DEFAULT_REQUESTS_PER_SECOND),
+            domain_config.get(CONF_REQUESTS_PER_DAY, DEFAULT_REQUESTS_PER_DAY),
+            domain_config.get(CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS),
+        )
+        client = TuyaOpenAPIClient(
+            async_get_clientsession(hass),
+            access_id=api_key,
+            access_secret=domain_config["api_secret"],
+            endpoint=domain_config.get(CONF_API_ENDPOINT) or f"https://openapi.tuya{region}.com",
+            scheduler=scheduler,
+            transport=_transport(hass, domain_config),
+        )
+        session = sessions[(api_key, region)] = TuyaSession(
+            hass, client, scheduler, region, domain_config["api_secret"]
+        )
+
+    session.users += 1
+    return session
+
+
+def _transport(hass, domain_config):
+    """Return the transport to replay or record requests with, or None."""
+    if domain_config.get(CONF_REPLAY_FILE):
+        return TuyaReplayTransport(
+            hass,
+            hass.config.path(domain_config[CONF_REPLAY_FILE]),
+            domain_config.get(CONF_REPLAY_SPEED, DEFAULT_REPLAY_SPEED),
+        )
+    if domain_config.get(CONF_CAPTURE_FILE):
+        return TuyaCaptureRecorder(hass, hass.config.path(domain_config[CONF_CAPTURE_FILE]))
+    return None
+
+
+@callback
+def async_release_session(hass, session):
+    """Unregister a user of a session and close it when it was the last one."""
+    session.users -= 1
+    if session.users > 0:
+        return
+
+    sessions = hass.data.get(DOMAIN, {}).get(SESSIONS, {})
+    for key, value in list(sessions.items()):
+        if value is session:
+            del sessions[key]
+    session.async_close()
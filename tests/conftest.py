@@ -0,0 +1,14 @@
+"""Fixtures for the Tuya Sensors tests."""
+import os
+import sys
+
+import pytest
+
+# The fakes of the benchmarks double as test servers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks"))
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components."""
+    yield
@@ -0,0 +1,172 @@
+"""Tests for the local protocol, driven by the fake devices of the benchmarks."""
+import asyncio
+import binascii
+import hashlib
+import hmac
+import struct
+
+import pytest
+
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from custom_components.tuya_sensors.local import (
+    DP_QUERY,
+    DP_QUERY_NEW,
+    HEADER,
+    PREFIX,
+    SUFFIX_BYTES,
+    TuyaLocalDevice,
+    TuyaLocalError,
+    TuyaLocalPool,
+    _aes_encrypt,
+)
+from custom_components.tuya_sensors.push import SIGNAL_DEVICE_STATUS
+
+from fake_device import FakeTuyaDevice
+
+pytestmark = pytest.mark.usefixtures("socket_enabled")
+
+DEVICE_ID = "device1"
+LOCAL_KEY = "0123456789abcdef"
+WRONG_KEY = "fedcba9876543210"
+DPS = {"1": "temp_current", "2": "humidity_value"}
+
+
+@pytest.fixture(params=["3.3", "3.4"])
+async def fake_device(request):
+    """Serve a fake device of each protocol version."""
+    device = FakeTuyaDevice(
+        DEVICE_ID, LOCAL_KEY, lambda: {"1": 215, "2": 48, "9": 0}, request.param
+    )
+    device.port = await device.start()
+    yield device
+    await device.stop()
+
+
+async def test_status(hass, fake_device):
+    """A status query returns the known data points with their codes."""
+    device = TuyaLocalDevice(
+        hass, DEVICE_ID, "127.0.0.1", LOCAL_KEY, fake_device.version, fake_device.port, DPS
+    )
+    try:
+        assert await device.async_status() == [
+            {"code": "temp_current", "value": 215},
+            {"code": "humidity_value", "value": 48},
+        ]
+        assert await device.async_status()
+    finally:
+        await device.async_close()
+
+    assert fake_device.calls["connections"] == 1
+    assert fake_device.calls["queries"] == 2
+    assert fake_device.calls["handshakes"] == (1 if fake_device.version == "3.4" else 0)
+    assert fake_device.calls["rejected_frames"] == 0
+
+
+async def test_status_report(hass, fake_device):
+    """Status reports sent by the device are dispatched."""
+    received = []
+    unsub = async_dispatcher_connect(
+        hass, SIGNAL_DEVICE_STATUS.format(DEVICE_ID), received.append
+    )
+    device = TuyaLocalDevice(
+        hass, DEVICE_ID, "127.0.0.1", LOCAL_KEY, fake_device.version, fake_device.port, DPS
+    )
+    try:
+        await device.async_status()
+        await fake_device.push_status({"1": 220})
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+
+        assert received == [[{"code": "temp_current", "value": 220}]]
+    finally:
+        await device.async_close()
+        unsub()
+
+
+async def test_wrong_key(hass, fake_device):
+    """A wrong local key fails the query and closes the connection."""
+    device = TuyaLocalDevice(
+        hass, DEVICE_ID, "127.0.0.1", WRONG_KEY, fake_device.version, fake_device.port, DPS
+    )
+    try:
+        with pytest.raises(TuyaLocalError):
+            await device.async_status()
+        assert not device.connected
+    finally:
+        await device.async_close()
+
+    assert fake_device.calls["queries"] == 0
+
+
+def _frame(version, key, command, payload, corrupt=False):
+    """Build a frame, with a broken CRC or HMAC if corrupt is set."""
+    payload = _aes_encrypt(key, payload)
+    check_size = 32 if version == "3.4" else 4
+    frame = HEADER.pack(PREFIX, 1, command, len(payload) + check_size + 4) + payload
+    if version == "3.4":
+        check = hmac.new(key, frame, hashlib.sha256).digest()
+    else:
+        check = struct.pack(">I", binascii.crc32(frame) & 0xFFFFFFFF)
+    if corrupt:
+        check = bytes([check[0] ^ 0xFF]) + check[1:]
+    return frame + check + SUFFIX_BYTES
+
+
+async def test_corrupt_frame_is_rejected(fake_device):
+    """A frame with a bad CRC or HMAC closes the connection."""
+    command = DP_QUERY_NEW if fake_device.version == "3.4" else DP_QUERY
+    reader, writer = await asyncio.open_connection("127.0.0.1", fake_device.port)
+    try:
+        writer.write(
+            _frame(fake_device.version, LOCAL_KEY.encode("latin1"), command, b"{}", True)
+        )
+        await writer.drain()
+
+        assert await asyncio.wait_for(reader.read(), 5) == b""
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    assert fake_device.calls["rejected_frames"] == 1
+    assert fake_device.last_error == (
+        "Invalid HMAC" if fake_device.version == "3.4" else "Invalid CRC"
+    )
+    assert fake_device.calls["queries"] == 0
+
+
+async def test_pool_replaces_connection_on_new_key(hass, fake_device):
+    """A changed local key replaces the connection, unchanged settings keep it."""
+    pool = TuyaLocalPool(hass)
+    version, port = fake_device.version, fake_device.port
+    try:
+        pool.async_add_device(DEVICE_ID, "127.0.0.1", WRONG_KEY, version, DPS, port)
+        with pytest.raises(TuyaLocalError):
+            await pool.async_status(DEVICE_ID)
+
+        pool.async_add_device(DEVICE_ID, "127.0.0.1", LOCAL_KEY, version, DPS, port)
+        assert await pool.async_status(DEVICE_ID)
+        device = pool._devices[DEVICE_ID]
+
+        pool.async_add_device(DEVICE_ID, "127.0.0.1", LOCAL_KEY, version, {"1": "temp"}, port)
+        assert pool._devices[DEVICE_ID] is device
+        assert await pool.async_status(DEVICE_ID) == [{"code": "temp", "value": 215}]
+        assert fake_device.calls["queries"] == 2
+    finally:
+        await pool.async_close()
+        await hass.async_block_till_done()
+
+
+async def test_pool_requires_known_data_points(hass, fake_device):
+    """A status without any known data points is an error."""
+    pool = TuyaLocalPool(hass)
+    pool.async_add_device(
+        DEVICE_ID, "127.0.0.1", LOCAL_KEY, fake_device.version, {"5": "unknown"}, fake_device.port
+    )
+    try:
+        with pytest.raises(TuyaLocalError):
+            await pool.async_status(DEVICE_ID)
+    finally:
+        await pool.async_close()
@@ -0,0 +1,61 @@
+"""Tests for the adaptive poll planner."""
+from custom_components.tuya_sensors.polling import MIN_TICK, TuyaPollPlanner
+
+BATCH_SIZE = 20
+
+
+def run(planner, device_ids, start, duration):
+    """Follow the planner's wake-ups and return the polls and batches made."""
+    polls = {device_id: [] for device_id in device_ids}
+    batches = []
+    now = start
+    while now < start + duration:
+        due = planner.due(device_ids, now=now)
+        lags = planner.as_dict(now)["devices"]
+        for device_id in due:
+            polls[device_id].append((now, lags[device_id]["lag"]))
+            planner.record(device_id, [{"code": "temp", "value": 1}], now=now)
+        if due:
+            batches.append(len(due))
+        now += planner.next_delay(now=now)
+    return polls, batches
+
+
+def test_sub_batch_fleet_polls_on_schedule():
+    """A fleet smaller than a batch is polled at its grid points, never held back."""
+    device_ids = [f"device{index}" for index in range(5)]
+    planner = TuyaPollPlanner(60, 60, batch_size=BATCH_SIZE)
+
+    polls, _batches = run(planner, device_ids, 1000.0, 3600)
+
+    for device_id, times in polls.items():
+        # The first poll of a new device is right away, then once a minute
+        assert 59 <= len(times) <= 61, device_id
+        assert max(lag for _time, lag in times) < MIN_TICK, device_id
+        gaps = [later - earlier for (earlier, _), (later, _) in zip(times, times[1:])]
+        assert all(60 - MIN_TICK < gap < 60 + MIN_TICK for gap in gaps[1:]), device_id
+
+
+def test_sub_batch_fleet_keeps_phases():
+    """Devices of a small fleet keep their own phases instead of polling together."""
+    device_ids = [f"device{index}" for index in range(5)]
+    planner = TuyaPollPlanner(60, 60, batch_size=BATCH_SIZE)
+
+    polls, _batches = run(planner, device_ids, 1000.0, 600)
+
+    last_polls = {round(times[-1][0]) for times in polls.values()}
+    assert len(last_polls) > 1
+
+
+def test_large_fleet_sends_full_batches():
+    """Partial batches of a large fleet wait for devices due soon."""
+    device_ids = [f"device{index}" for index in range(200)]
+    planner = TuyaPollPlanner(600, 600, batch_size=BATCH_SIZE)
+
+    polls, batches = run(planner, device_ids, 1000.0, 7200)
+
+    # Apart from the first poll of every device, batches are full
+    assert sum(batch % BATCH_SIZE == 0 for batch in batches[1:]) >= 0.9 * len(batches[1:])
+    hold = 0.25 * 600
+    for device_id, times in polls.items():
+        assert max(lag for _time, lag in times) <= hold + MIN_TICK, device_id
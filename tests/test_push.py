@@ -0,0 +1,133 @@
+"""Tests for push updates, driven by the fake message queue of the benchmarks."""
+import aiohttp
+import pytest
+
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from custom_components.tuya_sensors.push import (
+    SIGNAL_DEVICE_ONLINE,
+    SIGNAL_DEVICE_STATUS,
+    SIGNAL_PUSH_STATE,
+    PulsarWebsocketTransport,
+    TuyaMessageTransport,
+    TuyaPushClient,
+)
+
+from fake_broker import FakePulsarBroker
+
+pytestmark = pytest.mark.usefixtures("socket_enabled")
+
+ACCESS_ID = "test_access_id"
+ACCESS_SECRET = "test_secret_0123456789abcdef"
+
+
+async def start_client(hass, endpoint, access_secret=ACCESS_SECRET):
+    """Start a push client against an endpoint."""
+    transport = PulsarWebsocketTransport(
+        async_get_clientsession(hass), endpoint, ACCESS_ID, access_secret
+    )
+    client = TuyaPushClient(hass, ACCESS_ID, access_secret, transport)
+    client.async_start()
+    return client
+
+
+def collect(hass, signal):
+    """Return a list that receives the arguments sent with a signal."""
+    received = []
+    unsub = async_dispatcher_connect(hass, signal, lambda *args: received.append(args))
+    return received, unsub
+
+
+@pytest.mark.parametrize("encryption", ["aes_gcm", "aes_ecb"])
+async def test_status_round_trip(hass, encryption):
+    """Status reports are decrypted, dispatched and acknowledged."""
+    broker = FakePulsarBroker(ACCESS_ID, ACCESS_SECRET, encryption=encryption)
+    endpoint = await broker.start()
+    statuses, unsub_status = collect(hass, SIGNAL_DEVICE_STATUS.format("device1"))
+    states, unsub_state = collect(hass, SIGNAL_PUSH_STATE.format(ACCESS_ID))
+
+    client = await start_client(hass, endpoint)
+    try:
+        await broker.wait_connected()
+        await broker.publish_status("device1", [{"code": "temp_current", "value": 215}])
+        await broker.wait_acked(5)
+        await hass.async_block_till_done()
+
+        assert statuses == [([{"code": "temp_current", "value": 215}],)]
+        assert states == [(True,)]
+        assert client.connected
+        assert broker.calls["acked"] == 1
+    finally:
+        await client.async_stop()
+        await broker.stop()
+        unsub_status()
+        unsub_state()
+
+
+async def test_online_events(hass):
+    """Online and offline events are dispatched as booleans."""
+    broker = FakePulsarBroker(ACCESS_ID, ACCESS_SECRET)
+    endpoint = await broker.start()
+    events, unsub = collect(hass, SIGNAL_DEVICE_ONLINE.format("device1"))
+
+    client = await start_client(hass, endpoint)
+    try:
+        await broker.wait_connected()
+        await broker.publish_online("device1", False)
+        await broker.publish_online("device1", True)
+        await broker.wait_acked(5)
+        await hass.async_block_till_done()
+
+        assert events == [(False,), (True,)]
+    finally:
+        await client.async_stop()
+        await broker.stop()
+        unsub()
+
+
+async def test_messages_sent_before_connecting_are_redelivered(hass):
+    """Unacknowledged messages reach a consumer that connects later."""
+    broker = FakePulsarBroker(ACCESS_ID, ACCESS_SECRET)
+    endpoint = await broker.start()
+    statuses, unsub = collect(hass, SIGNAL_DEVICE_STATUS.format("device1"))
+    await broker.publish_status("device1", [{"code": "switch_1", "value": True}])
+
+    client = await start_client(hass, endpoint)
+    try:
+        await broker.wait_acked(5)
+        await hass.async_block_till_done()
+
+        assert statuses == [([{"code": "switch_1", "value": True}],)]
+    finally:
+        await client.async_stop()
+        await broker.stop()
+        unsub()
+
+
+async def test_wrong_credentials_are_rejected(hass):
+    """A consumer with the wrong secret cannot subscribe."""
+    broker = FakePulsarBroker(ACCESS_ID, ACCESS_SECRET)
+    endpoint = await broker.start()
+    transport = PulsarWebsocketTransport(
+        async_get_clientsession(hass), endpoint, ACCESS_ID, "wrong_secret_0123456789abcd"
+    )
+    try:
+        with pytest.raises(aiohttp.WSServerHandshakeError):
+            await transport.async_connect()
+        assert broker.calls["rejected"] == 1
+        assert broker.calls["connected"] == 0
+    finally:
+        await transport.async_close()
+        await broker.stop()
+
+
+def test_transport_is_abstract():
+    """Transports must implement every method."""
+
+    class Incomplete(TuyaMessageTransport):
+        async def async_connect(self):
+            """Open the connection."""
+
+    with pytest.raises(TypeError):
+        Incomplete()